@@ -1,13 +1,18 @@
 import copy
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from time import time
 
 import numpy as np
 from tqdm import tqdm
 
-
-import mapof.core.persistence.experiment_exports as exports
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.MatchingStore import MatchingStore
+from mapof.core.persistence.checkpoints import DistancesCheckpoint
+from mapof.core.persistence.distance_cache import DistanceCache
 from mapof.core.distances.inner_distances import (
     map_str_to_func,
+    set_jit_enabled,
     l1,
     l2,
     chebyshev,
@@ -17,17 +22,37 @@ from mapof.core.distances.inner_distances import (
     discrete,
     single_l1,
     hamming,
+    l1_batch,
+    l2_batch,
+    chebyshev_batch,
+    hellinger_batch,
+    emd_batch,
+    emdinf_batch,
+    emd_cost_table,
+    emdinf_cost_table,
+    pairwise_cost_table,
     vote_to_pote,
     swap_distance,
     swap_distance_between_potes,
+    swap_distance_between_potes_batch,
     spearman_distance_between_potes,
+    spearman_cost_table,
+    swap_cost_table,
+)
+from mapof.core.distances.landmarks import (
+    LandmarkDistances,
+    PairValues,
+    landmark_distances,
+    landmark_mds,
 )
+from mapof.core.distances.nearest_neighbors import nearest_neighbors, select_pivots
 
 __all__ = [
     "run_single_process",
     "run_multiple_processes",
     "extract_distance_id",
     "map_str_to_func",
+    "set_jit_enabled",
     "l1",
     "l2",
     "chebyshev",
@@ -37,10 +62,28 @@ __all__ = [
     "discrete",
     "single_l1",
     "hamming",
+    "l1_batch",
+    "l2_batch",
+    "chebyshev_batch",
+    "hellinger_batch",
+    "emd_batch",
+    "emdinf_batch",
+    "emd_cost_table",
+    "emdinf_cost_table",
+    "pairwise_cost_table",
     "vote_to_pote",
     "swap_distance",
     "swap_distance_between_potes",
+    "swap_distance_between_potes_batch",
     "spearman_distance_between_potes",
+    "spearman_cost_table",
+    "swap_cost_table",
+    "nearest_neighbors",
+    "select_pivots",
+    "LandmarkDistances",
+    "PairValues",
+    "landmark_distances",
+    "landmark_mds",
 ]
 
 
@@ -69,8 +112,100 @@ def extract_distance_id(distance_id: str) -> (callable, str):
     return inner_distance, main_distance
 
 
+def _compute_pair(
+    experiment,
+    instance_id_1,
+    instance_id_2,
+    copy_instances: bool = True,
+    check_mutations: bool = False,
+) -> tuple:
+    """Computes the distance (and matching, if any) for a single pair."""
+    instance_1 = experiment.instances[instance_id_1]
+    instance_2 = experiment.instances[instance_id_2]
+    if copy_instances:
+        instance_1 = copy.deepcopy(instance_1)
+        instance_2 = copy.deepcopy(instance_2)
+    if check_mutations:
+        snapshots = [pickle.dumps(instance_1), pickle.dumps(instance_2)]
+
+    start_time = time()
+    distance = experiment.get_distance(
+        instance_1, instance_2, distance_id=experiment.distance_id
+    )
+    elapsed = time() - start_time
+
+    if check_mutations:
+        for instance_id, instance, snapshot in zip(
+            [instance_id_1, instance_id_2], [instance_1, instance_2], snapshots
+        ):
+            if pickle.dumps(instance) != snapshot:
+                raise RuntimeError(
+                    f"Distance {experiment.distance_id} modified instance "
+                    f"{instance_id} (compared pair {instance_id_1}, {instance_id_2})"
+                )
+
+    matching = None
+    if type(distance) is tuple:
+        distance, matching = distance
+        matching = np.array(matching)
+
+    return instance_id_1, instance_id_2, distance, matching, elapsed
+
+
+def _store_result(
+    distances: DistanceMatrix,
+    times: DistanceMatrix,
+    matchings: MatchingStore,
+    result: tuple,
+    checkpoint: DistancesCheckpoint = None,
+) -> None:
+    """Stores the result of `_compute_pair` in the containers."""
+    instance_id_1, instance_id_2, distance, matching, elapsed = result
+
+    if checkpoint is not None:
+        checkpoint.add(
+            instance_id_1,
+            instance_id_2,
+            distance,
+            elapsed,
+            matching if matchings is not None else None,
+        )
+
+    if matching is not None and matchings is not None:
+        matchings.set_matching(instance_id_1, instance_id_2, matching)
+
+    distances.set_value(instance_id_1, instance_id_2, distance)
+    times.set_value(instance_id_1, instance_id_2, elapsed)
+
+
+def _use_cache(
+    experiment,
+    instances_ids: list,
+    distances: DistanceMatrix,
+    times: DistanceMatrix,
+    matchings: MatchingStore,
+    checkpoint: DistancesCheckpoint,
+    cache: DistanceCache,
+) -> list:
+    """Stores the cached pairs and returns the ones that must be computed."""
+    if cache is None:
+        return instances_ids
+    hits, misses = cache.lookup(experiment, instances_ids)
+    for result in hits:
+        _store_result(distances, times, matchings, result, checkpoint)
+    return misses
+
+
 def run_single_process(
-    experiment, instances_ids: list, distances: dict, times: dict, matchings: dict
+    experiment,
+    instances_ids: list,
+    distances: DistanceMatrix,
+    times: DistanceMatrix,
+    matchings: MatchingStore,
+    copy_instances: bool = True,
+    check_mutations: bool = False,
+    checkpoint: DistancesCheckpoint = None,
+    cache: DistanceCache = None,
 ) -> None:
     """
     Calculates distances between each pair of instances (using single process).
@@ -81,95 +216,209 @@ def run_single_process(
             Experiment object.
         instances_ids : list
             List of the Ids.
-        distances :  dict
-            Dictionary with distances between each pair of instances
-        times : dict
-            Dictionary with time of calculation of each distance.
-        matchings : dict
-            Dictionary with matchings between each pair of instances.
+        distances : DistanceMatrix
+            Distances between each pair of instances.
+        times : DistanceMatrix
+            Time of calculation of each distance.
+        matchings : MatchingStore
+            Matchings between each pair of instances. If None, matchings
+            returned by the distance are not stored.
+        copy_instances : bool
+            If True, each distance receives deep copies of the instances.
+            If False, the instances are passed by reference (much faster for
+            large instances, but the distance must not modify them).
+        check_mutations : bool
+            If True, raises RuntimeError when a distance modifies any of
+            its input instances. Meant for testing distance implementations
+            before running them with copy_instances=False.
+        checkpoint : DistancesCheckpoint
+            If given, every computed pair is also recorded in the checkpoint.
+        cache : DistanceCache
+            If given, pairs found in the cache are not computed, and the
+            computed ones are added to it.
 
     Returns
     -------
         None
     """
 
+    instances_ids = _use_cache(
+        experiment, instances_ids, distances, times, matchings, checkpoint, cache
+    )
     for instance_id_1, instance_id_2 in tqdm(instances_ids, desc="Computing distances"):
-
-        start_time = time()
-        distance = experiment.get_distance(
-            copy.deepcopy(experiment.instances[instance_id_1]),
-            copy.deepcopy(experiment.instances[instance_id_2]),
-            distance_id=copy.deepcopy(experiment.distance_id),
+        result = _compute_pair(
+            experiment, instance_id_1, instance_id_2, copy_instances, check_mutations
         )
+        _store_result(distances, times, matchings, result, checkpoint)
+        if cache is not None:
+            cache.add(experiment, result)
+    if cache is not None:
+        cache.flush()
 
-        if type(distance) is tuple:
-            distance, matching = distance
-            matching = np.array(matching)
-            matchings[instance_id_1][instance_id_2] = matching
-            matchings[instance_id_2][instance_id_1] = np.argsort(matching)
 
-        distances[instance_id_1][instance_id_2] = distance
-        distances[instance_id_2][instance_id_1] = distances[instance_id_1][
-            instance_id_2
-        ]
-        times[instance_id_1][instance_id_2] = time() - start_time
-        times[instance_id_2][instance_id_1] = times[instance_id_1][instance_id_2]
+def _estimate_costs(instances_ids: list, previous_times: DistanceMatrix) -> np.ndarray:
+    """
+    Estimates the cost of each pair from previously recorded times.
+
+    Pairs without a recorded time get the mean of the recorded ones.
+    """
+    costs = np.full(len(instances_ids), np.nan)
+    for p, (instance_id_1, instance_id_2) in enumerate(instances_ids):
+        if instance_id_1 in previous_times and instance_id_2 in previous_times:
+            costs[p] = previous_times.matrix[
+                previous_times.index[instance_id_1],
+                previous_times.index[instance_id_2],
+            ]
+    known = ~np.isnan(costs)
+    costs[~known] = costs[known].mean() if known.any() else 1.0
+    return costs
+
+
+def _make_chunks(
+    instances_ids: list,
+    num_processes: int,
+    costs: np.ndarray = None,
+    chunks_per_process: int = 8,
+) -> list:
+    """
+    Splits pairs into chunks of roughly equal estimated cost.
+
+    If costs are given, the pairs are ordered from the most expensive one, so
+    the expensive pairs are started first and the cheap ones fill the gaps
+    at the end of the run.
+    """
+    if costs is None or costs.sum() <= 0:
+        costs = np.ones(len(instances_ids))
+    else:
+        order = np.argsort(-costs, kind="stable")
+        instances_ids = [instances_ids[p] for p in order]
+        costs = costs[order]
+
+    target = costs.sum() / (num_processes * chunks_per_process)
+
+    chunks = []
+    chunk = []
+    chunk_cost = 0.0
+    for pair, cost in zip(instances_ids, costs):
+        chunk.append(pair)
+        chunk_cost += cost
+        if chunk_cost >= target:
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0.0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+# Experiment and options used by the worker processes; set once per worker
+# by _init_worker
+_worker_experiment = None
+_worker_options = {}
+
+
+def _init_worker(experiment, copy_instances: bool, check_mutations: bool) -> None:
+    global _worker_experiment, _worker_options
+    _worker_experiment = experiment
+    _worker_options = {
+        "copy_instances": copy_instances,
+        "check_mutations": check_mutations,
+    }
+
+
+def _compute_chunk(instances_ids: list) -> list:
+    return [
+        _compute_pair(
+            _worker_experiment, instance_id_1, instance_id_2, **_worker_options
+        )
+        for instance_id_1, instance_id_2 in instances_ids
+    ]
 
 
 def run_multiple_processes(
     experiment,
     instances_ids: list,
-    distances: dict,
-    times: dict,
-    matchings: dict,
-    process_id: int,
+    distances: DistanceMatrix,
+    times: DistanceMatrix,
+    matchings: MatchingStore,
+    num_processes: int,
+    copy_instances: bool = True,
+    check_mutations: bool = False,
+    previous_times: DistanceMatrix = None,
+    checkpoint: DistancesCheckpoint = None,
+    cache: DistanceCache = None,
 ) -> None:
     """
     Calculates distances between each pair of instances (using multiple processes).
 
+    The experiment (with its instances) is sent to each worker once, when the
+    worker starts. The pairs are split into many small chunks which the
+    workers take from a shared queue as soon as they are free, so a few
+    expensive pairs do not hold up the whole run. The workers send the
+    computed values back to the parent process, where they are stored in the
+    given containers.
+
     Parameters
     ----------
         experiment : Experiment
             Experiment object.
         instances_ids : list
             List of the Ids.
-        distances :  dict
-            Dictionary with distances between each pair of instances
-        times : dict
-            Dictionary with time of calculation of each distance.
-        matchings : dict
-            Dictionary with matchings between each pair of instances.
-        process_id : int
-            ID of the process.
+        distances : DistanceMatrix
+            Distances between each pair of instances.
+        times : DistanceMatrix
+            Time of calculation of each distance.
+        matchings : MatchingStore
+            Matchings between each pair of instances. If None, matchings
+            returned by the distance are not stored.
+        num_processes : int
+            Number of worker processes.
+        copy_instances : bool
+            See run_single_process. Each worker holds its own copy of the
+            instances, so with copy_instances=False they are shared only
+            between the pairs computed by the same worker.
+        check_mutations : bool
+            See run_single_process.
+        previous_times : DistanceMatrix
+            Previously recorded computation times. If given, they are used to
+            estimate the cost of each pair, and the most expensive pairs are
+            scheduled first.
+        checkpoint : DistancesCheckpoint
+            If given, every computed pair is also recorded in the checkpoint.
+        cache : DistanceCache
+            If given, pairs found in the cache are not computed, and the
+            computed ones are added to it.
 
     Returns
     -------
         None
     """
 
-    for instance_id_1, instance_id_2 in tqdm(instances_ids, desc="Computing distances"):
+    instances_ids = _use_cache(
+        experiment, instances_ids, distances, times, matchings, checkpoint, cache
+    )
+    if not instances_ids:
+        return
 
-        start_time = time()
-        distance = experiment.get_distance(
-            copy.deepcopy(experiment.instances[instance_id_1]),
-            copy.deepcopy(experiment.instances[instance_id_2]),
-            distance_id=copy.deepcopy(experiment.distance_id),
-        )
+    num_distances = len(instances_ids)
+    costs = None
+    if previous_times is not None:
+        costs = _estimate_costs(instances_ids, previous_times)
+    chunks = _make_chunks(instances_ids, num_processes, costs)
 
-        if type(distance) is tuple:
-            distance, matching = distance
-            matching = np.array(matching)
-            matchings[instance_id_1][instance_id_2] = matching
-            matchings[instance_id_2][instance_id_1] = np.argsort(matching)
-
-        distances[instance_id_1][instance_id_2] = distance
-        distances[instance_id_2][instance_id_1] = distances[instance_id_1][
-            instance_id_2
-        ]
-        times[instance_id_1][instance_id_2] = time() - start_time
-        times[instance_id_2][instance_id_1] = times[instance_id_1][instance_id_2]
-
-    if experiment.is_exported:
-        exports.export_distances_multiple_processes(
-            experiment, instances_ids, distances, times, process_id
-        )
+    with ProcessPoolExecutor(
+        max_workers=num_processes,
+        initializer=_init_worker,
+        initargs=(experiment, copy_instances, check_mutations),
+    ) as executor:
+        futures = [executor.submit(_compute_chunk, chunk) for chunk in chunks]
+        with tqdm(total=num_distances, desc="Computing distances") as progress:
+            for future in as_completed(futures):
+                results = future.result()
+                for result in results:
+                    _store_result(distances, times, matchings, result, checkpoint)
+                    if cache is not None:
+                        cache.add(experiment, result)
+                progress.update(len(results))
+    if cache is not None:
+        cache.flush()
@@ -1,11 +1,29 @@
-import itertools
 import math
-from copy import deepcopy
+import os
 
 import numpy as np
 
+# Compiled versions of the distances (see jit_distances) are used if Numba is
+# installed, unless disabled here or with the MAPOF_DISABLE_JIT variable
+_JIT_ENABLED = not os.environ.get("MAPOF_DISABLE_JIT")
+_jit_distances = None
 
-def map_str_to_func(name: str) -> callable:
+
+def set_jit_enabled(enabled: bool) -> None:
+    """
+    Switches between the compiled (Numba) and the pure Python versions of
+    the distances handed out by map_str_to_func.
+
+    Parameters
+    ----------
+        enabled : bool
+            If False, map_str_to_func always returns pure Python functions.
+    """
+    global _JIT_ENABLED
+    _JIT_ENABLED = enabled
+
+
+def map_str_to_func(name: str, batched: bool = False) -> callable:
     """
     Maps a string to a function.
 
@@ -13,12 +31,28 @@ def map_str_to_func(name: str) -> callable:
     ----------
         name : str
             Name of the distance.
+        batched : bool
+            If True, the batched variant of the distance is returned (see
+            e.g. l1_batch), or None if the distance has no batched variant.
 
     Returns
     -------
         callable
 
     """
+    if not batched:
+        jit_function = _jit_function(name)
+        if jit_function is not None:
+            return jit_function
+    if batched:
+        return {
+            "l1": l1_batch,
+            "l2": l2_batch,
+            "chebyshev": chebyshev_batch,
+            "hellinger": hellinger_batch,
+            "emd": emd_batch,
+            "emdinf": emdinf_batch,
+        }.get(name)
     return {
         "l1": l1,
         "l2": l2,
@@ -29,9 +63,24 @@ def map_str_to_func(name: str) -> callable:
         "discrete": discrete,
         "single_l1": single_l1,
         "hamming": hamming,
+        "swap": swap_distance_between_potes,
     }.get(name)
 
 
+def _jit_function(name: str) -> callable:
+    """Returns the compiled version of a distance or None if it is not used."""
+    global _jit_distances
+    if not _JIT_ENABLED:
+        return None
+    if _jit_distances is None:
+        # Imported here, so Numba is loaded only when distances are used
+        from mapof.core.distances import jit_distances as _jit_distances
+
+    if not _jit_distances.JIT_AVAILABLE:
+        return None
+    return _jit_distances.JIT_FUNCTIONS.get(name)
+
+
 def l1(vector_1: np.ndarray, vector_2: np.ndarray) -> float:
     """
     Computes the L1 distance.
@@ -145,23 +194,30 @@ def emd(vector_1: list, vector_2: list) -> float:
         float
             EMD distance.
     """
-    vector_1 = deepcopy(vector_1)
-    dirt = 0.0
-    for i in range(len(vector_1) - 1):
-        surplus = vector_1[i] - vector_2[i]
-        dirt += abs(surplus)
-        vector_1[i + 1] += surplus
-    return dirt
+    return float(emd_batch(vector_1, vector_2))
 
 
-def _stretch(vector, mult):
-    return [x for _ in range(mult) for x in vector]
+def _emdinf_area(before, after, widths) -> np.ndarray:
+    # Area between two piecewise linear CDFs, given their differences at the
+    # start and end of each segment
+    d_1 = np.abs(before)
+    d_2 = np.abs(after)
+    # Trapezoid if the difference keeps its sign, two triangles otherwise
+    # (works also for one triangle)
+    trapezoid = np.sign(before) == np.sign(after)
+    denominator = np.where(trapezoid, 1.0, d_1 + d_2)
+    area = np.where(trapezoid, d_1 + d_2, (d_1 * d_1 + d_2 * d_2) / denominator)
+    return (area * widths).sum(axis=-1) / 2
 
 
 def emdinf(vector_1: list, vector_2: list) -> float:
     """
     Computes the EMD-infinity distance.
 
+    Each vector is treated as a distribution over [0, 1] that spreads the
+    mass of its i-th entry uniformly over the i-th of len(vector) equal
+    intervals, so vectors of different lengths can be compared.
+
     Parameters
     ----------
         vector_1 : list
@@ -173,30 +229,220 @@ def emdinf(vector_1: list, vector_2: list) -> float:
         float
             EMD-infinity distance.
     """
-    if len(vector_1) != len(vector_2):
-        vector_1 = _stretch(vector_1, math.lcm(len(vector_1), len(vector_2)))
-        vector_2 = _stretch(vector_2, math.lcm(len(vector_1), len(vector_2)))
+    if len(vector_1) == len(vector_2):
+        return float(emdinf_batch(vector_1, vector_2))
+
+    len_1 = len(vector_1)
+    len_2 = len(vector_2)
+    # Breakpoints of both CDFs, scaled by len_1 * len_2 to stay integral
+    grid_1 = np.arange(len_1 + 1) * len_2
+    grid_2 = np.arange(len_2 + 1) * len_1
+    grid = np.union1d(grid_1, grid_2)
+
+    cum_1 = np.concatenate([[0.0], np.cumsum(vector_1, dtype=float)])
+    cum_2 = np.concatenate([[0.0], np.cumsum(vector_2, dtype=float)])
+    diff = np.interp(grid, grid_1, cum_1) - np.interp(grid, grid_2, cum_2)
+
+    widths = np.diff(grid) / (len_1 * len_2)
+    return float(_emdinf_area(diff[:-1], diff[1:], widths))
+
+
+def l1_batch(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the L1 distances between stacked vectors.
 
-    m = len(vector_1)
-    cum_x = 0
-    cum_y = 0
-    res = 0
-    for x, y in zip(vector_1, vector_2):
-        cum_x_ = cum_x
-        cum_y_ = cum_y
-        cum_x += x
-        cum_y += y
+    The arrays are broadcast against each other, with the vectors stored along
+    the last axis. Two m×k arrays give m distances between corresponding rows;
+    use pairwise_cost_table to get the m×m table between all rows.
 
-        if np.sign(cum_x_ - cum_y_) == np.sign(cum_x - cum_y):
-            # Trapezoid case
-            res += (abs(cum_x_ - cum_y_) + abs(cum_x - cum_y)) / m / 2
-        else:
-            # Two triangles case (works also for one triangle)
-            d_1 = abs(cum_x_ - cum_y_)
-            d_2 = abs(cum_x - cum_y)
-            res += (d_1 * d_1 + d_2 * d_2) / (d_1 + d_2) / m / 2
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            First vectors.
+        vectors_2 : np.ndarray
+            Second vectors.
+    Returns
+    -------
+        np.ndarray
+            L1 distances.
+    """
+    return np.abs(np.subtract(vectors_1, vectors_2, dtype=float)).sum(axis=-1)
+
+
+def l2_batch(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the L2 distances between stacked vectors (see l1_batch).
 
-    return res
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            First vectors.
+        vectors_2 : np.ndarray
+            Second vectors.
+    Returns
+    -------
+        np.ndarray
+            L2 distances.
+    """
+    diff = np.subtract(vectors_1, vectors_2, dtype=float)
+    return np.sqrt(np.einsum("...i,...i->...", diff, diff))
+
+
+def chebyshev_batch(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the Chebyshev distances between stacked vectors (see l1_batch).
+
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            First vectors.
+        vectors_2 : np.ndarray
+            Second vectors.
+    Returns
+    -------
+        np.ndarray
+            Chebyshev distances.
+    """
+    return np.abs(np.subtract(vectors_1, vectors_2, dtype=float)).max(axis=-1)
+
+
+def hellinger_batch(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the Hellinger distances between stacked vectors (see l1_batch).
+
+    Rounding errors that would make the value under the square root
+    slightly negative are clipped to zero.
+
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            First vectors.
+        vectors_2 : np.ndarray
+            Second vectors.
+    Returns
+    -------
+        np.ndarray
+            Hellinger distances.
+    """
+    vectors_1 = np.asarray(vectors_1, dtype=float)
+    vectors_2 = np.asarray(vectors_2, dtype=float)
+    length = vectors_1.shape[-1]
+    h1 = vectors_1.mean(axis=-1)
+    h2 = vectors_2.mean(axis=-1)
+    product = np.sqrt(vectors_1 * vectors_2).sum(axis=-1)
+    return np.sqrt(np.maximum(1 - product / np.sqrt(h1 * h2 * length * length), 0))
+
+
+def emd_batch(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the EMD distances between stacked vectors (see l1_batch).
+
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            First vectors.
+        vectors_2 : np.ndarray
+            Second vectors.
+    Returns
+    -------
+        np.ndarray
+            EMD distances.
+    """
+    # The surplus moved from position i to i + 1 is the prefix sum of the
+    # differences up to i
+    surplus = np.cumsum(np.subtract(vectors_1, vectors_2, dtype=float), axis=-1)
+    return np.abs(surplus[..., :-1]).sum(axis=-1)
+
+
+def emdinf_batch(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the EMD-infinity distances between stacked vectors of equal
+    length (see l1_batch).
+
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            First vectors.
+        vectors_2 : np.ndarray
+            Second vectors.
+    Returns
+    -------
+        np.ndarray
+            EMD-infinity distances.
+    """
+    diff = np.cumsum(np.subtract(vectors_1, vectors_2, dtype=float), axis=-1)
+    before = np.concatenate([np.zeros_like(diff[..., :1]), diff[..., :-1]], axis=-1)
+    return _emdinf_area(before, diff, 1 / diff.shape[-1])
+
+
+def pairwise_cost_table(
+    batched_func: callable, vectors_1: np.ndarray, vectors_2: np.ndarray
+) -> np.ndarray:
+    """
+    Computes a batched distance between all pairs of rows of two arrays.
+
+    Parameters
+    ----------
+        batched_func : callable
+            Batched distance, e.g. map_str_to_func("emd", batched=True).
+        vectors_1 : np.ndarray
+            Array of shape (n_1, k).
+        vectors_2 : np.ndarray
+            Array of shape (n_2, k).
+    Returns
+    -------
+        np.ndarray
+            Array of shape (n_1, n_2) with the distance between row i of
+            vectors_1 and row j of vectors_2 at position (i, j).
+    """
+    vectors_1 = np.asarray(vectors_1)
+    vectors_2 = np.asarray(vectors_2)
+    return batched_func(vectors_1[:, np.newaxis, :], vectors_2[np.newaxis, :, :])
+
+
+def emd_cost_table(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the EMD distance between all pairs of rows of two arrays.
+
+    Prefix sums are computed once per row instead of once per pair.
+
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            Array of shape (n_1, k).
+        vectors_2 : np.ndarray
+            Array of shape (n_2, k).
+    Returns
+    -------
+        np.ndarray
+            Array of shape (n_1, n_2).
+    """
+    cum_1 = np.cumsum(np.asarray(vectors_1, dtype=float), axis=-1)[:, :-1]
+    cum_2 = np.cumsum(np.asarray(vectors_2, dtype=float), axis=-1)[:, :-1]
+    return l1_batch(cum_1[:, np.newaxis, :], cum_2[np.newaxis, :, :])
+
+
+def emdinf_cost_table(vectors_1: np.ndarray, vectors_2: np.ndarray) -> np.ndarray:
+    """
+    Computes the EMD-infinity distance between all pairs of rows of two
+    arrays with rows of equal length.
+
+    Parameters
+    ----------
+        vectors_1 : np.ndarray
+            Array of shape (n_1, k).
+        vectors_2 : np.ndarray
+            Array of shape (n_2, k).
+    Returns
+    -------
+        np.ndarray
+            Array of shape (n_1, n_2).
+    """
+    cum_1 = np.cumsum(np.asarray(vectors_1, dtype=float), axis=-1)
+    cum_2 = np.cumsum(np.asarray(vectors_2, dtype=float), axis=-1)
+    diff = cum_1[:, np.newaxis, :] - cum_2[np.newaxis, :, :]
+    before = np.concatenate([np.zeros_like(diff[..., :1]), diff[..., :-1]], axis=-1)
+    return _emdinf_area(before, diff, 1 / diff.shape[-1])
 
 
 def single_l1(value_1, value_2) -> float:
@@ -247,33 +493,122 @@ def vote_to_pote(vote: list) -> list:
         list
             Potes (i.e. positional votes).
     """
-    return [vote.index(i) for i in range(len(vote) + 1) if i in vote]
+    m = len(vote)
+    if m > 0 and min(vote) >= 0:
+        # Permutation of the candidates, i.e., the usual case
+        pote = [None] * m
+        try:
+            for position, candidate in enumerate(vote):
+                pote[candidate] = position
+        except IndexError:
+            pote = None
+        if pote is not None and None not in pote:
+            return pote
+    # Position of the first occurrence of each candidate from 0 to len(vote)
+    positions = {}
+    for position, candidate in enumerate(vote):
+        positions.setdefault(candidate, position)
+    return [positions[i] for i in range(len(vote) + 1) if i in positions]
+
+
+# Below this number of elements (rows x candidates) the plain Python
+# inversion count is faster than the vectorized one
+_BATCH_MIN_ELEMENTS = 512
+# Up to this length comparing all pairs is faster than the Fenwick tree
+_PAIRWISE_MAX_LENGTH = 32
+
+
+def _count_inversions_of_list(sequence: list) -> int:
+    if len(sequence) <= _PAIRWISE_MAX_LENGTH:
+        inversions = 0
+        for i, value in enumerate(sequence):
+            for other in sequence[i + 1 :]:
+                if value > other:
+                    inversions += 1
+        return inversions
+
+    # Fenwick tree over the values, O(m log m)
+    low = min(sequence)
+    size = max(sequence) - low + 1
+    tree = [0] * (size + 1)
+    inversions = 0
+    for num_seen, value in enumerate(sequence):
+        i = value - low + 1
+        not_larger = 0
+        while i > 0:
+            not_larger += tree[i]
+            i -= i & -i
+        inversions += num_seen - not_larger
+        i = value - low + 1
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return inversions
+
+
+def _count_inversions(sequences: np.ndarray) -> np.ndarray:
+    # Bottom-up merge sort over all rows at once. Keys are offset by the id
+    # of the merged group (row and pair of blocks), so a stable sort of a
+    # row merges the sorted blocks of each group, left before right on ties;
+    # as the blocks are sorted runs, the sort takes linear time per level.
+    # Each left element is inverted with the right elements merged before it.
+    sequences = np.asarray(sequences, dtype=np.int64)
+    num_rows, m = sequences.shape
+    inversions = np.zeros(num_rows, dtype=np.int64)
+    if m < 2:
+        return inversions
+
+    values = sequences - sequences.min(axis=1, keepdims=True)
+    span = int(values.max()) + 1
+    positions = np.arange(m)
+    rows = np.arange(num_rows)[:, np.newaxis]
+
+    width = 1
+    while width < m:
+        groups = positions // (2 * width)
+        keys = (rows * (groups[-1] + 1) + groups) * span + values
+        is_right = (positions // width) % 2 == 1
+
+        order = np.argsort(keys, axis=1, kind="stable")
+        right_merged = is_right[order]
+        # Right elements of the group merged before each position (all the
+        # preceding groups are complete and have `width` right elements)
+        right_before = np.cumsum(right_merged, axis=1) - right_merged - groups * width
+        inversions += np.where(right_merged, 0, right_before).sum(axis=1)
+
+        values = np.take_along_axis(values, order, axis=1)
+        width *= 2
+    return inversions
 
 
 def swap_distance(vote_1: list, vote_2: list, matching=None) -> int:
     """Return: Swap distance between two votes"""
 
-    new_vote_2 = deepcopy(vote_2)
     if matching is not None:
-        for i in range(len(vote_2)):
-            new_vote_2[i] = matching[vote_2[i]]
-
-    pote_1 = vote_to_pote(vote_1)
-    pote_2 = vote_to_pote(new_vote_2)
-
-    swap_distance = 0
-    for i, j in itertools.combinations(pote_1, 2):
-        if (pote_1[i] > pote_1[j] and pote_2[i] < pote_2[j]) or (
-            pote_1[i] < pote_1[j] and pote_2[i] > pote_2[j]
-        ):
-            swap_distance += 1
-    return swap_distance
+        vote_2 = [matching[candidate] for candidate in vote_2]
+
+    pote_2 = vote_to_pote(vote_2)
+    m = len(vote_1)
+    if (
+        _jit_function("swap") is None
+        and len(pote_2) == m
+        and m > 0
+        and min(vote_1) >= 0
+        and max(vote_1) < m
+    ):
+        if len(set(vote_1)) == m:
+            # vote_1 is a permutation, so it orders the candidates by pote_1
+            return _count_inversions_of_list([pote_2[c] for c in vote_1])
+    return swap_distance_between_potes(vote_to_pote(vote_1), pote_2)
 
 
 def swap_distance_between_potes(pote_1: list, pote_2: list) -> int:
     """
     Computes the swap distance between two potes (i.e. positional votes).
 
+    The distance is the number of inversions of pote_2 once the candidates
+    are sorted by pote_1, counted in O(m log m) time.
+
     Parameters
     ----------
         pote_1 : list
@@ -285,13 +620,63 @@ def swap_distance_between_potes(pote_1: list, pote_2: list) -> int:
         int
             Swap distance.
     """
-    swap_distance = 0
-    for i, j in itertools.combinations(pote_1, 2):
-        if (pote_1[i] > pote_1[j] and pote_2[i] < pote_2[j]) or (
-            pote_1[i] < pote_1[j] and pote_2[i] > pote_2[j]
-        ):
-            swap_distance += 1
-    return swap_distance
+    jit_function = _jit_function("swap")
+    if jit_function is not None:
+        return jit_function(pote_1, pote_2)
+
+    if isinstance(pote_1, np.ndarray):
+        pote_1 = pote_1.tolist()
+    if isinstance(pote_2, np.ndarray):
+        pote_2 = pote_2.tolist()
+
+    # Positions of pote_2 in the order of pote_1
+    sequence = [None] * len(pote_1)
+    if sequence and min(pote_1) >= 0:
+        try:
+            for position_1, position_2 in zip(pote_1, pote_2):
+                sequence[position_1] = position_2
+        except IndexError:
+            sequence = [None]
+    if None in sequence:
+        # Not a permutation; ties in pote_1 are ordered by pote_2, so they
+        # never count as swaps
+        sequence = [position_2 for _, position_2 in sorted(zip(pote_1, pote_2))]
+    return _count_inversions_of_list(sequence)
+
+
+def swap_distance_between_potes_batch(
+    potes_1: np.ndarray, potes_2: np.ndarray
+) -> np.ndarray:
+    """
+    Computes the swap distances between corresponding rows of two arrays of
+    potes (i.e. positional votes).
+
+    Large batches are counted with a vectorized merge sort over all rows,
+    small ones row by row as in swap_distance_between_potes.
+
+    Parameters
+    ----------
+        potes_1 : np.ndarray
+            Array of shape (n, m).
+        potes_2 : np.ndarray
+            Array of shape (n, m).
+    Returns
+    -------
+        np.ndarray
+            Array of n swap distances.
+    """
+    potes_1 = np.asarray(potes_1, dtype=np.int64)
+    potes_2 = np.asarray(potes_2, dtype=np.int64)
+    if potes_1.size < _BATCH_MIN_ELEMENTS:
+        return np.array(
+            [
+                swap_distance_between_potes(pote_1, pote_2)
+                for pote_1, pote_2 in zip(potes_1.tolist(), potes_2.tolist())
+            ],
+            dtype=np.int64,
+        )
+    order = np.lexsort((potes_2, potes_1), axis=-1)
+    return _count_inversions(np.take_along_axis(potes_2, order, axis=-1))
 
 
 def spearman_distance_between_potes(pote_1: list, pote_2: list) -> int:
@@ -310,3 +695,97 @@ def spearman_distance_between_potes(pote_1: list, pote_2: list) -> int:
             Spearman distance.
     """
     return sum([abs(pote_1[c] - pote_2[c]) for c in range(len(pote_1))])
+
+
+# Upper bound on the number of array elements of the intermediate blocks
+# used by the cost tables below
+_BLOCK_ELEMENTS = 2**22
+
+
+def _row_blocks(num_rows: int, row_size: int, chunk_size: int = None):
+    if chunk_size is None:
+        chunk_size = max(1, _BLOCK_ELEMENTS // max(1, row_size))
+    for start in range(0, num_rows, chunk_size):
+        yield slice(start, min(start + chunk_size, num_rows))
+
+
+def spearman_cost_table(
+    potes_1: np.ndarray, potes_2: np.ndarray, chunk_size: int = None
+) -> np.ndarray:
+    """
+    Computes the Spearman distance between all pairs of rows of two arrays of
+    potes (i.e. positional votes).
+
+    Parameters
+    ----------
+        potes_1 : np.ndarray
+            Array of shape (n_1, m).
+        potes_2 : np.ndarray
+            Array of shape (n_2, m).
+        chunk_size : int
+            Number of rows of potes_1 processed at once. By default it is
+            chosen so that intermediate arrays have at most about 4M elements.
+    Returns
+    -------
+        np.ndarray
+            Integer array of shape (n_1, n_2).
+    """
+    # Candidates along the first axis, so each step works on whole rows
+    positions_1 = np.ascontiguousarray(np.asarray(potes_1, dtype=np.int64).T)
+    positions_2 = np.ascontiguousarray(np.asarray(potes_2, dtype=np.int64).T)
+    num_candidates, num_rows_1 = positions_1.shape
+    num_rows_2 = positions_2.shape[1]
+
+    table = np.zeros((num_rows_1, num_rows_2), dtype=np.int64)
+    for rows in _row_blocks(num_rows_1, num_rows_2, chunk_size):
+        for candidate in range(num_candidates):
+            table[rows] += np.abs(
+                positions_1[candidate, rows, np.newaxis]
+                - positions_2[candidate, np.newaxis, :]
+            )
+    return table
+
+
+def _pair_signs(potes: np.ndarray, first: np.ndarray, second: np.ndarray):
+    return np.sign(potes[:, first] - potes[:, second]).astype(np.float64)
+
+
+def swap_cost_table(
+    potes_1: np.ndarray, potes_2: np.ndarray, chunk_size: int = None
+) -> np.ndarray:
+    """
+    Computes the swap distance between all pairs of rows of two arrays of
+    potes (i.e. positional votes).
+
+    Each pote is encoded by the signs of its differences over all pairs of
+    candidates, so the number of discordant pairs of all votes follows from
+    two matrix products.
+
+    Parameters
+    ----------
+        potes_1 : np.ndarray
+            Array of shape (n_1, m).
+        potes_2 : np.ndarray
+            Array of shape (n_2, m).
+        chunk_size : int
+            Number of rows encoded at once. By default it is chosen so that
+            intermediate arrays have at most about 4M elements.
+    Returns
+    -------
+        np.ndarray
+            Integer array of shape (n_1, n_2).
+    """
+    potes_1 = np.asarray(potes_1, dtype=np.int64)
+    potes_2 = np.asarray(potes_2, dtype=np.int64)
+    first, second = np.triu_indices(potes_1.shape[1], k=1)
+
+    table = np.empty((len(potes_1), len(potes_2)), dtype=np.int64)
+    for rows_2 in _row_blocks(len(potes_2), len(first), chunk_size):
+        signs_2 = _pair_signs(potes_2[rows_2], first, second)
+        for rows_1 in _row_blocks(len(potes_1), len(first), chunk_size):
+            signs_1 = _pair_signs(potes_1[rows_1], first, second)
+            # A pair is a swap iff both signs are nonzero and differ
+            both = np.abs(signs_1) @ np.abs(signs_2).T
+            agreement = signs_1 @ signs_2.T
+            table[rows_1, rows_2] = np.rint((both - agreement) / 2)
+    return table
@@ -0,0 +1,172 @@
+"""
+Numba-compiled versions of the inner distances.
+
+The functions have the same signatures and results as their counterparts in
+mapof.core.distances.inner_distances. If Numba is not installed, the same
+kernels run as plain Python, so they can still be used (slowly) for
+debugging. map_str_to_func hands them out only if Numba is available and
+the JIT is enabled (see inner_distances.set_jit_enabled).
+"""
+
+import math
+
+import numpy as np
+
+import mapof.core.distances.inner_distances as inner
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+JIT_AVAILABLE = njit is not None
+
+if njit is None:
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _emd(vector_1, vector_2):
+    dirt = 0.0
+    surplus = 0.0
+    for i in range(len(vector_1) - 1):
+        surplus += vector_1[i] - vector_2[i]
+        dirt += abs(surplus)
+    return dirt
+
+
+@njit(cache=True)
+def _emdinf(vector_1, vector_2):
+    m = len(vector_1)
+    cum = 0.0
+    res = 0.0
+    for i in range(m):
+        cum_ = cum
+        cum += vector_1[i] - vector_2[i]
+        d_1 = abs(cum_)
+        d_2 = abs(cum)
+        if np.sign(cum_) == np.sign(cum):
+            # Trapezoid case
+            res += (d_1 + d_2) / m / 2
+        else:
+            # Two triangles case (works also for one triangle)
+            res += (d_1 * d_1 + d_2 * d_2) / (d_1 + d_2) / m / 2
+    return res
+
+
+@njit(cache=True)
+def _hellinger(vector_1, vector_2):
+    m = len(vector_1)
+    product = 0.0
+    for i in range(m):
+        product += math.sqrt(vector_1[i] * vector_2[i])
+    h1 = np.mean(vector_1)
+    h2 = np.mean(vector_2)
+    return math.sqrt(1 - (1 / math.sqrt(h1 * h2 * m * m)) * product)
+
+
+@njit(cache=True)
+def _chebyshev(vector_1, vector_2):
+    res = 0.0
+    for i in range(len(vector_1)):
+        res = max(res, abs(vector_1[i] - vector_2[i]))
+    return res
+
+
+@njit(cache=True)
+def _discrete(vector_1, vector_2):
+    for i in range(len(vector_1)):
+        if vector_1[i] != vector_2[i]:
+            return 1
+    return 0
+
+
+@njit(cache=True)
+def _swap_distance_between_potes(pote_1, pote_2):
+    # Inversions of pote_2 in the order of pote_1 (ties ordered by pote_2),
+    # counted with a Fenwick tree
+    m = len(pote_1)
+    if m < 2:
+        return 0
+    low = pote_2.min()
+    span = pote_2.max() - low + 1
+    order = np.argsort((pote_1 - pote_1.min()) * span + pote_2 - low, kind="mergesort")
+    tree = np.zeros(span + 1, dtype=np.int64)
+    inversions = 0
+    for num_seen in range(m):
+        value = pote_2[order[num_seen]] - low + 1
+        i = value
+        not_larger = 0
+        while i > 0:
+            not_larger += tree[i]
+            i -= i & -i
+        inversions += num_seen - not_larger
+        i = value
+        while i <= span:
+            tree[i] += 1
+            i += i & -i
+    return inversions
+
+
+def _as_floats(vector) -> np.ndarray:
+    return np.asarray(vector, dtype=np.float64)
+
+
+def emd(vector_1: list, vector_2: list) -> float:
+    """Compiled version of inner_distances.emd."""
+    return float(_emd(_as_floats(vector_1), _as_floats(vector_2)))
+
+
+def emdinf(vector_1: list, vector_2: list) -> float:
+    """
+    Compiled version of inner_distances.emdinf. Vectors of different lengths
+    are passed to inner_distances.emdinf.
+    """
+    if len(vector_1) != len(vector_2):
+        return inner.emdinf(vector_1, vector_2)
+    return float(_emdinf(_as_floats(vector_1), _as_floats(vector_2)))
+
+
+def hellinger(vector_1: list, vector_2: list) -> float:
+    """Compiled version of inner_distances.hellinger."""
+    return float(_hellinger(_as_floats(vector_1), _as_floats(vector_2)))
+
+
+def chebyshev(vector_1: list, vector_2: list) -> float:
+    """Compiled version of inner_distances.chebyshev."""
+    return float(_chebyshev(_as_floats(vector_1), _as_floats(vector_2)))
+
+
+def discrete(vector_1, vector_2) -> int:
+    """
+    Compiled version of inner_distances.discrete. Non-numeric vectors are
+    passed to inner_distances.discrete.
+    """
+    array_1 = np.asarray(vector_1)
+    array_2 = np.asarray(vector_2)
+    if array_1.dtype.kind not in "biuf" or array_2.dtype.kind not in "biuf":
+        return inner.discrete(vector_1, vector_2)
+    return int(_discrete(array_1, array_2))
+
+
+def swap_distance_between_potes(pote_1: list, pote_2: list) -> int:
+    """Compiled version of inner_distances.swap_distance_between_potes."""
+    return int(
+        _swap_distance_between_potes(
+            np.asarray(pote_1, dtype=np.int64), np.asarray(pote_2, dtype=np.int64)
+        )
+    )
+
+
+JIT_FUNCTIONS = {
+    "chebyshev": chebyshev,
+    "hellinger": hellinger,
+    "emd": emd,
+    "emdinf": emdinf,
+    "discrete": discrete,
+    "swap": swap_distance_between_potes,
+}
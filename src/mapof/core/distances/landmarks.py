@@ -0,0 +1,368 @@
+import numpy as np
+
+from mapof.core.distances.nearest_neighbors import _select_pivot_rows
+
+# Number of matrix elements computed at once
+_BLOCK_ELEMENTS = 2**22
+
+
+def landmark_mds(
+    pivot_distances: np.ndarray, pivots: list, dim: int = None
+) -> np.ndarray:
+    """
+    Computes Landmark MDS coordinates of all instances from their distances
+    to the pivots (de Silva and Tenenbaum, 2004).
+
+    Classical MDS is applied to the pivots only and every other instance is
+    placed by distance-based triangulation, so the cost is O(n * p).
+
+    Parameters
+    ----------
+        pivot_distances : np.ndarray
+            Array of shape (p, n) with the distances from each pivot to each
+            instance.
+        pivots : list
+            Indices of the pivots among the n instances.
+        dim : int
+            Number of dimensions. By default all dimensions with a positive
+            eigenvalue (at most p - 1) are used.
+
+    Returns
+    -------
+        np.ndarray
+            Array of shape (n, dim) with the coordinates.
+    """
+    squared = np.square(pivot_distances)
+    num_pivots = len(pivots)
+
+    # Double centering of the squared distances between the pivots
+    between_pivots = squared[:, pivots]
+    centering = np.eye(num_pivots) - 1 / num_pivots
+    gram = -0.5 * centering @ between_pivots @ centering
+
+    eigenvalues, eigenvectors = np.linalg.eigh(gram)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues, eigenvectors = eigenvalues[order], eigenvectors[:, order]
+    positive = int(np.count_nonzero(eigenvalues > 1e-12 * max(eigenvalues[0], 1.0)))
+    dim = positive if dim is None else min(dim, positive)
+
+    # Pseudo-inverse transpose of the pivot coordinates
+    pseudo_inverse = eigenvectors[:, :dim] / np.sqrt(eigenvalues[:dim])
+    mean_squared = between_pivots.mean(axis=1)
+    return -0.5 * (squared.T - mean_squared) @ pseudo_inverse
+
+
+class PairValues:
+    """
+    Values of a sparse set of pairs of instances, kept in a dict.
+
+    Provides the part of the DistanceMatrix interface used to store computed
+    distances (set_value, get_value, has_value, `in`), for runs that compute
+    far fewer than n^2 pairs and must not allocate a dense matrix.
+    """
+
+    def __init__(self, instance_ids):
+        self.ids = list(instance_ids)
+        self.index = {instance_id: i for i, instance_id in enumerate(self.ids)}
+        self.values = {}
+
+    def _key(self, instance_id_1, instance_id_2) -> tuple:
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        return (i, j) if i <= j else (j, i)
+
+    def __contains__(self, instance_id):
+        return instance_id in self.index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"PairValues({len(self.ids)} instances, {len(self.values)} pairs)"
+
+    def get_value(self, instance_id_1, instance_id_2, default=None):
+        """Returns the value for a pair or `default` if it is missing."""
+        return self.values.get(self._key(instance_id_1, instance_id_2), default)
+
+    def set_value(self, instance_id_1, instance_id_2, value) -> None:
+        """Sets the value for a pair (symmetrically)."""
+        self.values[self._key(instance_id_1, instance_id_2)] = float(value)
+
+    def has_value(self, instance_id_1, instance_id_2) -> bool:
+        """Checks if the value for a pair is present."""
+        return self._key(instance_id_1, instance_id_2) in self.values
+
+
+class LandmarkDistances:
+    """
+    Distances approximated by Landmark MDS, kept apart from exact distances.
+
+    Only the exact distances from the pivots to all instances (a p x n
+    array), those of the sampled check pairs and the coordinates are stored,
+    i.e., O(n * (p + dim)) memory. Other distances are the Euclidean
+    distances between the coordinates, computed on demand.
+
+    Attributes
+    ----------
+        ids : list
+            Ids of the instances.
+        pivots : np.ndarray
+            Indices of the pivots.
+        pivot_distances : np.ndarray
+            Array of shape (p, n) with the exact distances from the pivots.
+        coordinates : np.ndarray
+            Array of shape (n, dim) with the Landmark MDS coordinates.
+        stats : dict
+            Statistics of the approximation error on the check pairs.
+    """
+
+    def __init__(
+        self,
+        instance_ids: list,
+        pivots: np.ndarray,
+        pivot_distances: np.ndarray,
+        coordinates: np.ndarray,
+        checked: dict,
+        stats: dict,
+    ):
+        self.ids = list(instance_ids)
+        self.index = {instance_id: i for i, instance_id in enumerate(self.ids)}
+        self.pivots = np.asarray(pivots, dtype=int)
+        self.pivot_distances = pivot_distances
+        self.coordinates = coordinates
+        self.stats = stats
+        self._pivot_rows = {p: k for k, p in enumerate(self.pivots.tolist())}
+        # Exact distances of the check pairs, keyed by (i, j) with i < j
+        self._checked = checked
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return (
+            f"LandmarkDistances({len(self.ids)} instances, {len(self.pivots)} pivots)"
+        )
+
+    def _exact(self, i: int, j: int):
+        if i == j:
+            return 0.0
+        if i in self._pivot_rows:
+            return float(self.pivot_distances[self._pivot_rows[i], j])
+        if j in self._pivot_rows:
+            return float(self.pivot_distances[self._pivot_rows[j], i])
+        return self._checked.get((min(i, j), max(i, j)))
+
+    def is_exact(self, instance_id_1, instance_id_2) -> bool:
+        """Checks if the distance of a pair was computed exactly."""
+        return (
+            self._exact(self.index[instance_id_1], self.index[instance_id_2])
+            is not None
+        )
+
+    def get_value(self, instance_id_1, instance_id_2) -> float:
+        """Returns the exact distance if known and the approximation otherwise."""
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        value = self._exact(i, j)
+        if value is None:
+            value = float(np.linalg.norm(self.coordinates[i] - self.coordinates[j]))
+        return value
+
+    def to_array(self, instance_ids: list = None) -> np.ndarray:
+        """
+        Returns the dense matrix of the distances (exact where known), with
+        zeros on the diagonal. Needs O(k^2) memory for k instances, so it is
+        meant for subsets or moderately sized experiments.
+
+        Parameters
+        ----------
+            instance_ids : list
+                Instances to select. If None, all instances are used.
+
+        Returns
+        -------
+            np.ndarray
+        """
+        if instance_ids is None:
+            idx = np.arange(len(self.ids))
+        else:
+            idx = np.array([self.index[instance_id] for instance_id in instance_ids])
+        coordinates = self.coordinates[idx]
+        norms = np.einsum("ij,ij->i", coordinates, coordinates)
+        array = np.empty((len(idx), len(idx)))
+        step = max(1, _BLOCK_ELEMENTS // max(len(idx), 1))
+        for start in range(0, len(idx), step):
+            stop = min(start + step, len(idx))
+            block = array[start:stop]
+            np.matmul(coordinates[start:stop], coordinates.T, out=block)
+            block *= -2
+            block += norms[start:stop, None]
+            block += norms[None, :]
+            np.sqrt(np.maximum(block, 0.0, out=block), out=block)
+
+        position = np.full(len(self.ids), -1)
+        position[idx] = np.arange(len(idx))
+        for k, p in enumerate(self.pivots):
+            if position[p] >= 0:
+                array[position[p]] = self.pivot_distances[k, idx]
+                array[:, position[p]] = self.pivot_distances[k, idx]
+        for (i, j), value in self._checked.items():
+            if position[i] >= 0 and position[j] >= 0:
+                array[position[i], position[j]] = value
+                array[position[j], position[i]] = value
+        np.fill_diagonal(array, 0.0)
+        return array
+
+
+def _sample_pairs(
+    num_instances: int, excluded: np.ndarray, num_pairs: int, seed: int = 0
+) -> (np.ndarray, np.ndarray):
+    """Samples distinct unordered pairs of instances that are not excluded."""
+    candidates = np.flatnonzero(~excluded)
+    m = len(candidates)
+    num_total = m * (m - 1) // 2
+    num_pairs = min(num_pairs, num_total)
+    rng = np.random.default_rng(seed)
+    # Condensed indices k of the pairs (a, b), a < b, in row-major order
+    k = np.sort(rng.choice(num_total, num_pairs, replace=False)).astype(np.int64)
+    # Row a is the largest one with start(a) = a * (2m - a - 1) / 2 <= k; the
+    # float estimate is corrected by one row where rounding misses it
+    a = np.floor(((2 * m - 1) - np.sqrt((2 * m - 1) ** 2 - 8.0 * k)) / 2)
+    a = np.clip(a.astype(np.int64), 0, max(m - 2, 0))
+
+    def start(row):
+        return row * (2 * m - row - 1) // 2
+
+    a -= start(a) > k
+    a += start(a + 1) <= k
+    b = k - start(a) + a + 1
+    return candidates[a], candidates[b]
+
+
+def landmark_distances(
+    exact,
+    run: callable,
+    num_pivots: int,
+    pivot_method: str = "maxmin",
+    dim: int = None,
+    num_check_pairs: int = 1000,
+) -> LandmarkDistances:
+    """
+    Approximates all distances from exact distances to pivots.
+
+    Only the distances between the pivots and all instances (n * p pairs)
+    and between `num_check_pairs` sampled pairs are computed exactly. The
+    other distances are approximated by Euclidean distances between the
+    Landmark MDS coordinates of the instances; they are not stored, see
+    LandmarkDistances. The sampled pairs measure the error of the
+    approximation (if the number of dimensions is chosen on them, the
+    reported error is slightly optimistic).
+
+    Parameters
+    ----------
+        exact : PairValues or DistanceMatrix
+            Exact distances between pairs of instances; values that are
+            already present are used (and not recomputed).
+        run : callable
+            Function computing (and storing in `exact`) the exact distances
+            of a given list of pairs of ids.
+        num_pivots : int
+            Number of pivots.
+        pivot_method : str
+            "maxmin" (farthest-first) or "random".
+        dim : int
+            Number of dimensions of the Landmark MDS. By default the number
+            of dimensions with the smallest error on the sampled pairs.
+        num_check_pairs : int
+            Number of sampled non-pivot pairs used to measure the error.
+
+    Returns
+    -------
+        LandmarkDistances
+            Exact pivot distances, coordinates and error statistics.
+    """
+    instance_ids = exact.ids
+    num_instances = len(instance_ids)
+    num_evaluated = 0
+
+    def run_pairs(pairs: list) -> None:
+        nonlocal num_evaluated
+        num_evaluated += len(pairs)
+        if pairs:
+            run(pairs)
+
+    def pivot_row(p: int) -> np.ndarray:
+        pivot_id = instance_ids[p]
+        run_pairs(
+            [
+                (pivot_id, instance_id)
+                for x, instance_id in enumerate(instance_ids)
+                if x != p and not exact.has_value(pivot_id, instance_id)
+            ]
+        )
+        row = np.array(
+            [exact.get_value(pivot_id, instance_id) for instance_id in instance_ids],
+            dtype=float,
+        )
+        row[p] = 0.0
+        return row
+
+    pivots, pivot_distances = _select_pivot_rows(
+        num_instances, pivot_row, num_pivots, pivot_method
+    )
+    coordinates = landmark_mds(pivot_distances, pivots, dim)
+
+    is_pivot = np.zeros(num_instances, dtype=bool)
+    is_pivot[pivots] = True
+    rows, cols = _sample_pairs(num_instances, is_pivot, num_check_pairs)
+    pairs = [(instance_ids[a], instance_ids[b]) for a, b in zip(rows, cols)]
+    run_pairs([pair for pair in pairs if not exact.has_value(*pair)])
+    exact_values = np.array([exact.get_value(*pair) for pair in pairs], dtype=float)
+
+    # Squared approximate distances using the first 1, 2, ... dimensions
+    squared = np.cumsum(np.square(coordinates[rows] - coordinates[cols]), axis=1)
+    if dim is None and len(exact_values) > 0 and coordinates.shape[1] > 0:
+        # For non-Euclidean distances the dimensions with small eigenvalues
+        # mostly add noise, so keep the number of dimensions that fits the
+        # sampled exact distances best
+        errors = np.sqrt(squared) - exact_values[:, None]
+        best = int(np.argmin(np.sum(np.square(errors), axis=0))) + 1
+        coordinates = np.ascontiguousarray(coordinates[:, :best])
+    if coordinates.shape[1] > 0:
+        approx = np.sqrt(squared[:, coordinates.shape[1] - 1])
+    else:
+        approx = np.zeros(len(exact_values))
+
+    stats = {
+        "num_pivots": len(pivots),
+        "dim": coordinates.shape[1],
+        "num_evaluated": num_evaluated,
+        "pairs": num_instances * (num_instances - 1) // 2,
+        "num_checked": len(exact_values),
+    }
+    if len(exact_values) > 0:
+        errors = approx - exact_values
+        stats["mean_abs_error"] = float(np.mean(np.abs(errors)))
+        stats["max_abs_error"] = float(np.max(np.abs(errors)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = np.abs(errors) / exact_values
+        stats["mean_rel_error"] = (
+            float(np.mean(relative[exact_values > 0]))
+            if np.any(exact_values > 0)
+            else np.nan
+        )
+        stats["normalized_stress"] = float(
+            np.sqrt(np.sum(errors**2) / np.sum(exact_values**2))
+        )
+        stats["correlation"] = (
+            float(np.corrcoef(approx, exact_values)[0, 1])
+            if len(exact_values) > 1
+            else np.nan
+        )
+
+    checked = {
+        (int(a), int(b)): float(value) for a, b, value in zip(rows, cols, exact_values)
+    }
+    return LandmarkDistances(
+        instance_ids, pivots, pivot_distances, coordinates, checked, stats
+    )
@@ -0,0 +1,243 @@
+import heapq
+
+import numpy as np
+
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+
+
+class _ExactDistances:
+    """
+    Exact distances evaluated on demand, each pair at most once.
+
+    Evaluated pairs are kept in a dict per instance, and the `known`
+    distances are looked up in place, so the memory grows with the number
+    of evaluations rather than with n^2.
+    """
+
+    def __init__(self, experiment, distance_id: str, known: DistanceMatrix = None):
+        self.experiment = experiment
+        self.distance_id = distance_id
+        self.ids = list(experiment.instances)
+        self.index = {instance_id: i for i, instance_id in enumerate(self.ids)}
+        self.values = {}
+        self.known = known if known is not None and len(known) > 0 else None
+        self._known_positions = None
+        self.num_evaluations = 0
+
+    def _known_value(self, instance_id_1, instance_id_2):
+        known = self.known
+        if known is None or instance_id_1 not in known or instance_id_2 not in known:
+            return None
+        return known.get_value(instance_id_1, instance_id_2)
+
+    def __call__(self, instance_id_1, instance_id_2) -> float:
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        value = self.values.get(i, {}).get(j)
+        if value is None:
+            value = self._known_value(instance_id_1, instance_id_2)
+        if value is None:
+            value = self.experiment.get_distance(
+                self.experiment.instances[instance_id_1],
+                self.experiment.instances[instance_id_2],
+                distance_id=self.distance_id,
+            )
+            if type(value) is tuple:
+                value = value[0]
+            self.values.setdefault(i, {})[j] = value
+            self.values.setdefault(j, {})[i] = value
+            self.num_evaluations += 1
+        return value
+
+    def row(self, instance_id) -> np.ndarray:
+        """Distances from an instance to all instances (NaN if not known)."""
+        row = np.full(len(self.ids), np.nan)
+        if self.known is not None and instance_id in self.known:
+            if self._known_positions is None:
+                self._known_positions = np.array(
+                    [self.known.index.get(other_id, -1) for other_id in self.ids]
+                )
+            positions = self._known_positions
+            known_row = self.known.matrix[self.known.index[instance_id]]
+            row[positions >= 0] = known_row[positions[positions >= 0]]
+        for j, value in self.values.get(self.index[instance_id], {}).items():
+            row[j] = value
+        return row
+
+
+def _select_pivot_rows(
+    num_instances: int, pivot_row: callable, num_pivots: int, method: str
+) -> (list, np.ndarray):
+    """
+    Selects pivots by their indices; `pivot_row(p)` returns the distances
+    from the p-th instance to all instances and is called once per pivot.
+    """
+    num_pivots = min(num_pivots, num_instances)
+    pivot_distances = np.zeros((num_pivots, num_instances))
+    if method == "random":
+        rng = np.random.default_rng(0)
+        pivots = [int(p) for p in rng.choice(num_instances, num_pivots, replace=False)]
+    elif method == "maxmin":
+        pivots = [0] if num_pivots > 0 else []
+    else:
+        raise ValueError(f"Unknown pivot selection method: {method}")
+
+    nearest = np.full(num_instances, np.inf)
+    for p in range(num_pivots):
+        pivot_distances[p] = pivot_row(pivots[p])
+        nearest = np.minimum(nearest, pivot_distances[p])
+        if method == "maxmin" and p + 1 < num_pivots:
+            pivots.append(int(np.argmax(nearest)))
+
+    return pivots, pivot_distances
+
+
+def select_pivots(
+    instance_ids: list, distance: callable, num_pivots: int, method: str = "maxmin"
+) -> (list, np.ndarray):
+    """
+    Selects pivot instances and computes their distances to all instances.
+
+    Parameters
+    ----------
+        instance_ids : list
+            List of the Ids.
+        distance : callable
+            Distance between two instances given by their ids.
+        num_pivots : int
+            Number of pivots.
+        method : str
+            "maxmin" picks each next pivot as the instance farthest from the
+            already picked ones (starting with the first instance), "random"
+            picks them uniformly at random.
+
+    Returns
+    -------
+        (list, np.ndarray)
+            Pivot ids, array of shape (num_pivots, len(instance_ids)) with
+            the distances from each pivot to each instance.
+    """
+
+    def pivot_row(p: int) -> np.ndarray:
+        pivot_id = instance_ids[p]
+        return np.array(
+            [
+                distance(pivot_id, instance_id) if instance_id != pivot_id else 0.0
+                for instance_id in instance_ids
+            ]
+        )
+
+    pivots, pivot_distances = _select_pivot_rows(
+        len(instance_ids), pivot_row, num_pivots, method
+    )
+    return [instance_ids[p] for p in pivots], pivot_distances
+
+
+def nearest_neighbors(
+    experiment,
+    instance_id=None,
+    k: int = 5,
+    num_pivots: int = None,
+    pivot_method: str = "maxmin",
+    lower_bound: callable = None,
+    distance_id: str = None,
+) -> (dict, dict):
+    """
+    Computes the k nearest instances of an instance (or of every instance),
+    evaluating as few exact distances as possible.
+
+    Candidates are visited in the order of a lower bound on their distance
+    and the search stops once the bound exceeds the k-th best exact distance
+    found so far. The bound is the larger of the triangle inequality bound
+    via pivots, max_p |d(q, p) - d(x, p)|, and the optional `lower_bound`.
+    The result is exact if the distance is a metric and `lower_bound` never
+    exceeds the distance; otherwise it is an approximation. Distances already
+    stored in the experiment are reused.
+
+    Parameters
+    ----------
+        experiment : Experiment
+            Experiment object.
+        instance_id
+            Instance to query. If None, all instances are queried.
+        k : int
+            Number of neighbours.
+        num_pivots : int
+            Number of pivots. By default none for a single query (their
+            distances to all instances would cost more than they save) and
+            about sqrt(n) when all instances are queried.
+        pivot_method : str
+            See select_pivots.
+        lower_bound : callable
+            Cheap lower bound on the distance between two instances (called
+            with the instance objects), e.g. based on positionwise marginals.
+        distance_id : str
+            Name of the distance. By default the experiment's distance_id.
+
+    Returns
+    -------
+        (dict, dict)
+            Neighbours: instance_id -> list of (neighbour_id, distance)
+            sorted by distance; statistics: number of exact evaluations
+            ("evaluated"), number of pairs a brute-force search would need
+            ("pairs") and their difference ("avoided").
+    """
+
+    if distance_id is None:
+        distance_id = experiment.distance_id
+    known = experiment.distances if experiment.distance_id == distance_id else None
+    distance = _ExactDistances(experiment, distance_id, known)
+    instance_ids = distance.ids
+    num_instances = len(instance_ids)
+
+    queries = instance_ids if instance_id is None else [instance_id]
+    if num_pivots is None:
+        num_pivots = 0 if instance_id is not None else int(np.sqrt(num_instances))
+    pivots, pivot_distances = select_pivots(
+        instance_ids, distance, num_pivots, pivot_method
+    )
+
+    neighbors = {}
+    for query_id in queries:
+        q = distance.index[query_id]
+        bounds = np.abs(pivot_distances - pivot_distances[:, [q]]).max(
+            axis=0, initial=0.0
+        )
+        if lower_bound is not None:
+            query = experiment.instances[query_id]
+            bounds = np.maximum(
+                bounds,
+                [
+                    lower_bound(query, experiment.instances[other_id])
+                    for other_id in instance_ids
+                ],
+            )
+        # Distances that are already known need no bound
+        exact = distance.row(query_id)
+        bounds = np.where(np.isnan(exact), bounds, exact)
+
+        best = []  # max-heap of (-distance, candidate_id)
+        for x in np.argsort(bounds, kind="stable"):
+            if x == q:
+                continue
+            if len(best) == k and bounds[x] >= -best[0][0]:
+                break
+            value = distance(query_id, instance_ids[x])
+            if len(best) < k:
+                heapq.heappush(best, (-value, x))
+            elif value < -best[0][0]:
+                heapq.heapreplace(best, (-value, x))
+        neighbors[query_id] = [
+            (instance_ids[x], -value) for value, x in sorted(best, reverse=True)
+        ]
+
+    if instance_id is None:
+        num_pairs = num_instances * (num_instances - 1) // 2
+    else:
+        num_pairs = num_instances - 1
+    stats = {
+        "evaluated": distance.num_evaluations,
+        "pairs": num_pairs,
+        "avoided": num_pairs - distance.num_evaluations,
+    }
+    return neighbors, stats
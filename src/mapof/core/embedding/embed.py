@@ -5,6 +5,10 @@ import numpy as np
 
 import mapof.core.persistence.experiment_exports as exports
 import mapof.core.printing as pr
+from mapof.core.embedding.force_directed import (
+    fruchterman_reingold,
+    sparse_affinity_graph,
+)
 from mapof.core.embedding.kamada_kawai.kamada_kawai import KamadaKawai
 from mapof.core.embedding.simulated_annealing.simulated_annealing import (
     SimulatedAnnealing,
@@ -27,6 +31,110 @@ except ImportError as error:
     print(error)
 
 
+# Keyword arguments of embed passed on to fruchterman_reingold (sparse=True)
+_FRUCHTERMAN_REINGOLD_OPTIONS = ("repulsion", "seed", "threshold")
+
+# Keyword arguments of embed passed on to KamadaKawai
+_KAMADA_KAWAI_OPTIONS = ("optim_method", "num_near_pairs", "num_sampled_pairs", "seed")
+
+# Number of matrix elements processed at once by the nearest neighbours
+# selection
+_BLOCK_ELEMENTS = 2**16
+
+
+def _nearest_neighbors_mask(distances: np.ndarray, num_neighbors: int) -> np.ndarray:
+    """
+    Returns a symmetric mask of the pairs in which at least one instance is
+    among the `num_neighbors` nearest instances of the other one. NaN
+    (missing) entries, e.g. the diagonal, are treated as the farthest.
+    """
+    num_instances = len(distances)
+    if num_neighbors >= num_instances:
+        return np.ones((num_instances, num_instances), dtype=bool)
+    mask = np.zeros((num_instances, num_instances), dtype=bool)
+    if num_neighbors <= 0:
+        return mask
+    step = max(1, _BLOCK_ELEMENTS // num_instances)
+    for start in range(0, num_instances, step):
+        block = distances[start : start + step]
+        nearest = np.argpartition(block, num_neighbors - 1, axis=1)[:, :num_neighbors]
+        np.put_along_axis(mask[start : start + step], nearest, True, axis=1)
+    mask |= mask.T
+    return mask
+
+
+def _embedding_matrix(
+    distances: np.ndarray,
+    spring: bool = False,
+    radius: float = np.inf,
+    num_neighbors: int = None,
+    zero_distance: float = 1.0,
+    attraction_factor: float = 1.0,
+) -> np.ndarray:
+    """
+    Builds the symmetric matrix passed to the embedding methods.
+
+    For spring embeddings the entries are affinities: the inverse distance
+    of pairs within `radius` (and, if `num_neighbors` is given, of pairs in
+    which one instance is among the nearest neighbours of the other), and
+    zero otherwise; zero distances are replaced by `zero_distance`. For the
+    other methods the entries are the distances. In both cases the entries
+    are raised to the power `attraction_factor`. Only the upper triangle of
+    `distances` is used and the diagonal is zero.
+
+    The matrix is built in place of `distances`, so pass a copy.
+
+    Parameters
+    ----------
+        distances : np.ndarray
+            Square matrix of distances (NaN for missing values).
+        spring : bool
+            Whether to build the affinities of a spring embedding.
+        radius : float
+            Pairs farther apart get zero affinity.
+        num_neighbors : int
+            Number of nearest neighbours connected by an affinity.
+        zero_distance : float
+            Replacement for zero distances in spring embeddings.
+        attraction_factor : float
+            Exponent applied to each entry.
+
+    Returns
+    -------
+        np.ndarray
+    """
+    x = distances
+    if spring:
+        x[x == 0.0] = zero_distance
+        keep = ~(x > radius)
+        if num_neighbors is not None:
+            keep &= _nearest_neighbors_mask(x, num_neighbors)
+        np.divide(1.0, x, out=x, where=keep)
+        x[~keep] = 0.0
+    if attraction_factor != 1:
+        np.power(x, attraction_factor, out=x)
+    # Mirror the upper triangle (reading through the transposed view is safe,
+    # as only the lower triangle is written)
+    np.copyto(x, x.T, where=np.tri(len(x), k=-1, dtype=bool))
+    np.fill_diagonal(x, 0.0)
+    return x
+
+
+def _check_distances(experiment) -> None:
+    """Raises ValueError if the experiment has no distances to embed."""
+    distances = experiment.distances
+    if distances is None or (
+        len(distances) > 1 and not np.isfinite(distances.matrix).any()
+    ):
+        message = "The experiment has no distances to embed"
+        if getattr(experiment, "landmark_coordinates", None):
+            message += (
+                '; use embedding_id="landmark" to embed the coordinates '
+                "computed in the landmark mode"
+            )
+        raise ValueError(message)
+
+
 def embed(
     experiment,
     embedding_id: str = None,
@@ -45,75 +153,136 @@ def embed(
     up=None,
     right=None,
     down=None,
+    sparse: bool = False,
     **kwargs,
 ) -> None:
-    """Embeds the distances of an experiment using a given embedding method."""
+    """Embeds the distances of an experiment using a given embedding method.
+
+    With `sparse=True` the spring ("fr") embedding builds a sparse graph of
+    the pairs within `radius` / among the `num_neighbors` nearest neighbours
+    and lays it out with force_directed.fruchterman_reingold (the keyword
+    arguments `repulsion`, `seed` and `threshold` are passed to it) instead
+    of NetworkX. The graph is built from blocks of rows of the stored
+    distance matrix, so no other n x n array is allocated; the stored
+    matrix itself is still needed, but it may be memory-mapped (see
+    Experiment's lazy_distances). For "kk" only the keyword
+    arguments `optim_method`, `num_near_pairs`, `num_sampled_pairs` and
+    `seed` are passed to KamadaKawai, e.g. `optim_method="auto"` to use the
+    sampled energy for large experiments. "landmark" uses the first `dim`
+    coordinates computed by compute_distances(num_pivots=...), without
+    any distances.
+
+    Parameters
+    ----------
+        num_neighbors : int
+            Only the pairs in which one instance is among the
+            `num_neighbors` nearest instances of the other are kept (all
+            pairs if None). Also the number of neighbours of "isomap" and
+            "lle" (100 if None). With `sparse=True` it bounds the size of
+            the graph, so it (or a finite `radius`) has to be given.
+        init_pos : dict
+            Initial positions of (some of) the instances, for "kk" and
+            "simulated-annealing".
+        fixed : bool
+            Whether the instances in `init_pos` keep their positions.
+        sparse : bool
+            Use the sparse spring embedding described above (only for "fr").
+            It does not support `init_pos`.
+
+    Raises
+    ------
+        ValueError
+            If `sparse=True` is used with another embedding than "fr", with
+            `init_pos`, with unknown keyword arguments, or without
+            `num_neighbors` and a finite `radius`, or if there is nothing to
+            embed.
+    """
+
+    if sparse:
+        if embedding_id.lower() not in {"fr", "spring"}:
+            raise ValueError(
+                f"sparse=True is only supported by the spring embedding, "
+                f"not by {embedding_id}"
+            )
+        if init_pos is not None:
+            raise ValueError("init_pos is not supported with sparse=True")
+        unknown = set(kwargs) - set(_FRUCHTERMAN_REINGOLD_OPTIONS)
+        if unknown:
+            raise ValueError(
+                f"Unknown options of the sparse spring embedding: "
+                f"{', '.join(sorted(unknown))}"
+            )
+        if num_neighbors is None and radius == np.inf:
+            raise ValueError(
+                "sparse=True needs num_neighbors or a finite radius, "
+                "otherwise the graph is dense"
+            )
 
     if attraction_factor is None:
         attraction_factor = 1
         if embedding_id in {"fr", "spring"}:
             attraction_factor = 2
 
-    num_elections = len(experiment.distances)
+    landmark = embedding_id.lower() == "landmark"
+    if landmark:
+        if not getattr(experiment, "landmark_coordinates", None):
+            raise ValueError(
+                "The experiment has no landmark coordinates; compute them with "
+                "compute_distances(num_pivots=...)"
+            )
+        instance_ids = list(experiment.landmark_coordinates)
+    else:
+        _check_distances(experiment)
+        instance_ids = list(experiment.distances)
 
-    x = np.zeros((num_elections, num_elections))
+    if not sparse and not landmark:
+        distances = experiment.distances.to_array()
+        if factor != 1:
+            distances *= factor
+        x = _embedding_matrix(
+            distances,
+            spring=embedding_id in {"fr", "spring"},
+            radius=radius,
+            num_neighbors=num_neighbors,
+            zero_distance=zero_distance,
+            attraction_factor=attraction_factor,
+        )
 
     initial_positions = None
 
     if init_pos is not None:
         initial_positions = {}
-        for i, instance_id_1 in enumerate(experiment.distances):
+        for i, instance_id_1 in enumerate(instance_ids):
             if instance_id_1 in init_pos:
                 initial_positions[i] = init_pos[instance_id_1]
 
-    for i, instance_id_1 in enumerate(experiment.distances):
-        for j, instance_id_2 in enumerate(experiment.distances):
-            if i < j:
-
-                experiment.distances[instance_id_1][instance_id_2] *= factor
-                if embedding_id in {"fr", "spring"}:
-                    if experiment.distances[instance_id_1][instance_id_2] == 0.0:
-                        experiment.distances[instance_id_1][
-                            instance_id_2
-                        ] = zero_distance
-                        experiment.distances[instance_id_2][
-                            instance_id_1
-                        ] = zero_distance
-                    normal = True
-                    if experiment.distances[instance_id_1][instance_id_2] > radius:
-                        x[i][j] = 0.0
-                        normal = False
-                    if num_neighbors is not None:
-                        tmp = experiment.distances[instance_id_1]
-                        sorted_list_1 = list(
-                            (dict(sorted(tmp.items(), key=lambda item: item[1]))).keys()
-                        )
-                        tmp = experiment.distances[instance_id_2]
-                        sorted_list_2 = list(
-                            (dict(sorted(tmp.items(), key=lambda item: item[1]))).keys()
-                        )
-                        if (instance_id_1 not in sorted_list_2[0:num_neighbors]) and (
-                            instance_id_2 not in sorted_list_1[0:num_neighbors]
-                        ):
-                            x[i][j] = 0.0
-                            normal = False
-                    if normal:
-                        x[i][j] = (
-                            1.0 / experiment.distances[instance_id_1][instance_id_2]
-                        )
-                else:
-                    x[i][j] = experiment.distances[instance_id_1][instance_id_2]
-                x[i][j] = x[i][j] ** attraction_factor
-                x[j][i] = x[i][j]
-
-    dt = [("weight", float)]
-    y = x.view(dt)
-    graph = nx.from_numpy_array(y)
-
-    if num_neighbors is None:
+    if num_neighbors is None and not sparse:
         num_neighbors = 100
 
-    if embedding_id.lower() in {"fr", "spring"}:
+    if landmark:
+        # Landmark MDS coordinates are ordered by decreasing eigenvalue, so
+        # the first `dim` of them are the MDS embedding
+        my_pos = np.zeros((len(instance_ids), dim))
+        coordinates = np.array(
+            [experiment.landmark_coordinates[i] for i in instance_ids], dtype=float
+        ).reshape(len(instance_ids), -1)[:, :dim]
+        my_pos[:, : coordinates.shape[1]] = coordinates
+    elif sparse:
+        graph = sparse_affinity_graph(
+            experiment.distances.matrix,
+            radius=radius,
+            num_neighbors=num_neighbors,
+            zero_distance=zero_distance,
+            factor=factor,
+            attraction_factor=attraction_factor,
+        )
+        my_pos = fruchterman_reingold(
+            graph, dim=dim, num_iterations=num_iterations, **kwargs
+        )
+    elif embedding_id.lower() in {"fr", "spring"}:
+        dt = [("weight", float)]
+        y = x.view(dt)
+        graph = nx.from_numpy_array(y)
         my_pos = nx.spring_layout(graph, iterations=num_iterations, dim=dim, **kwargs)
     elif embedding_id.lower() in {"mds"}:
         my_pos = MDS(
@@ -141,7 +310,8 @@ def embed(
             method=method,
         ).fit_transform(x)
     elif embedding_id.lower() in {"kk", "kamada-kawai", "kamada", "kawai"}:
-        my_pos = KamadaKawai().embed(
+        options = {key: kwargs[key] for key in _KAMADA_KAWAI_OPTIONS if key in kwargs}
+        my_pos = KamadaKawai(**options).embed(
             distances=x,
             initial_positions=initial_positions,
             fix_initial_positions=fixed,
@@ -170,7 +340,7 @@ def embed(
         logging.warning("Unknown embedding method!")
 
     experiment.coordinates = {}
-    for i, instance_id in enumerate(experiment.distances):
+    for i, instance_id in enumerate(instance_ids):
         experiment.coordinates[instance_id] = [my_pos[i][d] for d in range(dim)]
 
     pr.adjust_the_map(experiment, left=left, up=up, right=right, down=down)
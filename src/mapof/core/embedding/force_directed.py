@@ -0,0 +1,253 @@
+"""
+Fruchterman-Reingold (spring) layout of a sparse affinity graph.
+
+The layout follows networkx.spring_layout, but works on a CSR matrix and
+NumPy arrays only: the attraction is summed over the edges of the graph
+and the repulsion between all pairs is either computed exactly in blocks
+(O(n^2) time, O(n) memory) or approximated on a uniform grid, where only
+the points in neighbouring cells interact exactly and farther cells act
+through their centres of mass.
+"""
+
+import numpy as np
+from scipy import sparse
+
+# Number of matrix elements processed at once
+_BLOCK_ELEMENTS = 2**16
+
+
+def sparse_affinity_graph(
+    distances: np.ndarray,
+    radius: float = np.inf,
+    num_neighbors: int = None,
+    zero_distance: float = 1.0,
+    factor: float = 1.0,
+    attraction_factor: float = 2.0,
+) -> sparse.csr_matrix:
+    """
+    Builds the affinity graph of a spring embedding as a sparse matrix.
+
+    Two instances are connected if their distance is at most `radius` and,
+    if `num_neighbors` is given, one of them is among the `num_neighbors`
+    nearest instances of the other. The weight of an edge is the inverse
+    distance raised to the power `attraction_factor`, as in the dense
+    matrix built by embed.embed. The distance matrix is read in blocks of
+    rows and is not copied.
+
+    Parameters
+    ----------
+        distances : np.ndarray
+            Square matrix of distances (NaN for missing values). Only blocks
+            of rows and single entries are read, so it may be a
+            memory-mapped array.
+        radius : float
+            Pairs farther apart are not connected.
+        num_neighbors : int
+            Number of nearest neighbours of each instance that are connected.
+        zero_distance : float
+            Replacement for zero distances.
+        factor : float
+            Factor by which the distances are multiplied.
+        attraction_factor : float
+            Exponent applied to the inverse distances.
+
+    Returns
+    -------
+        sparse.csr_matrix
+            Symmetric matrix of the weights.
+    """
+    num_instances = len(distances)
+    step = max(1, _BLOCK_ELEMENTS // max(num_instances, 1))
+    rows = []
+    cols = []
+    for start in range(0, num_instances, step):
+        block = distances[start : start + step] * factor
+        block[block == 0.0] = zero_distance
+        block_rows = np.arange(start, start + len(block))
+        if num_neighbors is not None:
+            # Directed edges to the nearest neighbours, symmetrized below
+            k = min(num_neighbors, num_instances - 1)
+            if k <= 0:
+                continue
+            block[np.arange(len(block)), block_rows] = np.nan
+            nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+            rows.append(np.repeat(block_rows, k))
+            cols.append(nearest.ravel())
+        else:
+            # Pairs within the radius (upper triangle, mirrored below)
+            i, j = np.nonzero(~(block > radius))
+            upper = j > block_rows[i]
+            rows.append(block_rows[i[upper]])
+            cols.append(j[upper])
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+    pattern = sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(num_instances, num_instances)
+    ).tocsr()
+    pattern = (pattern + pattern.T).tocoo()
+
+    # Weights of the (deduplicated) symmetric pattern, taken from the upper
+    # triangle of the distances
+    i, j = pattern.row, pattern.col
+    values = distances[np.minimum(i, j), np.maximum(i, j)] * factor
+    values[values == 0.0] = zero_distance
+    keep = (i != j) & (values <= radius)
+    weights = (1.0 / values[keep]) ** attraction_factor
+    return sparse.csr_matrix(
+        (weights, (i[keep], j[keep])), shape=(num_instances, num_instances)
+    )
+
+
+def _pairwise_repulsion(
+    positions: np.ndarray, others: np.ndarray, weights: np.ndarray, k2: float
+) -> np.ndarray:
+    """Repulsion on `positions` from `others` (with multiplicities `weights`)."""
+    force = np.zeros_like(positions)
+    step = max(1, _BLOCK_ELEMENTS // max(len(others), 1))
+    for start in range(0, len(positions), step):
+        delta = positions[start : start + step, None, :] - others[None, :, :]
+        distance = np.sqrt(np.einsum("ijk,ijk->ij", delta, delta))
+        np.maximum(distance, 0.01, out=distance)
+        coefficients = weights * k2 / distance**2
+        force[start : start + step] = np.einsum("ijk,ij->ik", delta, coefficients)
+    return force
+
+
+def _exact_repulsion(positions: np.ndarray, k2: float) -> np.ndarray:
+    return _pairwise_repulsion(positions, positions, np.ones(len(positions)), k2)
+
+
+def _grid_repulsion(positions: np.ndarray, k2: float) -> np.ndarray:
+    """
+    Approximates the repulsion on a uniform grid with about sqrt(n) cells.
+    Points in the same or adjacent cells repel each other exactly; the other
+    cells act as single points at their centres of mass, weighted by the
+    number of their points.
+    """
+    num_points, dim = positions.shape
+    cells_per_axis = max(1, int(round(num_points ** (0.5 / dim))))
+    low = positions.min(axis=0)
+    span = positions.max(axis=0) - low
+    span[span == 0] = 1.0
+    cell_coordinates = np.minimum(
+        ((positions - low) / span * cells_per_axis).astype(int), cells_per_axis - 1
+    )
+    shape = (cells_per_axis,) * dim
+    cell_ids = np.ravel_multi_index(cell_coordinates.T, shape)
+
+    order = np.argsort(cell_ids, kind="stable")
+    counts = np.bincount(cell_ids, minlength=cells_per_axis**dim)
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    occupied = np.flatnonzero(counts)
+    centers = (
+        np.stack(
+            [np.bincount(cell_ids, positions[:, d], len(counts)) for d in range(dim)],
+            axis=1,
+        )[occupied]
+        / counts[occupied, None]
+    )
+    occupied_coordinates = np.stack(np.unravel_index(occupied, shape), axis=1)
+
+    force = np.zeros_like(positions)
+    for cell, coordinates in zip(occupied, occupied_coordinates):
+        members = order[starts[cell] : starts[cell + 1]]
+        near = np.abs(occupied_coordinates - coordinates).max(axis=1) <= 1
+        near_points = np.concatenate(
+            [order[starts[c] : starts[c + 1]] for c in occupied[near]]
+        )
+        force[members] = _pairwise_repulsion(
+            positions[members], positions[near_points], np.ones(len(near_points)), k2
+        )
+        if not near.all():
+            force[members] += _pairwise_repulsion(
+                positions[members], centers[~near], counts[occupied[~near]], k2
+            )
+    return force
+
+
+_REPULSIONS = {"exact": _exact_repulsion, "grid": _grid_repulsion}
+
+
+def fruchterman_reingold(
+    graph: sparse.spmatrix,
+    dim: int = 2,
+    num_iterations: int = 50,
+    repulsion: str = "grid",
+    initial_positions: np.ndarray = None,
+    seed: int = None,
+    threshold: float = 1e-4,
+) -> np.ndarray:
+    """
+    Computes a Fruchterman-Reingold layout of a weighted graph.
+
+    Each iteration moves every vertex by the sum of the attraction along
+    its edges (proportional to the weight and the squared distance) and the
+    repulsion from all the other vertices, with a step bounded by a linearly
+    decreasing temperature, as in networkx.spring_layout.
+
+    Parameters
+    ----------
+        graph : sparse.spmatrix
+            Symmetric matrix of the weights of the edges.
+        dim : int
+            Dimension of the layout.
+        num_iterations : int
+            Maximal number of iterations.
+        repulsion : str
+            "grid" (approximate, about O(n^1.5) per iteration) or "exact"
+            (O(n^2) per iteration).
+        initial_positions : np.ndarray
+            Array of shape (n, dim). By default random in the unit cube.
+        seed : int
+            Seed of the random initial positions.
+        threshold : float
+            The iterations stop once the average move is below it.
+
+    Returns
+    -------
+        np.ndarray
+            Array of shape (n, dim), centred and scaled to [-1, 1].
+    """
+    if repulsion not in _REPULSIONS:
+        raise ValueError(f"Unknown repulsion method: {repulsion}")
+    repulsion = _REPULSIONS[repulsion]
+
+    graph = sparse.coo_matrix(graph)
+    num_vertices = graph.shape[0]
+    if initial_positions is None:
+        positions = np.random.default_rng(seed).random((num_vertices, dim))
+    else:
+        positions = np.array(initial_positions, dtype=float)
+    if num_vertices <= 1:
+        return np.zeros((num_vertices, dim))
+
+    k = np.sqrt(1.0 / num_vertices)
+    temperature = 0.1 * np.max(positions.max(axis=0) - positions.min(axis=0))
+    cooling = temperature / (num_iterations + 1)
+    rows, cols, weights = graph.row, graph.col, graph.data
+
+    for _ in range(num_iterations):
+        displacement = repulsion(positions, k * k)
+
+        delta = positions[rows] - positions[cols]
+        distance = np.maximum(np.sqrt(np.einsum("ij,ij->i", delta, delta)), 0.01)
+        attraction = delta * (weights * distance / k)[:, None]
+        for d in range(dim):
+            displacement[:, d] -= np.bincount(
+                rows, attraction[:, d], minlength=num_vertices
+            )
+
+        length = np.sqrt(np.einsum("ij,ij->i", displacement, displacement))
+        length = np.where(length < 0.01, 0.1, length)
+        step = displacement * (temperature / length)[:, None]
+        positions += step
+        temperature -= cooling
+        if np.linalg.norm(step) / num_vertices < threshold:
+            break
+
+    positions -= positions.mean(axis=0)
+    scale = np.abs(positions).max()
+    if scale > 0:
+        positions /= scale
+    return positions
@@ -194,6 +194,186 @@ def get_energy_dy_dx(x, y, k, l, positions):
     return get_energy_dx_dy(x, y, k, l, positions)
 
 
+def sample_pairs(l, num_near_pairs=20, num_sampled_pairs=40, seed=None):
+    """
+    Selects the pairs of vertices used by the sampled energy.
+
+    Each vertex i is paired with its `num_near_pairs` nearest vertices (by
+    the target distances `l`), which are kept exactly, and with
+    `num_sampled_pairs` vertices drawn uniformly at random; draws that hit
+    a near vertex are dropped and the remaining ones are weighted by
+    (n - 1) / num_sampled_pairs, so that the sum over the pairs of each
+    vertex is an unbiased estimate of the sum over all other vertices. If
+    there are few vertices, all pairs are used with weight one.
+
+    :param l: matrix nxn of target distances
+    :param num_near_pairs: number of nearest vertices paired with each vertex
+    :param num_sampled_pairs: number of random vertices paired with each vertex
+    :param seed: seed of the random sample
+    :return: (rows, cols, weights) of the directed pairs
+    """
+    num_vertices = l.shape[0]
+    if num_vertices - 1 <= num_near_pairs + num_sampled_pairs:
+        rows, cols = np.nonzero(~np.eye(num_vertices, dtype=bool))
+        return rows, cols, np.ones(len(rows))
+
+    lengths = np.array(l, dtype=float)
+    np.fill_diagonal(lengths, np.inf)
+    near = np.argpartition(lengths, num_near_pairs - 1, axis=1)[:, :num_near_pairs]
+
+    rng = np.random.default_rng(seed)
+    # Uniform over the other vertices: shift the draws that hit the vertex
+    sampled = rng.integers(0, num_vertices - 1, size=(num_vertices, num_sampled_pairs))
+    sampled += sampled >= np.arange(num_vertices)[:, None]
+    is_near = (sampled[:, :, None] == near[:, None, :]).any(axis=2)
+
+    rows = np.concatenate(
+        [
+            np.repeat(np.arange(num_vertices), num_near_pairs),
+            np.repeat(np.arange(num_vertices), num_sampled_pairs)[~is_near.ravel()],
+        ]
+    )
+    cols = np.concatenate([near.ravel(), sampled[~is_near]])
+    weights = np.concatenate(
+        [
+            np.ones(near.size),
+            np.full(np.count_nonzero(~is_near), (num_vertices - 1) / num_sampled_pairs),
+        ]
+    )
+    return rows, cols, weights
+
+
+def get_sampled_energy(positions, pairs, special_pos=None):
+    """
+    Estimate of get_total_energy from a set of directed pairs.
+
+    :param positions: positions of the vertices
+    :param pairs: (rows, cols, coefficients, lengths) with the coefficients
+        k * weight / 2 and the target distances of the pairs
+    :param special_pos: unused, for the signature of get_total_energy
+    :return: energy
+    """
+    rows, cols, coefficients, lengths = pairs
+    delta = positions[rows] - positions[cols]
+    distance = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+    return np.sum(coefficients * (distance - lengths) ** 2) / 2
+
+
+def get_sampled_energy_dxy(positions, pairs, special_pos=None):
+    """
+    Gradient of get_sampled_energy.
+
+    :param positions: positions of the vertices
+    :param pairs: see get_sampled_energy
+    :param special_pos: indexes of the vertices with zero gradient
+    :return: [E/dx, E/dy]
+    """
+    rows, cols, coefficients, lengths = pairs
+    delta = positions[rows] - positions[cols]
+    distance = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+    scale = coefficients * (1 - lengths / np.maximum(distance, 1e-5))
+    forces = delta * scale[:, None]
+
+    num_vertices = positions.shape[0]
+    gradient = np.empty_like(positions)
+    for d in range(positions.shape[1]):
+        gradient[:, d] = np.bincount(
+            rows, forces[:, d], minlength=num_vertices
+        ) - np.bincount(cols, forces[:, d], minlength=num_vertices)
+    if special_pos is not None:
+        gradient[special_pos] = 0
+    return gradient
+
+
+def get_total_energy_in_blocks(positions, k, l, block_size=256):
+    """
+    Same as get_total_energy, but computed for blocks of rows, so only
+    block_size x n temporary arrays are needed.
+    """
+    num_vertices = positions.shape[0]
+    energy = 0.0
+    for start in range(0, num_vertices, block_size):
+        stop = min(start + block_size, num_vertices)
+        delta = positions[start:stop, np.newaxis, :] - positions[np.newaxis, :, :]
+        distance = np.sqrt(np.einsum("ijk,ijk->ij", delta, delta))
+        matrix = k[start:stop] * (distance - l[start:stop]) ** 2 / 2
+        # Upper triangle only
+        matrix[np.tri(stop - start, num_vertices, start, dtype=bool)] = 0
+        energy += matrix.sum()
+    return energy
+
+
+class EnergyWorkspace:
+    """
+    Fused computation of get_total_energy and get_total_energy_dxy.
+
+    The coefficients k and the target distances l of the pairs i < j are
+    stored once as vectors (the matrices are symmetric) together with the
+    buffers for the coordinate differences and the distances of the pairs,
+    so evaluating the energy and its gradient at new positions computes
+    every difference once and allocates only the n x dim gradient.
+
+    :param k: symmetric matrix nxn of coefficients
+    :param l: symmetric matrix nxn of target distances
+    :param special_pos: indexes of the vertices with zero gradient
+    :param dim: number of columns of the positions
+    """
+
+    def __init__(self, k, l, special_pos=None, dim=2):
+        num_vertices = k.shape[0]
+        self.num_vertices = num_vertices
+        self.special_pos = special_pos
+        self.rows, self.cols = np.triu_indices(num_vertices, 1)
+        self.k = k[self.rows, self.cols]
+        self.l = l[self.rows, self.cols]
+
+        num_pairs = len(self.rows)
+        self._coordinates = np.empty(num_vertices)
+        self._delta = np.empty((dim, num_pairs))
+        self._distance = np.empty(num_pairs)
+        self._buffer = np.empty(num_pairs)
+
+    def energy_and_gradient(self, positions):
+        """
+        :param positions: positions of the vertices
+        :return: (energy, [E/dx, E/dy])
+        """
+        delta, distance, buffer = self._delta, self._distance, self._buffer
+
+        distance.fill(0)
+        for d in range(delta.shape[0]):
+            self._coordinates[:] = positions[:, d]
+            np.take(self._coordinates, self.rows, out=delta[d])
+            np.subtract(
+                delta[d],
+                np.take(self._coordinates, self.cols, out=buffer),
+                out=delta[d],
+            )
+            np.multiply(delta[d], delta[d], out=buffer)
+            distance += buffer
+        np.sqrt(distance, out=distance)
+
+        np.subtract(distance, self.l, out=buffer)
+        np.multiply(buffer, buffer, out=buffer)
+        energy = np.dot(self.k, buffer) / 2
+
+        # Scale of the difference vectors: k * (1 - l / distance)
+        np.maximum(distance, 1e-5, out=distance)
+        np.divide(self.l, distance, out=buffer)
+        np.subtract(1, buffer, out=buffer)
+        buffer *= self.k
+
+        gradient = np.empty((self.num_vertices, delta.shape[0]))
+        for d in range(delta.shape[0]):
+            delta[d] *= buffer
+            gradient[:, d] = np.bincount(
+                self.rows, delta[d], minlength=self.num_vertices
+            ) - np.bincount(self.cols, delta[d], minlength=self.num_vertices)
+        if self.special_pos is not None:
+            gradient[self.special_pos] = 0
+        return energy, gradient
+
+
 def _upper_tri_sum(matrix):
     return np.triu(matrix, 1).sum()
 
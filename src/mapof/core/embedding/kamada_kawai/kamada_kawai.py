@@ -1,3 +1,5 @@
+import functools
+import logging
 import time
 
 import numpy as np
@@ -8,18 +10,27 @@ from mapof.core.embedding.initial_positions import (
     initial_place_points,
 )
 from mapof.core.embedding.kamada_kawai.energy_functions import (
+    EnergyWorkspace,
     _close_zero,
+    get_sampled_energy,
+    get_sampled_energy_dxy,
     get_total_energy,
     get_total_energy_dxy,
+    get_total_energy_in_blocks,
+    sample_pairs,
 )
 from mapof.core.embedding.kamada_kawai.optimization_algorithms import (
     optimize_bb,
+    smacof,
     _get_delta_energy,
     _optimize_newton,
     adam,
     _get_pos_k_l_x_y_for_i,
 )
 
+# Number of vertices from which optim_method="auto" uses "bb-sampled"
+_SAMPLED_MIN_VERTICES = 500
+
 
 class KamadaKawai:
     def __init__(
@@ -29,12 +40,36 @@ class KamadaKawai:
         optim_method="bb",
         initial_positions_algorithm="circumference",
         epsilon=0.00001,
+        num_near_pairs=20,
+        num_sampled_pairs=40,
+        seed=None,
     ):
+        """
+        :param optim_method: "bb" (Barzilai-Borwein), "adam", "kk" (Newton
+            steps for single vertices), "bb-sampled" (Barzilai-Borwein on
+            an estimate of the energy from the pairs of each vertex with its
+            num_near_pairs nearest vertices and num_sampled_pairs random
+            vertices; O(n * (num_near_pairs + num_sampled_pairs)) per
+            iteration instead of O(n^2)), "smacof" (stress majorization;
+            monotone, usually converges in tens of iterations) or "auto"
+            ("bb-sampled" from 500 vertices, "bb" below).
+            "bb-sampled" pays off only for large inputs: at 300 vertices it
+            is no faster than "bb" and its final energy is a few percent
+            higher, at 600 vertices it is about 2x and at 1000 about 3x
+            faster
+        :param seed: seed of the pairs sampled by "bb-sampled"
+        """
         self.special_k = special_k
         self.epsilon = epsilon
         self.max_neighbour_distance_percentage = max_neighbour_distance_percentage
         self.optim_method = optim_method
         self.initial_positions_algorithm = initial_positions_algorithm
+        self.num_near_pairs = num_near_pairs
+        self.num_sampled_pairs = num_sampled_pairs
+        self.seed = seed
+        # Filled by embed for "bb-sampled": the sampled and the exact energy
+        # of the final positions
+        self.energy_report = None
 
     def embed(
         self,
@@ -57,25 +92,38 @@ class KamadaKawai:
         k = _calc_k_with_special_value(
             distances, self.special_k, fixed_positions_indexes
         )
+        optim_method = self.optim_method
+        if optim_method == "auto":
+            optim_method = (
+                "bb-sampled" if len(distances) >= _SAMPLED_MIN_VERTICES else "bb"
+            )
         optim_method_to_fun = {
             "kk": _get_positions_kk,
             "bb": _get_positions_bb,
             "adam": _get_positions_adam,
+            "smacof": _get_positions_smacof,
         }
+        if optim_method == "bb-sampled":
+            pairs = sample_pairs(
+                distances, self.num_near_pairs, self.num_sampled_pairs, self.seed
+            )
+            optim_method_to_fun["bb-sampled"] = functools.partial(
+                _get_positions_bb_sampled, pairs=pairs
+            )
 
         positions = initial_place_points(
             distances, initial_positions, self.initial_positions_algorithm
         )
 
         start_time = time.time()
-        positions = optim_method_to_fun[self.optim_method](
+        positions = optim_method_to_fun[optim_method](
             distances, k, positions, fixed_positions_indexes
         )
 
         k = _calc_k_with_special_value(distances, 1, fixed_positions_indexes)
         # print("MIDDLE ENERGY:", get_total_energy(positions, k, distances), "TIME:", time.time() - start_time)
 
-        positions = optim_method_to_fun[self.optim_method](
+        positions = optim_method_to_fun[optim_method](
             distances, k, positions, fixed_positions_indexes
         )
 
@@ -86,11 +134,24 @@ class KamadaKawai:
                 k, distances, self.max_neighbour_distance_percentage
             )
 
-            positions = optim_method_to_fun[self.optim_method](
+            positions = optim_method_to_fun[optim_method](
                 distances, k, positions, fixed_positions_indexes
             )
             # print("Last adjustments:", get_total_energy(positions, k, distances), "TIME:", time.time() - start_time)
 
+        if optim_method == "bb-sampled":
+            sampled_energy = get_sampled_energy(
+                positions, _pairs_with_coefficients(pairs, k, distances)
+            )
+            exact_energy = get_total_energy_in_blocks(positions, k, distances)
+            self.energy_report = {
+                "sampled_energy": sampled_energy,
+                "exact_energy": exact_energy,
+                "relative_error": abs(sampled_energy - exact_energy)
+                / max(exact_energy, 1e-12),
+            }
+            logging.info(f"Kamada-Kawai sampled energy: {self.energy_report}")
+
         return positions
 
 
@@ -132,10 +193,34 @@ def _get_positions_kk(
 
 def _get_positions_bb(distances, k, positions, fixed_positions_indexes):
     pos_copy = np.copy(positions)
+    workspace = EnergyWorkspace(k, distances, fixed_positions_indexes)
     new_positions = optimize_bb(
-        get_total_energy,
-        get_total_energy_dxy,
-        args=(k, distances, fixed_positions_indexes),
+        None,
+        None,
+        args=(),
+        x0=pos_copy,
+        max_iter=int(1e5),
+        init_step_size=1e-3,
+        max_iter_without_improvement=1000,
+        min_improvement_percentage=0.001,
+        percentage_lookup_history=1000,
+        fused_func=workspace.energy_and_gradient,
+    )
+
+    return new_positions
+
+
+def _pairs_with_coefficients(pairs, k, distances):
+    rows, cols, weights = pairs
+    return rows, cols, k[rows, cols] * weights / 2, distances[rows, cols]
+
+
+def _get_positions_bb_sampled(distances, k, positions, fixed_positions_indexes, pairs):
+    pos_copy = np.copy(positions)
+    new_positions = optimize_bb(
+        get_sampled_energy,
+        get_sampled_energy_dxy,
+        args=(_pairs_with_coefficients(pairs, k, distances), fixed_positions_indexes),
         x0=pos_copy,
         max_iter=int(1e5),
         init_step_size=1e-3,
@@ -147,6 +232,10 @@ def _get_positions_bb(distances, k, positions, fixed_positions_indexes):
     return new_positions
 
 
+def _get_positions_smacof(distances, k, positions, fixed_positions_indexes):
+    return smacof(k, distances, positions, fixed_positions_indexes)
+
+
 def _get_positions_adam(distances, k, positions, fixed_positions_indexes):
     pos_copy = np.copy(positions)
     new_positions = adam(
@@ -1,6 +1,8 @@
 import collections
 
 import numpy as np
+from scipy.linalg import LinAlgError, cho_factor, cho_solve
+from scipy.spatial.distance import cdist
 
 from mapof.core.embedding.kamada_kawai.energy_functions import (
     get_energy_dx,
@@ -23,7 +25,26 @@ def optimize_bb(
     max_iter_without_improvement=8000,
     min_improvement_percentage=1.0,
     percentage_lookup_history=100,
+    fused_func=None,
 ):
+    """
+    Barzilai-Borwein gradient descent.
+
+    The energy and the gradient are given either by func and grad_func, or
+    by fused_func returning both (e.g. EnergyWorkspace.energy_and_gradient),
+    which is then evaluated once per iteration; func and grad_func must be
+    None in the latter case.
+    """
+    if fused_func is None:
+        if not callable(func) or not callable(grad_func):
+            raise ValueError("func and grad_func must be callables")
+
+        def fused_func(x, *args):
+            return func(x, *args), grad_func(x, *args)
+
+    elif func is not None or grad_func is not None:
+        raise ValueError("Give either fused_func or func and grad_func")
+
     if isinstance(init_step_size, float):
         init_step_size = [init_step_size, init_step_size]
 
@@ -32,7 +53,7 @@ def optimize_bb(
 
     prev_x = x0.copy()
     x = x0.copy()
-    prev_grad = grad_func(prev_x, *args)
+    prev_grad = None
 
     min_energy = 1e15
     min_energy_snap = x0.copy()
@@ -44,7 +65,7 @@ def optimize_bb(
         # if i%100 == 0:
         #     print(f'{i} iterations')
 
-        current_energy = func(x, *args)
+        current_energy, g = fused_func(x, *args)
         if current_energy < min_energy:
             if len(energy_history) == percentage_lookup_history:
                 percentage = current_energy / min_energy
@@ -62,10 +83,9 @@ def optimize_bb(
         if stop_energy_val is not None and current_energy < stop_energy_val:
             return min_energy_snap
         s = x - prev_x
-        g = grad_func(x, *args)
-        y = g - prev_grad
 
         if i > 0:
+            y = g - prev_grad
             denominator = abs(np.tensordot(s, y, [0, 0]))
             if is_2d:
                 denominator = denominator.diagonal()
@@ -81,6 +101,84 @@ def optimize_bb(
     return min_energy_snap
 
 
+def smacof(weights, l, x0, fixed_indexes=None, max_iter=1000, epsilon=1e-5):
+    """
+    Minimizes the weighted stress sum_{i<j} w_ij (|x_i - x_j| - l_ij)^2 / 2
+    (the Kamada-Kawai energy with weights k) by stress majorization.
+
+    Each iteration replaces the positions of the free vertices with the
+    minimum of a quadratic majorant of the stress at the current positions
+    (the Guttman transform), so the stress never increases. The matrix of
+    the majorants does not depend on the positions and is factorized once;
+    an iteration is a single product of the n x n matrix of weighted ratios
+    l_ij / |x_i - x_j| with the positions and a solve with the factor.
+
+    :param weights: symmetric matrix nxn of the weights (e.g. k)
+    :param l: matrix nxn of target distances
+    :param x0: initial positions, array n x dim
+    :param fixed_indexes: indexes of vertices whose positions do not change
+    :param max_iter: maximal number of iterations
+    :param epsilon: the iterations stop when the stress decreases by less
+        than this fraction
+    :return: positions
+    """
+    x = np.array(x0, dtype=float)
+    num_vertices = x.shape[0]
+    weights = np.array(weights, dtype=float)
+    np.fill_diagonal(weights, 0)
+    weighted_l = weights * l
+
+    # Laplacian of the weights
+    laplacian = -weights
+    np.fill_diagonal(laplacian, weights.sum(axis=1))
+
+    fixed = np.zeros(num_vertices, dtype=bool)
+    if fixed_indexes is not None and len(fixed_indexes) > 0:
+        fixed[list(fixed_indexes)] = True
+    free = ~fixed
+    if not free.any():
+        return x
+
+    if fixed.any():
+        system = laplacian[np.ix_(free, free)]
+        coupling = laplacian[np.ix_(free, fixed)] @ x[fixed]
+    else:
+        # The positions are determined up to a translation; adding a
+        # constant matrix makes the system regular without changing the
+        # solution for right-hand sides with zero column sums
+        system = laplacian + 1.0 / num_vertices
+        coupling = 0.0
+    try:
+        factor = cho_factor(system)
+    except LinAlgError:
+        # E.g. a disconnected graph of non-zero weights
+        factor = None
+        pseudo_inverse = np.linalg.pinv(system)
+
+    previous_stress = None
+    for _ in range(max_iter):
+        distances = cdist(x, x)
+        stress = np.sum(weights * (distances - l) ** 2) / 4
+        if (
+            previous_stress is not None
+            and previous_stress - stress <= epsilon * previous_stress
+        ):
+            break
+        previous_stress = stress
+
+        ratios = np.divide(
+            weighted_l, distances, out=np.zeros_like(distances), where=distances > 0
+        )
+        guttman = ratios.sum(axis=1)[:, np.newaxis] * x - ratios @ x
+        rhs = guttman[free] - coupling
+        if factor is not None:
+            x[free] = cho_solve(factor, rhs)
+        else:
+            x[free] = pseudo_inverse @ rhs
+
+    return x
+
+
 def _get_delta_energy(positions, k, l, x, y):
     return np.sqrt(
         get_energy_dx(x, y, k, l, positions) ** 2
@@ -1,21 +1,21 @@
 import numpy as np
 
+from mapof.core.objects.DistanceMatrix import as_distance_matrix
 from mapof.core.objects.Experiment import Experiment
 
 
 def extract_selected_distances(experiment: Experiment, election_ids: list[str]):
-    n = len(election_ids)
-
-    distances = np.zeros(shape=(n, n))
-    for i in range(n):
-        for j in range(i + 1, n):
-            election_id_1 = election_ids[i]
-            election_id_2 = election_ids[j]
-            distances[i, j] = distances[j, i] = experiment.distances[election_id_1][
-                election_id_2
-            ]
-
-    return distances
+    distances = as_distance_matrix(experiment.distances)
+    array = distances.to_array(election_ids)
+    np.fill_diagonal(array, 0.0)
+    missing = np.argwhere(np.isnan(array))
+    if len(missing) > 0:
+        i, j = missing[0]
+        raise ValueError(
+            f"Distance between {election_ids[i]} and {election_ids[j]} is missing "
+            f"({len(missing) // 2} selected pairs are missing)"
+        )
+    return array
 
 
 def extract_selected_coordinates(coordinates: list, election_ids: list[str]):
@@ -1,8 +1,18 @@
-import gurobipy as gp
+import itertools
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from gurobipy import GRB
 from scipy.optimize import linear_sum_assignment
 
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = None
+    GRB = None
+
 
 def solve_matching_vectors(cost_table: list[list]) -> (float, list):
     """
@@ -23,8 +33,380 @@ def solve_matching_vectors(cost_table: list[list]) -> (float, list):
     return cost_table[row_ind, col_ind].sum(), list(col_ind)
 
 
+# Cost tables up to this size are solved by checking all permutations at
+# once, which for tiny tables is faster than one solver call per table
+_MAX_ENUMERATED_LENGTH = 5
+
+
+def _solve_by_enumeration(cost_tables: np.ndarray) -> (np.ndarray, np.ndarray):
+    length = cost_tables.shape[1]
+    permutations = np.array(list(itertools.permutations(range(length))), dtype=int)
+    permutations = permutations.reshape(-1, length)
+
+    objectives = np.empty(len(cost_tables))
+    matchings = np.empty((len(cost_tables), length), dtype=int)
+    chunk_size = max(1, 2**20 // len(permutations))
+    for start in range(0, len(cost_tables), chunk_size):
+        chunk = cost_tables[start : start + chunk_size]
+        values = np.zeros((len(chunk), len(permutations)))
+        for row in range(length):
+            values += chunk[:, row, permutations[:, row]]
+        best = values.argmin(axis=1)
+        objectives[start : start + chunk_size] = values[np.arange(len(chunk)), best]
+        matchings[start : start + chunk_size] = permutations[best]
+    return objectives, matchings
+
+
+def _solve_by_assignment(cost_tables: np.ndarray) -> (np.ndarray, np.ndarray):
+    objectives = np.empty(len(cost_tables))
+    matchings = np.empty(cost_tables.shape[:2], dtype=int)
+    for i, cost_table in enumerate(cost_tables):
+        row_ind, col_ind = linear_sum_assignment(cost_table)
+        objectives[i] = cost_table[row_ind, col_ind].sum()
+        matchings[i] = col_ind
+    return objectives, matchings
+
+
+def _solve_chunk(cost_tables: np.ndarray) -> (np.ndarray, np.ndarray):
+    num_rows, num_cols = cost_tables.shape[1:]
+    if num_rows == num_cols and num_rows <= _MAX_ENUMERATED_LENGTH:
+        return _solve_by_enumeration(cost_tables)
+    return _solve_by_assignment(cost_tables)
+
+
+def solve_matching_vectors_batch(
+    cost_tables: np.ndarray, num_processes: int = 1
+) -> (np.ndarray, np.ndarray):
+    """
+    Computes linear sum assignments for a stack of cost tables.
+
+    Small square tables are solved all at once by evaluating every
+    permutation; larger ones with one assignment per table, split between
+    processes if num_processes > 1. Objective values are the same as those
+    of solve_matching_vectors; in case of ties, another optimal matching
+    may be returned.
+
+    Parameters
+    ----------
+        cost_tables : np.ndarray
+            Array of shape (k, m, n) with m <= n.
+        num_processes : int
+            Number of processes.
+    Returns
+    -------
+        (np.ndarray, np.ndarray)
+            Objective values (shape (k,)), optimal matchings (shape (k, m)).
+    """
+
+    cost_tables = np.asarray(cost_tables, dtype=float)
+    if num_processes <= 1 or len(cost_tables) < 2 * num_processes:
+        return _solve_chunk(cost_tables)
+
+    chunks = np.array_split(cost_tables, num_processes * 4)
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        results = list(executor.map(_solve_chunk, chunks))
+    return (
+        np.concatenate([objectives for objectives, _ in results]),
+        np.concatenate([matchings for _, matchings in results]),
+    )
+
+
+def _pairwise_cost_tensor(matrix_1, matrix_2, inner_distance: callable) -> np.ndarray:
+    # cost[k, l, i, j] is the cost of matching entry (k, i) of the first
+    # matrix with entry (l, j) of the second one. The inner distance is
+    # evaluated once per pair of distinct values; diagonal entries cost 0.
+    matrix_1 = np.asarray(matrix_1)
+    matrix_2 = np.asarray(matrix_2)
+    values_1, codes_1 = np.unique(matrix_1, return_inverse=True)
+    values_2, codes_2 = np.unique(matrix_2, return_inverse=True)
+    table = np.array(
+        [
+            [
+                np.sum(inner_distance(np.array([value_1]), np.array([value_2])))
+                for value_2 in values_2
+            ]
+            for value_1 in values_1
+        ],
+        dtype=float,
+    )
+    codes_1 = codes_1.reshape(matrix_1.shape)
+    codes_2 = codes_2.reshape(matrix_2.shape)
+    cost = table[
+        codes_1[:, np.newaxis, :, np.newaxis], codes_2[np.newaxis, :, np.newaxis, :]
+    ]
+
+    length = len(matrix_1)
+    diagonal = np.eye(length, dtype=bool)
+    cost[
+        diagonal[:, np.newaxis, :, np.newaxis] | diagonal[np.newaxis, :, np.newaxis, :]
+    ] = 0
+    return cost
+
+
+def _permutation_cost(cost: np.ndarray, permutation: np.ndarray) -> float:
+    # Objective value of matching row/column k with row/column permutation[k]
+    length = len(permutation)
+    rows = np.arange(length)
+    return float(
+        cost[
+            rows[:, np.newaxis],
+            permutation[:, np.newaxis],
+            rows[np.newaxis, :],
+            permutation[np.newaxis, :],
+        ].sum()
+    )
+
+
+def _linear_assignment_heuristic(cost: np.ndarray) -> np.ndarray:
+    # Matches row/column k with l at the cost of matching each entry of row
+    # and column k with the best entry of row and column l, which ignores
+    # consistency between different rows.
+    length = len(cost)
+    if length == 0:
+        return np.zeros(0, dtype=int)
+    linear_cost = cost.min(axis=3).sum(axis=2) + cost.min(axis=1).sum(axis=0)
+    return linear_sum_assignment(linear_cost)[1]
+
+
+def _solve_with_gurobi(
+    cost: np.ndarray, warm_start: np.ndarray, time_limit: float = None
+) -> float:
+    # Binary quadratic program over the n x n assignment matrix X:
+    # minimize vec(X)^T C vec(X) subject to X being a permutation matrix
+    length = len(cost)
+    with gp.Env(empty=True) as env:
+        env.setParam("OutputFlag", 0)
+        env.start()
+        with gp.Model(env=env) as m:
+            if time_limit is not None:
+                m.setParam("TimeLimit", time_limit)
+            x = m.addMVar((length, length), vtype=GRB.BINARY)
+            m.addConstr(x.sum(axis=1) == 1)
+            m.addConstr(x.sum(axis=0) == 1)
+            vector = x.reshape(-1)
+            m.setObjective(
+                vector @ cost.reshape(length * length, length * length) @ vector,
+                GRB.MINIMIZE,
+            )
+            start = np.zeros((length, length))
+            start[np.arange(length), warm_start] = 1
+            x.Start = start
+            m.optimize()
+
+            if m.status == GRB.OPTIMAL:
+                return m.objVal
+            if m.SolCount > 0:
+                logging.warning(
+                    f"Gurobi stopped with status {m.status}; the returned "
+                    f"distance may not be optimal"
+                )
+                return m.objVal
+            raise RuntimeError(f"Gurobi found no solution (status {m.status})")
+
+
+def _bound_costs(cost: np.ndarray, permutation: np.ndarray):
+    # Gilmore-Lawler type bound for a partial permutation (-1 = unassigned):
+    # every unassigned k matched with a free l pays its interactions with the
+    # assigned rows plus, for each other unassigned i, the cheapest free
+    # counterpart. A linear assignment over these costs bounds the cost of
+    # completing the permutation from below.
+    length = len(cost)
+    assigned = np.flatnonzero(permutation >= 0)
+    images = permutation[assigned]
+    free_rows = np.flatnonzero(permutation < 0)
+    free_cols = np.setdiff1d(np.arange(length), images)
+
+    # Interactions with the assigned rows (both directions)
+    rows = free_rows[:, np.newaxis, np.newaxis]
+    cols = free_cols[np.newaxis, :, np.newaxis]
+    linear = cost[rows, cols, assigned, images].sum(axis=2)
+    linear += cost[assigned, images, rows, cols].sum(axis=2)
+    # Interactions between unassigned rows; when k is matched with l,
+    # no other row can be matched with l
+    if len(assigned) == 0:
+        inner = cost
+    else:
+        inner = cost[np.ix_(free_rows, free_cols, free_rows, free_cols)]
+    same = np.eye(len(free_rows), dtype=bool)
+    taken = ~same[:, np.newaxis, :, np.newaxis] & same[np.newaxis, :, np.newaxis, :]
+    cheapest = np.where(taken, np.inf, inner).min(axis=3)
+    linear += np.where(same[:, np.newaxis, :], 0, cheapest).sum(axis=2)
+    return free_rows, free_cols, linear
+
+
+def _lower_bound(cost: np.ndarray) -> float:
+    permutation = -np.ones(len(cost), dtype=int)
+    linear = _bound_costs(cost, permutation)[2]
+    rows, cols = linear_sum_assignment(linear)
+    return float(linear[rows, cols].sum())
+
+
+def _branch_and_bound(
+    cost: np.ndarray, warm_start: np.ndarray, deadline: float = np.inf
+) -> (float, np.ndarray, bool):
+    # Depth-first search over partial permutations pruned with _bound_costs.
+    # Returns the best permutation found and whether the search finished
+    # before the deadline (i.e., whether it is optimal).
+    length = len(cost)
+    best = [_permutation_cost(cost, warm_start), np.array(warm_start)]
+    permutation = -np.ones(length, dtype=int)
+    finished = [True]
+
+    def search(fixed_cost: float) -> None:
+        if not finished[0]:
+            return
+        if time.time() > deadline:
+            finished[0] = False
+            return
+        if np.all(permutation >= 0):
+            if fixed_cost < best[0]:
+                best[0] = fixed_cost
+                best[1] = permutation.copy()
+            return
+
+        free_rows, free_cols, linear = _bound_costs(cost, permutation)
+        rows, cols = linear_sum_assignment(linear)
+        if fixed_cost + linear[rows, cols].sum() >= best[0] - 1e-9:
+            return
+
+        assigned = np.flatnonzero(permutation >= 0)
+        images = permutation[assigned]
+        # Branch on the first unassigned row, most promising columns first
+        row = free_rows[0]
+        for col in free_cols[np.argsort(linear[0])]:
+            added = cost[row, col, assigned, images].sum()
+            added += cost[assigned, images, row, col].sum()
+            permutation[row] = col
+            search(fixed_cost + added)
+            permutation[row] = -1
+
+    search(0.0)
+    return best[0], best[1], finished[0]
+
+
+def _spectral_seed(matrix_1: np.ndarray, matrix_2: np.ndarray) -> np.ndarray:
+    # Matches rows by the order of their entries in the leading eigenvector
+    # of the symmetrized matrices
+    def order(matrix):
+        symmetric = (matrix + matrix.T) / 2
+        vector = np.linalg.eigh(symmetric)[1][:, -1]
+        return np.argsort(np.abs(vector), kind="stable")
+
+    permutation = np.empty(len(matrix_1), dtype=int)
+    permutation[order(matrix_1)] = order(matrix_2)
+    return permutation
+
+
+def _swap_contribution(cost, permutation, a, b) -> float:
+    # Part of the objective that involves row a or row b
+    rows = np.arange(len(permutation))
+    pair = np.array([a, b])
+    images = permutation[pair]
+    total = cost[pair[:, np.newaxis], images[:, np.newaxis], rows, permutation].sum()
+    total += cost[rows, permutation, pair[:, np.newaxis], images[:, np.newaxis]].sum()
+    total -= cost[
+        pair[:, np.newaxis], images[:, np.newaxis], pair[np.newaxis, :], images
+    ].sum()
+    return total
+
+
+def _two_opt(cost, permutation, deadline) -> (float, np.ndarray):
+    # First-improvement local search over transpositions of the permutation
+    permutation = np.array(permutation)
+    length = len(permutation)
+    improved = True
+    while improved and time.time() < deadline:
+        improved = False
+        for a in range(length - 1):
+            for b in range(a + 1, length):
+                before = _swap_contribution(cost, permutation, a, b)
+                permutation[[a, b]] = permutation[[b, a]]
+                if _swap_contribution(cost, permutation, a, b) < before - 1e-9:
+                    improved = True
+                else:
+                    permutation[[a, b]] = permutation[[b, a]]
+    return _permutation_cost(cost, permutation), permutation
+
+
+def solve_matching_matrices_approx(
+    matrix_1: list[list],
+    matrix_2: list[list],
+    length: int,
+    inner_distance: callable,
+    time_limit: float = None,
+    seed: int = None,
+) -> (float, list, float):
+    """
+    Approximates the minimal distance between two matrices (see
+    solve_matching_matrices) with a local search.
+
+    The search starts from a linear assignment heuristic and from a spectral
+    matching, and improves them by swapping pairs of rows/columns until no
+    swap helps. If time_limit is given, random restarts are run until the
+    time is up.
+
+    Parameters
+    ----------
+        matrix_1 : list[list]
+            First square matrix.
+        matrix_2 : list[list]
+            Second square matrix.
+        length : int
+            Length of the matrix.
+        inner_distance : callable
+            The inner distance (like L1 or L2).
+        time_limit : float
+            Time budget in seconds. If None, only the two initial matchings
+            are improved.
+        seed : int
+            Seed of the random restarts.
+    Returns
+    -------
+        (float, list, float)
+            Objective value, matching, lower bound on the optimal objective
+            value. If both values are equal, the matching is optimal.
+    """
+
+    start = time.time()
+    deadline = np.inf if time_limit is None else start + time_limit
+    matrix_1 = np.asarray(matrix_1, dtype=float)[:length, :length]
+    matrix_2 = np.asarray(matrix_2, dtype=float)[:length, :length]
+    cost = _pairwise_cost_tensor(matrix_1, matrix_2, inner_distance)
+    lower_bound = _lower_bound(cost) if length > 0 else 0.0
+
+    seeds = [
+        _linear_assignment_heuristic(cost),
+        _spectral_seed(matrix_1, matrix_2),
+    ]
+    best_value, best_permutation = np.inf, seeds[0]
+    rng = np.random.default_rng(seed)
+    while seeds:
+        value, permutation = _two_opt(cost, seeds.pop(), deadline)
+        if value < best_value:
+            best_value, best_permutation = value, permutation
+        if best_value <= lower_bound + 1e-9:
+            break
+        if not seeds and time_limit is not None and time.time() < deadline:
+            seeds.append(rng.permutation(length))
+
+    return best_value, best_permutation.tolist(), lower_bound
+
+
+# The branch and bound needs about 2 s for 9 x 9 matrices and about five
+# times more for each additional row; larger matrices are approximated
+# unless another solver is requested
+_MAX_BNB_LENGTH = 10
+# Default time budget in seconds of the branch and bound
+_BNB_TIME_LIMIT = 60.0
+
+
 def solve_matching_matrices(
-    matrix_1: list[list], matrix_2: list[list], length: int, inner_distance: callable
+    matrix_1: list[list],
+    matrix_2: list[list],
+    length: int,
+    inner_distance: callable,
+    solver: str = None,
+    time_limit: float = None,
 ) -> float:
     """
     Computes the minimal distance between two matrices.
@@ -34,7 +416,8 @@ def solve_matching_matrices(
     We allow reordering of the rows and columns of the second matrix, however, whenever we reorder
      a row we have to reorder the corresponding column as well, and vice versa.
 
-    We use the Gurobi optimization library to solve the assignment problem.
+    The problem is solved exactly, starting from a matching found by a linear
+    assignment heuristic.
 
     Parameters
     ----------
@@ -46,101 +429,61 @@ def solve_matching_matrices(
             Length of the matrix.
         inner_distance : callable
             The inner distance (like L1 or L2).
+        solver : str
+            "gurobi" solves a binary quadratic program with Gurobi (requires
+            a license for larger matrices), "bnb" uses a license-free branch
+            and bound, practical up to about 10 x 10 matrices (and much
+            faster than Gurobi there). "approx" returns the (not necessarily
+            optimal) value found by solve_matching_matrices_approx. By
+            default "bnb" is used up to 10 x 10 matrices, Gurobi for larger
+            ones if it is installed and otherwise "approx" (with a warning).
+        time_limit : float
+            Time budget in seconds of the solvers ("bnb": 60 by default,
+            Gurobi: unlimited by default). If the exact solvers run out of
+            time, the best value found so far is returned with a warning.
     Returns
     -------
         float
             Objective value.
     """
 
-    m = gp.Model()
-    m.ModelSense = GRB.MINIMIZE
-
-    # OBJECTIVE FUNCTION
-    variables = {}
-    for k in range(length):
-        for l in range(length):
-            for i in range(length):
-                if i == k:
-                    continue
-                for j in range(length):
-                    if j == l:
-                        continue
-                    weight = inner_distance(
-                        np.array([matrix_1[k][i]]), np.array([matrix_2[l][j]])
-                    )
-                    name = f"Pk{k}l{l}i{i}j{j}"
-                    variables[name] = m.addVar(vtype=GRB.BINARY, name=name, obj=weight)
-
-    # ADD MISSING VARIABLES
-    for i in range(length):
-        for j in range(length):
-            name = f"Mi{i}j{j}"
-            variables[name] = m.addVar(vtype=GRB.BINARY, name=name)
-
-    m.update()
-
-    # CONSTRAINTS
-    for k in range(length):
-        for l in range(length):
-            for i in range(length):
-                if i == k:
-                    continue
-                for j in range(length):
-                    if j == l:
-                        continue
-
-                    m.addConstr(
-                        variables[f"Pk{k}l{l}i{i}j{j}"] - variables[f"Mi{i}j{j}"] <= 0
-                    )
-                    m.addConstr(
-                        variables[f"Pk{k}l{l}i{i}j{j}"] - variables[f"Mi{k}j{l}"] <= 0
-                    )
-
-    for i in range(length):
-        m.addConstr(gp.quicksum(variables[f"Mi{i}j{j}"] for j in range(length)) == 1)
-
-    for j in range(length):
-        m.addConstr(gp.quicksum(variables[f"Mi{i}j{j}"] for i in range(length)) == 1)
-
-    for k in range(length):
-        for i in range(length):
-            if k == i:
-                continue
-            m.addConstr(
-                gp.quicksum(
-                    variables[f"Pk{k}l{l}i{i}j{j}"]
-                    for l in range(length)
-                    for j in range(length)
-                    if l != j
-                )
-                == 1
-            )
-
-    for l in range(length):
-        for j in range(length):
-            if l == j:
-                continue
-            m.addConstr(
-                gp.quicksum(
-                    variables[f"Pk{k}l{l}i{i}j{j}"]
-                    for k in range(length)
-                    for i in range(length)
-                    if k != i
-                )
-                == 1
+    if solver is None:
+        if length <= _MAX_BNB_LENGTH:
+            solver = "bnb"
+        elif gp is not None:
+            solver = "gurobi"
+        else:
+            logging.warning(
+                f"Matrices of length {length} are too large for the exact "
+                f"license-free solver; the distance is approximated"
             )
+            solver = "approx"
 
-    # SOLVE THE ILP
-    m.setParam("OutputFlag", 0)
-    m.optimize()
+    if solver == "approx":
+        return solve_matching_matrices_approx(
+            matrix_1, matrix_2, length, inner_distance, time_limit=time_limit
+        )[0]
 
-    for var_name, var in variables.items():
-        print(f"{var_name}: {var}")
-    for constr in m.getConstrs():
-        print(constr)
+    matrix_1 = np.asarray(matrix_1)[:length, :length]
+    matrix_2 = np.asarray(matrix_2)[:length, :length]
+    cost = _pairwise_cost_tensor(matrix_1, matrix_2, inner_distance)
+    warm_start = _linear_assignment_heuristic(cost)
 
-    if m.status == GRB.OPTIMAL:
-        objective_value = m.objVal
-        return objective_value
-    else:
-        print("Exception raised while solving")
+    if solver == "gurobi":
+        if gp is None:
+            raise ImportError("Solver 'gurobi' requires the gurobipy package")
+        return _solve_with_gurobi(cost, warm_start, time_limit)
+    elif solver == "bnb":
+        if time_limit is None:
+            time_limit = _BNB_TIME_LIMIT
+        deadline = time.time() + time_limit
+        # A good first solution prunes more of the search
+        warm_start = _two_opt(cost, warm_start, deadline)[1]
+        value, _, is_optimal = _branch_and_bound(cost, warm_start, deadline)
+        if not is_optimal:
+            logging.warning(
+                f"Branch and bound stopped after {time_limit} s; the returned "
+                f"distance may not be optimal"
+            )
+        return value
+    raise ValueError(f"Unknown solver: {solver}")
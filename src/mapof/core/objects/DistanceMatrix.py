@@ -0,0 +1,193 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class DistanceMatrix(Mapping):
+    """
+    Symmetric matrix of pairwise values (distances, times, stds) between
+    instances.
+
+    Values are kept in a single square float64 array together with an
+    instance_id -> index map. Missing values are stored as NaN. Indexing with
+    an instance id returns a read-only row view, so code written against the
+    former dict-of-dicts layout (``distances[id_1][id_2]``) keeps working.
+    """
+
+    def __init__(self, instance_ids=None, matrix: np.ndarray = None):
+        if instance_ids is None:
+            instance_ids = []
+
+        self.ids = list(instance_ids)
+        self.index = {instance_id: i for i, instance_id in enumerate(self.ids)}
+
+        num_instances = len(self.ids)
+        if matrix is None:
+            matrix = np.full((num_instances, num_instances), np.nan)
+        self.matrix = np.asanyarray(matrix, dtype=np.float64)
+
+        if self.matrix.shape != (num_instances, num_instances):
+            raise ValueError(
+                f"Matrix of shape {self.matrix.shape} does not match "
+                f"{num_instances} instance ids"
+            )
+
+    @classmethod
+    def from_dict(cls, values: dict, instance_ids: list = None) -> "DistanceMatrix":
+        """
+        Builds the matrix from a (possibly partial) dict-of-dicts.
+
+        Parameters
+        ----------
+            values : dict
+                Dictionary of the form values[instance_id_1][instance_id_2].
+            instance_ids : list
+                Order of the instances. If None, the order of the keys is used.
+
+        Returns
+        -------
+            DistanceMatrix
+        """
+        if instance_ids is None:
+            instance_ids = list(values)
+            known = set(instance_ids)
+            for row in values.values():
+                for instance_id in row:
+                    if instance_id not in known:
+                        known.add(instance_id)
+                        instance_ids.append(instance_id)
+
+        matrix = cls(instance_ids)
+        for instance_id_1, row in values.items():
+            for instance_id_2, value in row.items():
+                if value is not None:
+                    matrix.set_value(instance_id_1, instance_id_2, value)
+        return matrix
+
+    def __getitem__(self, instance_id):
+        return _DistanceRow(self, self.index[instance_id])
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, instance_id):
+        return instance_id in self.index
+
+    def __repr__(self):
+        return f"DistanceMatrix({len(self.ids)} instances)"
+
+    def get_value(self, instance_id_1, instance_id_2, default=None):
+        """Returns the value for a pair or `default` if it is missing."""
+        value = self.matrix[self.index[instance_id_1], self.index[instance_id_2]]
+        if np.isnan(value):
+            return default
+        return float(value)
+
+    def set_value(self, instance_id_1, instance_id_2, value) -> None:
+        """Sets the value for a pair (symmetrically)."""
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        self.matrix[i, j] = value
+        self.matrix[j, i] = value
+
+    def has_value(self, instance_id_1, instance_id_2) -> bool:
+        """Checks if the value for a pair is present."""
+        return not np.isnan(
+            self.matrix[self.index[instance_id_1], self.index[instance_id_2]]
+        )
+
+    def indices(self, instance_ids: list) -> np.ndarray:
+        """Returns the matrix indices of the given instances."""
+        return np.fromiter(
+            (self.index[instance_id] for instance_id in instance_ids),
+            dtype=np.intp,
+            count=len(instance_ids),
+        )
+
+    def to_array(self, instance_ids: list = None, missing: float = np.nan):
+        """
+        Returns a copy of the matrix restricted to (and ordered by) the given
+        instances.
+
+        Parameters
+        ----------
+            instance_ids : list
+                Instances to select. If None, all instances are used.
+            missing : float
+                Value used for missing pairs.
+
+        Returns
+        -------
+            np.ndarray
+        """
+        if instance_ids is None:
+            array = np.array(self.matrix)
+        else:
+            idx = self.indices(instance_ids)
+            array = self.matrix[np.ix_(idx, idx)]
+        if not np.isnan(missing):
+            array[np.isnan(array)] = missing
+        return array
+
+    def to_dict(self) -> dict:
+        """Returns the values as a dict-of-dicts (missing pairs are omitted)."""
+        return {instance_id: dict(self[instance_id]) for instance_id in self.ids}
+
+    def reindex(self, instance_ids: list) -> "DistanceMatrix":
+        """
+        Returns a new matrix over the given instances, keeping the values
+        of instances that are already present.
+        """
+        matrix = DistanceMatrix(instance_ids)
+        old = [instance_id for instance_id in instance_ids if instance_id in self]
+        if old:
+            old_idx = self.indices(old)
+            new_idx = matrix.indices(old)
+            matrix.matrix[np.ix_(new_idx, new_idx)] = self.matrix[
+                np.ix_(old_idx, old_idx)
+            ]
+        return matrix
+
+    def copy(self) -> "DistanceMatrix":
+        return DistanceMatrix(self.ids, np.array(self.matrix))
+
+
+class _DistanceRow(Mapping):
+    """Read-only view of a single row of a DistanceMatrix."""
+
+    def __init__(self, matrix: DistanceMatrix, row: int):
+        self._matrix = matrix
+        self._row = row
+
+    def _present(self) -> np.ndarray:
+        return ~np.isnan(self._matrix.matrix[self._row])
+
+    def __getitem__(self, instance_id):
+        value = self._matrix.matrix[self._row, self._matrix.index[instance_id]]
+        if np.isnan(value):
+            raise KeyError(instance_id)
+        return float(value)
+
+    def __iter__(self):
+        ids = self._matrix.ids
+        return (ids[j] for j in np.flatnonzero(self._present()))
+
+    def __len__(self):
+        return int(np.count_nonzero(self._present()))
+
+    def __contains__(self, instance_id):
+        j = self._matrix.index.get(instance_id)
+        return j is not None and not np.isnan(self._matrix.matrix[self._row, j])
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def as_distance_matrix(values) -> DistanceMatrix:
+    """Converts a dict-of-dicts to a DistanceMatrix (None is passed through)."""
+    if values is None or isinstance(values, DistanceMatrix):
+        return values
+    return DistanceMatrix.from_dict(values)
@@ -5,11 +5,10 @@ import math
 import os
 from abc import ABC
 from abc import abstractmethod
-from multiprocessing import Process
-from time import sleep
 
 import matplotlib.pyplot as plt
 from PIL import Image
+import numpy as np
 from scipy.stats import stats
 
 import mapof.core.distances as metr
@@ -17,7 +16,11 @@ import mapof.core.embedding.embed as embed
 import mapof.core.persistence.experiment_exports as exports
 import mapof.core.persistence.experiment_imports as imports
 import mapof.core.printing as pr
+from mapof.core.objects.DistanceMatrix import DistanceMatrix, as_distance_matrix
 from mapof.core.objects.Family import Family
+from mapof.core.objects.MatchingStore import MatchingStore, as_matching_store
+from mapof.core.persistence.checkpoints import DistancesCheckpoint
+from mapof.core.persistence.distance_cache import DistanceCache
 from mapof.core.utils import make_folder_if_do_not_exist
 
 
@@ -40,6 +43,8 @@ class Experiment(ABC):
         with_matrix: bool = False,
         instance_type: str = None,
         dim: int = 2,
+        distances_format: str = "npy",
+        lazy_distances: bool = False,
     ):
 
         self.is_imported = is_imported
@@ -51,6 +56,8 @@ class Experiment(ABC):
         self.instance_type = instance_type
         self.clean = clean
         self.dim = dim
+        self.distances_format = distances_format
+        self.lazy_distances = lazy_distances
 
         self.coordinates_lists = {}
         self.features = {}
@@ -60,7 +67,8 @@ class Experiment(ABC):
         self.stds = {}
         self.matchings = {}
         self.coordinates_by_families = {}
-        self.mappings = {}
+        self.landmark_distances = None
+        self.landmark_coordinates = {}
 
         self.experiment_id = None
         self.instances = None
@@ -86,6 +94,51 @@ class Experiment(ABC):
             self.distances = {}
             self.coordinates = {}
 
+    @property
+    def distances(self) -> DistanceMatrix:
+        """Distances between each pair of instances."""
+        return self._distances
+
+    @distances.setter
+    def distances(self, distances) -> None:
+        self._distances = as_distance_matrix(distances)
+
+    @property
+    def times(self) -> DistanceMatrix:
+        """Time of calculation of each distance."""
+        return self._times
+
+    @times.setter
+    def times(self, times) -> None:
+        self._times = as_distance_matrix(times)
+
+    @property
+    def matchings(self) -> MatchingStore:
+        """Matchings between each pair of instances (if the distance returns them)."""
+        return self._matchings
+
+    @matchings.setter
+    def matchings(self, matchings) -> None:
+        self._matchings = as_matching_store(matchings)
+
+    @property
+    def mappings(self) -> MatchingStore:
+        """Former name of `matchings`."""
+        return self._matchings
+
+    @mappings.setter
+    def mappings(self, mappings) -> None:
+        self.matchings = mappings
+
+    @property
+    def stds(self) -> DistanceMatrix:
+        """Standard deviations of each distance."""
+        return self._stds
+
+    @stds.setter
+    def stds(self, stds) -> None:
+        self._stds = as_distance_matrix(stds)
+
     @abstractmethod
     def get_distance(
         self, instance_id_1, instance_id_2, distance_id: str = None, **kwargs
@@ -229,7 +282,17 @@ class Experiment(ABC):
         num_processes: int = 1,
         self_distances: bool = False,
         recompute: bool = True,
-    ) -> None:
+        copy_instances: bool = True,
+        check_mutations: bool = False,
+        checkpoint_interval: float = 60.0,
+        resume: bool = False,
+        store_matchings: bool = True,
+        num_pivots: int = None,
+        pivot_method: str = "maxmin",
+        landmark_dim: int = None,
+        num_check_pairs: int = 1000,
+        cache: DistanceCache | bool = None,
+    ) -> dict | None:
         """Compute distances between instances (using processes).
 
         Parameters
@@ -237,147 +300,394 @@ class Experiment(ABC):
         distance_id : str
             Identifier for the distance to compute.
         num_processes : int
-            Number of worker processes to use (if allowed).
+            Number of worker processes to use.
         self_distances : bool
             Whether to compute self-distances (i==j).
         recompute : bool
             If True (default) compute all requested pairs. If False, only compute
-            pairs that don't already have a value in `self.distances`/`self.times`.
+            pairs that don't already have a value in `self.distances`/`self.times`
+            and append just these pairs to the stored distances file.
+        copy_instances : bool
+            If True (default) each distance call receives deep copies of the
+            instances. If False, the instances are shared by reference, which
+            is much faster for large instances but requires that the distance
+            does not modify its inputs.
+        check_mutations : bool
+            If True, raise RuntimeError when the distance modifies any of its
+            input instances (useful before switching copy_instances off).
+        checkpoint_interval : float
+            For exported experiments, computed pairs are appended to a
+            checkpoint file at most every `checkpoint_interval` seconds, and
+            the file is removed once the distances are exported. None disables
+            checkpointing.
+        resume : bool
+            If True, pairs stored in the checkpoint file of an interrupted run
+            (with their matchings) are loaded and only the remaining pairs
+            are computed.
+        store_matchings : bool
+            If False, matchings returned by the distance are dropped instead
+            of being kept in `self.matchings` (and exported).
+        num_pivots : int, optional
+            If given, only the distances to `num_pivots` pivot instances (and
+            between `num_check_pairs` sampled pairs) are computed exactly, with
+            O(n * num_pivots) evaluations, and no n x n matrix is allocated.
+            The other distances are approximated by Landmark MDS: the result
+            is kept in `self.landmark_distances` (see LandmarkDistances) and
+            the coordinates in `self.landmark_coordinates`. The
+            approximations are never written into `self.distances` nor
+            exported, and matchings are not kept (for another distance than
+            the stored one, `self.distances` is emptied). Embed the result
+            with `embedding_id="landmark"`. Meant for experiments too large
+            for all n^2 / 2 exact distances.
+        pivot_method : str
+            Pivot selection in the landmark mode, "maxmin" (farthest-first)
+            or "random".
+        landmark_dim : int, optional
+            Number of dimensions of the Landmark MDS (by default as many as
+            the pivots allow).
+        num_check_pairs : int
+            Number of sampled pairs whose exact distances are compared with
+            the approximation in the landmark mode.
+        cache : DistanceCache or bool, optional
+            Persistent cache of distances keyed by the content of the
+            instances; pairs found in it are not recomputed and the computed
+            ones are added to it. True opens the default cache shared by all
+            experiments (experiments/distance_cache.sqlite) and closes it at
+            the end; a given cache is flushed but left open.
+
+        Returns
+        -------
+        dict or None
+            In the landmark mode, statistics of the approximation error on
+            the sampled pairs; otherwise None.
         """
 
+        if num_pivots is not None:
+            return self._compute_landmark_distances(
+                distance_id,
+                num_processes,
+                recompute,
+                num_pivots,
+                pivot_method,
+                landmark_dim,
+                num_check_pairs,
+                cache,
+                resume,
+                checkpoint_interval,
+                copy_instances=copy_instances,
+                check_mutations=check_mutations,
+            )
+
+        # Times recorded for the same distance help to schedule the pairs
+        previous_times = self.times if self.distance_id == distance_id else None
         self.distance_id = distance_id
 
         # If we don't want to recompute, start from existing stored values so
         # we preserve already-computed distances/times/matchings and only add
         # the missing ones. Otherwise initialize empty containers.
-        if not recompute and isinstance(self.distances, dict):
-            matchings = {
-                instance_id: dict(self.matchings.get(instance_id, {}))
-                for instance_id in self.instances
-            }
-            distances = {
-                instance_id: dict(self.distances.get(instance_id, {}))
-                for instance_id in self.instances
-            }
-            times = {
-                instance_id: dict(self.times.get(instance_id, {}))
-                for instance_id in self.instances
-            }
+        instance_ids = list(self.instances)
+        if not recompute and self.distances is not None:
+            matchings = self.matchings.reindex(instance_ids)
+            distances = self.distances.reindex(instance_ids)
+            times = self.times.reindex(instance_ids)
         else:
-            matchings = {instance_id: {} for instance_id in self.instances}
-            distances = {instance_id: {} for instance_id in self.instances}
-            times = {instance_id: {} for instance_id in self.instances}
-
-        ids = []
-        all_ids = []
-        for i, instance_1 in enumerate(self.instances):
-            for j, instance_2 in enumerate(self.instances):
-                if i == j:
-                    if self_distances:
-                        all_ids.append((instance_1, instance_2))
-                        # include self-pair only if recomputing or missing
-                        if not recompute:
-                            if instance_1 in distances and instance_2 in distances.get(
-                                instance_1, {}
-                            ):
-                                continue
-                        ids.append((instance_1, instance_2))
-                elif i < j:
-                    all_ids.append((instance_1, instance_2))
-                    # include pair only if recomputing or missing
-                    if not recompute:
-                        already = False
-                        if instance_1 in distances and instance_2 in distances.get(
-                            instance_1, {}
-                        ):
-                            already = True
-                        if instance_2 in distances and instance_1 in distances.get(
-                            instance_2, {}
-                        ):
-                            already = True
-                        if already:
-                            continue
-                    ids.append((instance_1, instance_2))
-
-        num_distances = len(ids)
-
-        if self.experiment_id is not None or num_processes == 1:
-            metr.run_single_process(self, ids, distances, times, matchings)
-
+            matchings = MatchingStore(instance_ids)
+            distances = DistanceMatrix(instance_ids)
+            times = DistanceMatrix(instance_ids)
+
+        # Pairs (i <= j) that have to be computed and stored
+        num_instances = len(instance_ids)
+        if recompute:
+            to_store = np.ones((num_instances, num_instances), dtype=bool)
         else:
-            processes = []
-            for process_id in range(num_processes):
-                print(f"Starting process: {process_id}")
-                sleep(0.1)
-                start = int(process_id * num_distances / num_processes)
-                stop = int((process_id + 1) * num_distances / num_processes)
-                instances_ids = ids[start:stop]
-
-                process = Process(
-                    target=metr.run_multiple_processes,
-                    args=(self, instances_ids, distances, times, matchings, process_id),
+            to_store = np.isnan(distances.matrix)
+        to_store = np.triu(to_store, k=0 if self_distances else 1)
+
+        checkpoint = None
+        if (
+            self.is_exported
+            and self.experiment_id is not None
+            and checkpoint_interval is not None
+        ):
+            checkpoint = DistancesCheckpoint(
+                self.experiment_id, distance_id, interval=checkpoint_interval
+            )
+            if resume:
+                num_loaded = checkpoint.load(
+                    distances, times, matchings if store_matchings else None
                 )
-                process.start()
-                processes.append(process)
-
-            for process in processes:
-                process.join()
-
-            # If we're not recomputing, preserve previously stored values and
-            # merge with the per-process CSV outputs; otherwise start fresh.
-            if not recompute and isinstance(self.distances, dict):
-                distances = {
-                    instance_id: dict(self.distances.get(instance_id, {}))
-                    for instance_id in self.instances
-                }
-                times = {
-                    instance_id: dict(self.times.get(instance_id, {}))
-                    for instance_id in self.instances
-                }
+                logging.info(f"Resuming with {num_loaded} checkpointed distances")
             else:
-                distances = {instance_id: {} for instance_id in self.instances}
-                times = {instance_id: {} for instance_id in self.instances}
-            for t in range(num_processes):
-
-                file_name = f"{distance_id}_p{t}.csv"
-                path = os.path.join(
-                    os.getcwd(),
-                    "experiments",
-                    self.experiment_id,
-                    "distances",
-                    file_name,
+                checkpoint.remove()
+
+        ids = _pairs_from_mask(instance_ids, to_store & np.isnan(distances.matrix))
+
+        # A cache opened here is closed here; a given one stays open
+        owns_cache = cache is True
+        if cache is True:
+            cache = DistanceCache()
+        elif cache is False:
+            cache = None
+
+        options = {
+            "copy_instances": copy_instances,
+            "check_mutations": check_mutations,
+            "checkpoint": checkpoint,
+            "cache": cache,
+        }
+
+        def run(pairs: list) -> None:
+            if num_processes == 1:
+                metr.run_single_process(
+                    self,
+                    pairs,
+                    distances,
+                    times,
+                    matchings if store_matchings else None,
+                    **options,
+                )
+            else:
+                metr.run_multiple_processes(
+                    self,
+                    pairs,
+                    distances,
+                    times,
+                    matchings if store_matchings else None,
+                    num_processes,
+                    previous_times=previous_times,
+                    **options,
                 )
 
-                with open(path, "r", newline="") as csv_file:
-                    reader = csv.DictReader(csv_file, delimiter=";")
-
-                    for row in reader:
-                        distances[row["instance_id_1"]][row["instance_id_2"]] = float(
-                            row["distance"]
-                        )
-                        times[row["instance_id_1"]][row["instance_id_2"]] = float(
-                            row["time"]
-                        )
+        try:
+            run(ids)
+        finally:
+            if checkpoint is not None:
+                checkpoint.flush()
+            if cache is not None:
+                logging.info(
+                    f"Distance cache: {cache.num_hits} hits, {cache.num_misses} misses"
+                )
+                if owns_cache:
+                    cache.close()
+                else:
+                    cache.flush()
 
         self.distances = distances
         self.times = times
         self.matchings = matchings
 
         if self.is_exported:
-            exports.export_distances_to_file(
-                self, distance_id, self.distances, self.times, all_ids
+            if self.distances_format == "csv":
+                if recompute:
+                    exports.export_distances_to_file(
+                        self, distance_id, self.distances, self.times
+                    )
+                else:
+                    exports.append_distances_to_file(
+                        self,
+                        distance_id,
+                        self.distances,
+                        self.times,
+                        _pairs_from_mask(instance_ids, to_store),
+                    )
+            else:
+                exports.export_matchings_to_npy(
+                    self, distance_id, self.matchings, merge=not recompute
+                )
+                exports.export_distances_to_npy(
+                    self, distance_id, self.distances, self.times
+                )
+            if checkpoint is not None:
+                checkpoint.remove()
+
+    def _compute_landmark_distances(
+        self,
+        distance_id: str,
+        num_processes: int,
+        recompute: bool,
+        num_pivots: int,
+        pivot_method: str,
+        landmark_dim: int,
+        num_check_pairs: int,
+        cache: DistanceCache | bool,
+        resume: bool,
+        checkpoint_interval: float,
+        **options,
+    ) -> dict:
+        """
+        Landmark mode of compute_distances. The exact distances are kept in
+        sparse containers, so the memory is O(n * num_pivots); neither
+        `self.distances` nor the exported distances are modified.
+        """
+        instance_ids = list(self.instances)
+        known = None
+        if self.distance_id == distance_id:
+            if not recompute and isinstance(self.distances, DistanceMatrix):
+                known = self.distances
+        else:
+            # The stored distances belong to another distance
+            self.distances = DistanceMatrix(instance_ids)
+            self.times = DistanceMatrix(instance_ids)
+            self.matchings = MatchingStore(instance_ids)
+        self.distance_id = distance_id
+
+        exact = metr.PairValues(instance_ids)
+        times = metr.PairValues(instance_ids)
+
+        checkpoint = None
+        if (
+            self.is_exported
+            and self.experiment_id is not None
+            and checkpoint_interval is not None
+        ):
+            checkpoint = DistancesCheckpoint(
+                self.experiment_id, distance_id, interval=checkpoint_interval
             )
+            if resume:
+                num_loaded = checkpoint.load(exact, times)
+                logging.info(f"Resuming with {num_loaded} checkpointed distances")
+            else:
+                checkpoint.remove()
+
+        # A cache opened here is closed here; a given one stays open
+        owns_cache = cache is True
+        if cache is True:
+            cache = DistanceCache()
+        elif cache is False:
+            cache = None
+        options.update(checkpoint=checkpoint, cache=cache)
+
+        def run(pairs: list) -> None:
+            if known is not None:
+                missing = []
+                for pair in pairs:
+                    if pair[0] in known and pair[1] in known and known.has_value(*pair):
+                        exact.set_value(*pair, known.get_value(*pair))
+                    else:
+                        missing.append(pair)
+                pairs = missing
+            if num_processes == 1:
+                metr.run_single_process(self, pairs, exact, times, None, **options)
+            else:
+                metr.run_multiple_processes(
+                    self, pairs, exact, times, None, num_processes, **options
+                )
+
+        try:
+            result = metr.landmark_distances(
+                exact,
+                run,
+                num_pivots,
+                pivot_method=pivot_method,
+                dim=landmark_dim,
+                num_check_pairs=num_check_pairs,
+            )
+        finally:
+            if checkpoint is not None:
+                checkpoint.flush()
+            if cache is not None:
+                logging.info(
+                    f"Distance cache: {cache.num_hits} hits, {cache.num_misses} misses"
+                )
+                if owns_cache:
+                    cache.close()
+                else:
+                    cache.flush()
+
+        if checkpoint is not None:
+            checkpoint.remove()
+
+        self.landmark_distances = result
+        self.landmark_coordinates = dict(zip(instance_ids, result.coordinates))
+        logging.info(f"Landmark distances: {result.stats}")
+        return result.stats
+
+    def compute_nearest_neighbors(
+        self,
+        instance_id=None,
+        k: int = 5,
+        num_pivots: int = None,
+        pivot_method: str = "maxmin",
+        lower_bound: callable = None,
+        distance_id: str = None,
+    ) -> (dict, dict):
+        """Compute the k nearest instances without computing all distances.
+
+        Exact distances are evaluated lazily and candidates are pruned with
+        the triangle inequality via pivot instances (and the optional cheap
+        `lower_bound`), so the result is exact for metric distances. See
+        mapof.core.distances.nearest_neighbors.nearest_neighbors for details.
+
+        Parameters
+        ----------
+        instance_id : hashable, optional
+            Instance to query. If None, the neighbours of all instances are
+            computed.
+        k : int
+            Number of neighbours.
+        num_pivots : int, optional
+            Number of pivots used for pruning.
+        pivot_method : str
+            Pivot selection, "maxmin" or "random".
+        lower_bound : callable, optional
+            Cheap lower bound on the distance between two instances.
+        distance_id : str, optional
+            Identifier of the distance. Defaults to `self.distance_id`.
+
+        Returns
+        -------
+        (dict, dict)
+            Neighbours (instance_id -> list of (neighbour_id, distance)) and
+            statistics with the number of evaluated and avoided distances.
+        """
+        neighbors, stats = metr.nearest_neighbors(
+            self,
+            instance_id=instance_id,
+            k=k,
+            num_pivots=num_pivots,
+            pivot_method=pivot_method,
+            lower_bound=lower_bound,
+            distance_id=distance_id,
+        )
+        logging.info(
+            f"Nearest neighbours: {stats['evaluated']} of {stats['pairs']} "
+            f"distances evaluated, {stats['avoided']} avoided"
+        )
+        return neighbors, stats
 
     def import_distances(self, distances):
         """Imports distances to the experiment."""
-        if isinstance(distances, dict):
+        if isinstance(distances, (dict, DistanceMatrix)):
             self.distances = distances
         elif self.is_imported and self.experiment_id is not None:
-            self.distances, self.times, self.stds, self.mappings = (
+            is_legacy = not imports.has_npy_distances(
+                self.experiment_id, self.distance_id
+            )
+            # In lazy mode binary distances and matchings are memory-mapped
+            # (copy-on-write, so they can still be updated in memory), and
+            # only the rows that are actually used are read from disk
+            mmap_mode = "c" if self.lazy_distances else None
+            self.distances, self.times, self.stds, self.matchings = (
                 imports.add_distances_to_experiment(
-                    self.experiment_id, self.distance_id, list(self.instances.keys())
+                    self.experiment_id,
+                    self.distance_id,
+                    list(self.instances.keys()),
+                    mmap_mode=mmap_mode,
                 )
             )
+            # Convert distances stored only as .csv, so next imports are fast
+            if (
+                is_legacy
+                and self.distances_format == "npy"
+                and self.is_exported
+                and len(self.distances) > 0
+            ):
+                # Matchings first, as the distances mark the binary set as
+                # complete
+                exports.export_matchings_to_npy(self, self.distance_id, self.matchings)
+                exports.export_distances_to_npy(
+                    self, self.distance_id, self.distances, self.times, self.stds
+                )
         else:
             self.distances = {}
 
@@ -912,3 +1222,11 @@ class Experiment(ABC):
         for family_id in self.families:
             if self.families[family_id].culture_id == culture_id:
                 return family_id
+
+
+def _pairs_from_mask(instance_ids: list, mask: np.ndarray) -> list:
+    """Returns the pairs of instance ids selected by a boolean matrix."""
+    rows, cols = np.nonzero(mask)
+    return [
+        (instance_ids[i], instance_ids[j]) for i, j in zip(rows.tolist(), cols.tolist())
+    ]
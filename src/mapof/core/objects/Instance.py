@@ -1,9 +1,21 @@
 from abc import ABC
 
+from mapof.core.persistence.distance_cache import content_hash
+
 
 class Instance(ABC):
     """Abstract instance object"""
 
+    # Attributes describing the instance rather than its data; they are not
+    # part of the content hash
+    metadata_attributes = (
+        "experiment_id",
+        "instance_id",
+        "culture_id",
+        "features",
+        "printing_params",
+    )
+
     def __init__(
         self,
         experiment_id: str,
@@ -25,3 +37,12 @@ class Instance(ABC):
 
         for key in ["color", "alpha", "marker", "ms"]:
             self.printing_params[key] = None
+
+    def content_hash(self) -> str:
+        """
+        Returns a hash of the data of the instance, used as the key of the
+        distance cache (see mapof.core.persistence.distance_cache). Subclasses
+        with derived or cached attributes should add them to
+        `metadata_attributes`.
+        """
+        return content_hash(self, exclude=self.metadata_attributes)
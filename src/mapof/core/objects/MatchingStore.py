@@ -0,0 +1,278 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class MatchingStore(Mapping):
+    """
+    Matchings between pairs of instances (e.g. of candidates, as returned by
+    distances that return a (distance, matching) tuple).
+
+    All matchings are kept in one contiguous integer array with a row per
+    unordered pair of instances (condensed upper triangle with the diagonal).
+    Only the matching from the instance with the smaller index to the other
+    one is stored; the reverse matching is derived on demand. The width of
+    the array is the length of the first stored matching; matchings of other
+    lengths (e.g. between elections with different numbers of candidates)
+    are kept in the `ragged` dict, keyed by the pair of indices. Indexing
+    with an instance id returns a read-only row view, so code written
+    against the former dict-of-dicts layout (``matchings[id_1][id_2]``)
+    keeps working.
+    """
+
+    def __init__(self, instance_ids=None):
+        if instance_ids is None:
+            instance_ids = []
+
+        self.ids = list(instance_ids)
+        self.index = {instance_id: i for i, instance_id in enumerate(self.ids)}
+        num_pairs = len(self.ids) * (len(self.ids) + 1) // 2
+        self.present = np.zeros(num_pairs, dtype=bool)
+        # Allocated when the first matching is stored, as its length is
+        # not known before
+        self.matchings = None
+        # Matchings of other lengths, keyed by (i, j) with i <= j
+        self.ragged = {}
+
+    @classmethod
+    def from_dict(cls, values: dict, instance_ids: list = None) -> "MatchingStore":
+        """
+        Builds the store from a (possibly partial) dict-of-dicts.
+
+        Parameters
+        ----------
+            values : dict
+                Dictionary of the form values[instance_id_1][instance_id_2].
+            instance_ids : list
+                Order of the instances. If None, the order of the keys is used.
+
+        Returns
+        -------
+            MatchingStore
+        """
+        if instance_ids is None:
+            instance_ids = list(values)
+            known = set(instance_ids)
+            for row in values.values():
+                for instance_id in row:
+                    if instance_id not in known:
+                        known.add(instance_id)
+                        instance_ids.append(instance_id)
+
+        store = cls(instance_ids)
+        for instance_id_1, row in values.items():
+            for instance_id_2, matching in row.items():
+                if matching is not None and not store.has_matching(
+                    instance_id_1, instance_id_2
+                ):
+                    store.set_matching(instance_id_1, instance_id_2, matching)
+        return store
+
+    @classmethod
+    def from_arrays(
+        cls,
+        instance_ids: list,
+        present: np.ndarray,
+        matchings: np.ndarray,
+        ragged: dict = None,
+    ) -> "MatchingStore":
+        """
+        Builds the store from its arrays (e.g. memory-mapped ones) without
+        copying them.
+
+        Parameters
+        ----------
+            instance_ids : list
+                Order of the instances.
+            present : np.ndarray
+                Condensed bool array of the stored pairs.
+            matchings : np.ndarray
+                Condensed array of the matchings, one row per pair.
+            ragged : dict
+                Matchings of other lengths, keyed by (i, j) with i <= j.
+
+        Returns
+        -------
+            MatchingStore
+        """
+        store = cls()
+        store.ids = list(instance_ids)
+        store.index = {instance_id: i for i, instance_id in enumerate(store.ids)}
+        store.present = present
+        store.matchings = matchings
+        store.ragged = {} if ragged is None else dict(ragged)
+        return store
+
+    def _pair_index(self, i, j):
+        # Position of the pair (i, j), i <= j, in the condensed array (works
+        # also elementwise for arrays of indices)
+        return i * len(self.ids) - i * (i - 1) // 2 + (j - i)
+
+    def _row_pair_indices(self, i: int) -> np.ndarray:
+        # Positions of the pairs (i, j) for all j
+        j = np.arange(len(self.ids))
+        return self._pair_index(np.minimum(i, j), np.maximum(i, j))
+
+    def __getitem__(self, instance_id):
+        return _MatchingRow(self, instance_id)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, instance_id):
+        return instance_id in self.index
+
+    def __repr__(self):
+        return f"MatchingStore({len(self.ids)} instances)"
+
+    def set_matching(self, instance_id_1, instance_id_2, matching) -> None:
+        """Stores the matching from the first instance to the second one."""
+        matching = np.asarray(matching)
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        if i > j:
+            i, j = j, i
+            matching = np.argsort(matching)
+
+        if self.matchings is None:
+            dtype = np.int16 if len(matching) <= np.iinfo(np.int16).max else np.int32
+            self.matchings = np.zeros((len(self.present), len(matching)), dtype=dtype)
+
+        p = self._pair_index(i, j)
+        if len(matching) == self.matchings.shape[1]:
+            self.matchings[p] = matching
+            self.ragged.pop((i, j), None)
+        else:
+            self.ragged[(i, j)] = matching.astype(np.int32)
+        self.present[p] = True
+
+    def get_matching(self, instance_id_1, instance_id_2, default=None):
+        """Returns the matching for a pair or `default` if it is missing."""
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        p = self._pair_index(min(i, j), max(i, j))
+        if not self.present[p]:
+            return default
+        matching = self.ragged.get((min(i, j), max(i, j)))
+        if matching is None:
+            matching = self.matchings[p]
+        matching = matching.astype(int)
+        if i > j:
+            return np.argsort(matching)
+        return matching
+
+    def has_matching(self, instance_id_1, instance_id_2) -> bool:
+        """Checks if the matching for a pair is present."""
+        i = self.index[instance_id_1]
+        j = self.index[instance_id_2]
+        return bool(self.present[self._pair_index(min(i, j), max(i, j))])
+
+    def to_dict(self) -> dict:
+        """Returns the matchings as a dict-of-dicts (missing pairs are omitted)."""
+        return {instance_id: dict(self[instance_id]) for instance_id in self.ids}
+
+    def reindex(self, instance_ids: list) -> "MatchingStore":
+        """
+        Returns a new store over the given instances, keeping the matchings
+        of instances that are already present.
+        """
+        store = MatchingStore(instance_ids)
+        common = [instance_id for instance_id in instance_ids if instance_id in self]
+        if self.matchings is None or not common:
+            return store
+
+        old_idx = np.array([self.index[instance_id] for instance_id in common])
+        new_idx = np.array([store.index[instance_id] for instance_id in common])
+        a, b = np.triu_indices(len(common))
+        old_p = self._pair_index(
+            np.minimum(old_idx[a], old_idx[b]), np.maximum(old_idx[a], old_idx[b])
+        )
+        new_p = store._pair_index(
+            np.minimum(new_idx[a], new_idx[b]), np.maximum(new_idx[a], new_idx[b])
+        )
+        keep = self.present[old_p]
+        old_p, new_p = old_p[keep], new_p[keep]
+        # Pairs whose order changed are stored in the other direction
+        flip = ((old_idx[a] < old_idx[b]) != (new_idx[a] < new_idx[b]))[keep]
+
+        store.matchings = np.zeros(
+            (len(store.present), self.matchings.shape[1]), dtype=self.matchings.dtype
+        )
+        store.matchings[new_p] = self.matchings[old_p]
+        store.matchings[new_p[flip]] = np.argsort(self.matchings[old_p[flip]], axis=1)
+        store.present[new_p] = True
+        for (i, j), matching in self.ragged.items():
+            if self.ids[i] in store and self.ids[j] in store:
+                store.set_matching(self.ids[i], self.ids[j], matching)
+        return store
+
+    def merge(self, other: "MatchingStore") -> "MatchingStore":
+        """
+        Returns a new store over the instances of both stores (those of this
+        one first) with the matchings of this store and those of `other`
+        for the pairs missing here.
+        """
+        ids = self.ids + [
+            instance_id for instance_id in other.ids if instance_id not in self
+        ]
+        store = self.reindex(ids)
+        other = other.reindex(ids)
+        if other.matchings is None:
+            return store
+        if store.matchings is None:
+            return other
+        missing = other.present & ~store.present
+        if store.matchings.shape[1] == other.matchings.shape[1]:
+            store.matchings[missing] = other.matchings[missing]
+            store.present |= missing
+            pairs = [pair for pair in other.ragged if missing[store._pair_index(*pair)]]
+        else:
+            rows, cols = np.triu_indices(len(ids))
+            pairs = zip(rows[missing].tolist(), cols[missing].tolist())
+        for i, j in pairs:
+            store.set_matching(ids[i], ids[j], other.get_matching(ids[i], ids[j]))
+        return store
+
+
+class _MatchingRow(Mapping):
+    """Read-only view of the matchings of a single instance."""
+
+    def __init__(self, store: MatchingStore, instance_id):
+        self._store = store
+        self._instance_id = instance_id
+        self._row = store.index[instance_id]
+
+    def _present_ids(self) -> list:
+        store = self._store
+        present = store.present[store._row_pair_indices(self._row)]
+        return [store.ids[j] for j in np.flatnonzero(present)]
+
+    def __getitem__(self, instance_id):
+        matching = self._store.get_matching(self._instance_id, instance_id)
+        if matching is None:
+            raise KeyError(instance_id)
+        return matching
+
+    def __iter__(self):
+        return iter(self._present_ids())
+
+    def __len__(self):
+        return len(self._present_ids())
+
+    def __contains__(self, instance_id):
+        return instance_id in self._store and self._store.has_matching(
+            self._instance_id, instance_id
+        )
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def as_matching_store(values) -> MatchingStore:
+    """Converts a dict-of-dicts to a MatchingStore (None is passed through)."""
+    if values is None or isinstance(values, MatchingStore):
+        return values
+    return MatchingStore.from_dict(values)
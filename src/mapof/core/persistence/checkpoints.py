@@ -0,0 +1,109 @@
+import csv
+import os
+from time import time
+
+import numpy as np
+
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.MatchingStore import MatchingStore
+from mapof.core.utils import make_folder_if_do_not_exist
+
+
+class DistancesCheckpoint:
+    """
+    Append-only record of the pairs computed so far by a distance run.
+
+    Computed pairs are buffered in memory and appended to
+    experiments/<experiment_id>/distances/<distance_id>_checkpoint.csv at most
+    once every `interval` seconds, so the overhead stays negligible even for
+    cheap distances. If the run is interrupted, the pairs stored in the file
+    can be loaded back and only the remaining ones have to be computed.
+
+    Matchings returned by the distance are stored with the pairs (as
+    space-separated integers), so they survive the interruption as well.
+    The matching precedes the time in a row, so a row truncated within the
+    matching lacks the time and is skipped when loading.
+    """
+
+    header = ["instance_id_1", "instance_id_2", "distance", "matching", "time"]
+
+    def __init__(self, experiment_id: str, distance_id: str, interval: float = 60.0):
+        path_to_folder = os.path.join(
+            os.getcwd(), "experiments", experiment_id, "distances"
+        )
+        make_folder_if_do_not_exist(path_to_folder)
+        self.path = os.path.join(path_to_folder, f"{distance_id}_checkpoint.csv")
+        self.interval = interval
+        self._buffer = []
+        self._last_flush = time()
+
+    def add(
+        self, instance_id_1, instance_id_2, distance, elapsed, matching=None
+    ) -> None:
+        """Records a computed pair; writes the buffer if the interval passed."""
+        matching = "" if matching is None else " ".join(map(str, matching))
+        self._buffer.append([instance_id_1, instance_id_2, distance, matching, elapsed])
+        if time() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Appends all buffered pairs to the checkpoint file."""
+        self._last_flush = time()
+        if not self._buffer:
+            return
+        is_new = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as csv_file:
+            writer = csv.writer(csv_file, delimiter=";")
+            if is_new:
+                writer.writerow(self.header)
+            writer.writerows(self._buffer)
+        self._buffer = []
+
+    def load(
+        self,
+        distances: DistanceMatrix,
+        times: DistanceMatrix,
+        matchings: MatchingStore = None,
+    ) -> int:
+        """
+        Fills the matrices (and the matchings, if given) with the pairs
+        stored in the checkpoint file.
+
+        Pairs of instances that are not in the matrices are skipped. A
+        truncated last row (e.g. after a crash while writing) is ignored.
+
+        Returns
+        -------
+            int
+                Number of loaded pairs.
+        """
+        if not os.path.exists(self.path):
+            return 0
+
+        num_loaded = 0
+        with open(self.path, "r", newline="") as csv_file:
+            reader = csv.DictReader(csv_file, delimiter=";")
+            for row in reader:
+                instance_id_1 = row["instance_id_1"]
+                instance_id_2 = row["instance_id_2"]
+                if instance_id_1 not in distances or instance_id_2 not in distances:
+                    continue
+                try:
+                    distance = float(row["distance"])
+                    elapsed = float(row["time"])
+                    matching = (row.get("matching") or "").split()
+                    matching = np.array(matching, dtype=int) if matching else None
+                except (TypeError, ValueError):
+                    continue
+                if matchings is not None and matching is not None:
+                    matchings.set_matching(instance_id_1, instance_id_2, matching)
+                distances.set_value(instance_id_1, instance_id_2, distance)
+                times.set_value(instance_id_1, instance_id_2, elapsed)
+                num_loaded += 1
+        return num_loaded
+
+    def remove(self) -> None:
+        """Deletes the checkpoint file and drops the buffered pairs."""
+        self._buffer = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
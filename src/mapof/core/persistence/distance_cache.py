@@ -0,0 +1,255 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+
+import numpy as np
+
+from mapof.core.utils import make_folder_if_do_not_exist
+
+
+def _update_hash(hasher, value, seen: set = None) -> None:
+    """Feeds a (nested) value to the hasher in a canonical form."""
+    if seen is None:
+        seen = set()
+    if isinstance(value, np.ndarray):
+        hasher.update(b"ndarray")
+        hasher.update(str(value.dtype).encode())
+        hasher.update(str(value.shape).encode())
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        hasher.update(b"dict%d" % len(value))
+        for key in sorted(value, key=repr):
+            _update_hash(hasher, key, seen)
+            _update_hash(hasher, value[key], seen)
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b"%s%d" % (type(value).__name__.encode(), len(value)))
+        for item in value:
+            _update_hash(hasher, item, seen)
+    elif isinstance(value, (set, frozenset)):
+        hasher.update(b"set%d" % len(value))
+        for item in sorted(value, key=repr):
+            _update_hash(hasher, item, seen)
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        hasher.update(type(value).__name__.encode())
+        hasher.update(repr(value).encode())
+    elif hasattr(value, "__dict__"):
+        hasher.update(type(value).__qualname__.encode())
+        # Objects referring back to each other are hashed only once
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        _update_hash(hasher, vars(value), seen)
+    else:
+        hasher.update(pickle.dumps(value))
+
+
+def content_hash(value, exclude: tuple = ()) -> str:
+    """
+    Returns a hex digest of the content of an object.
+
+    Arrays, containers and the attributes of plain objects are hashed
+    recursively, so equal data gives equal hashes regardless of the identity
+    of the objects.
+
+    Parameters
+    ----------
+        value
+            Object to hash.
+        exclude : tuple
+            Names of top-level attributes that are skipped.
+
+    Returns
+    -------
+        str
+    """
+    hasher = hashlib.sha256()
+    if exclude and hasattr(value, "__dict__"):
+        hasher.update(type(value).__qualname__.encode())
+        _update_hash(hasher, {k: v for k, v in vars(value).items() if k not in exclude})
+    else:
+        _update_hash(hasher, value)
+    return hasher.hexdigest()
+
+
+def instance_hash(instance) -> str:
+    """Hash of the data of an instance (its content_hash method, if any)."""
+    if hasattr(instance, "content_hash"):
+        return instance.content_hash()
+    return content_hash(instance)
+
+
+class DistanceCache:
+    """
+    Persistent cache of distances (and matchings) between instances.
+
+    Entries are keyed by the content hashes of the two instances and by the
+    distance, not by instance ids, so regenerating an experiment with the
+    same data, or building a new experiment that overlaps an old one, reuses
+    the distances computed before. The cache is an SQLite file (by default
+    experiments/distance_cache.sqlite, shared by all experiments) holding at
+    most `max_entries` entries; the least recently used ones are evicted.
+
+    Distances are assumed to be symmetric. The cache does not know about
+    changes in the code of a distance; call clear() after such changes.
+    Call close() when done, or use the cache as a context manager.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = 1_000_000):
+        if path is None:
+            path_to_folder = os.path.join(os.getcwd(), "experiments")
+            make_folder_if_do_not_exist(path_to_folder)
+            path = os.path.join(path_to_folder, "distance_cache.sqlite")
+        self.path = path
+        self.max_entries = max_entries
+        self.num_hits = 0
+        self.num_misses = 0
+        self._hashes = {}
+        self._buffer = []
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS distances ("
+            "key TEXT PRIMARY KEY, distance REAL, matching BLOB, "
+            "time REAL, last_used INTEGER)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS distances_last_used ON distances (last_used)"
+        )
+        self._connection.commit()
+        self._clock = self._connection.execute(
+            "SELECT COALESCE(MAX(last_used), 0) FROM distances"
+        ).fetchone()[0]
+        # Applies a possibly lowered max_entries to an existing cache
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM distances").fetchone()[0]
+
+    def _key(self, experiment, instance_id_1, instance_id_2) -> (str, bool):
+        # Hashes of the instances are computed once per run (see lookup)
+        for instance_id in (instance_id_1, instance_id_2):
+            if instance_id not in self._hashes:
+                self._hashes[instance_id] = instance_hash(
+                    experiment.instances[instance_id]
+                )
+        hash_1 = self._hashes[instance_id_1]
+        hash_2 = self._hashes[instance_id_2]
+        swapped = hash_1 > hash_2
+        if swapped:
+            hash_1, hash_2 = hash_2, hash_1
+        experiment_type = (
+            f"{type(experiment).__module__}.{type(experiment).__qualname__}"
+        )
+        key = f"{experiment_type}:{experiment.distance_id}:{hash_1}:{hash_2}"
+        return key, swapped
+
+    def lookup(self, experiment, instances_ids: list) -> (list, list):
+        """
+        Looks up pairs of instances in the cache.
+
+        Instance hashes are recomputed at the start of every lookup, so
+        instances modified since the previous run are not matched with stale
+        entries.
+
+        Parameters
+        ----------
+            experiment : Experiment
+                Experiment object.
+            instances_ids : list
+                Pairs of ids.
+
+        Returns
+        -------
+            (list, list)
+                Results of the cached pairs, in the format of
+                mapof.core.distances._compute_pair, and the pairs that are
+                not cached.
+        """
+        self._hashes = {}
+        keys = [self._key(experiment, *pair) for pair in instances_ids]
+
+        found = {}
+        unique_keys = list({key for key, _ in keys})
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start : start + 500]
+            rows = self._connection.execute(
+                "SELECT key, distance, matching, time FROM distances "
+                f"WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for key, distance, matching, elapsed in rows:
+                found[key] = (distance, matching, elapsed)
+
+        hits = []
+        misses = []
+        for (instance_id_1, instance_id_2), (key, swapped) in zip(instances_ids, keys):
+            if key not in found:
+                misses.append((instance_id_1, instance_id_2))
+                continue
+            distance, matching, elapsed = found[key]
+            if matching is not None:
+                matching = np.frombuffer(matching, dtype=np.int32).astype(int)
+                if swapped:
+                    matching = np.argsort(matching)
+            hits.append((instance_id_1, instance_id_2, distance, matching, elapsed))
+
+        self._clock += 1
+        self._connection.executemany(
+            "UPDATE distances SET last_used = ? WHERE key = ?",
+            [(self._clock, key) for key in found],
+        )
+        self._connection.commit()
+        self.num_hits += len(hits)
+        self.num_misses += len(misses)
+        return hits, misses
+
+    def add(self, experiment, result: tuple) -> None:
+        """
+        Adds a result of mapof.core.distances._compute_pair to the cache.
+        Results are buffered and written by flush.
+        """
+        instance_id_1, instance_id_2, distance, matching, elapsed = result
+        key, swapped = self._key(experiment, instance_id_1, instance_id_2)
+        if matching is not None:
+            matching = np.asarray(matching)
+            if swapped:
+                matching = np.argsort(matching)
+            matching = matching.astype(np.int32).tobytes()
+        self._buffer.append((key, float(distance), matching, elapsed))
+        if len(self._buffer) >= 1000:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered results and evicts the least recently used."""
+        if self._buffer:
+            self._clock += 1
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO distances VALUES (?, ?, ?, ?, ?)",
+                [entry + (self._clock,) for entry in self._buffer],
+            )
+            self._buffer = []
+        num_excess = len(self) - self.max_entries
+        if num_excess > 0:
+            self._connection.execute(
+                "DELETE FROM distances WHERE key IN (SELECT key FROM distances "
+                "ORDER BY last_used LIMIT ?)",
+                (num_excess,),
+            )
+        self._connection.commit()
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        self._buffer = []
+        self._connection.execute("DELETE FROM distances")
+        self._connection.commit()
+
+    def close(self) -> None:
+        """Writes the buffered results and closes the file."""
+        self.flush()
+        self._connection.close()
@@ -1,6 +1,12 @@
 import csv
+import json
 import os
 
+import numpy as np
+
+import mapof.core.persistence.experiment_imports as imports
+from mapof.core.objects.DistanceMatrix import DistanceMatrix, as_distance_matrix
+from mapof.core.objects.MatchingStore import MatchingStore, as_matching_store
 from mapof.core.utils import make_folder_if_do_not_exist
 
 EMBEDDING_RELATED_FEATURE = ["monotonicity_triplets", "distortion_from_all"]
@@ -164,11 +170,66 @@ def export_embedding_to_file(
 
 
 # Distances
+def _distance_rows(distances, times, ids=None):
+    """Yields the rows of a distances .csv file."""
+    if ids is not None:
+        for instance_1, instance_2 in ids:
+            distance = str(distances[instance_1][instance_2])
+            time_ = str(times[instance_1][instance_2])
+            yield [instance_1, instance_2, distance, time_]
+        return
+
+    # All computed pairs of a DistanceMatrix (upper triangle with diagonal)
+    rows, cols = np.nonzero(np.triu(~np.isnan(distances.matrix)))
+    instance_ids = distances.ids
+    times = times.reindex(instance_ids).matrix[rows, cols]
+    for i, j, distance, time_ in zip(
+        rows.tolist(), cols.tolist(), distances.matrix[rows, cols].tolist(), times
+    ):
+        time_ = "" if np.isnan(time_) else str(time_)
+        yield [instance_ids[i], instance_ids[j], str(distance), time_]
+
+
+def _path_to_distances_file(experiment, file_name: str) -> str:
+    path_to_folder = os.path.join(
+        os.getcwd(), "experiments", experiment.experiment_id, "distances"
+    )
+    make_folder_if_do_not_exist(path_to_folder)
+    return os.path.join(path_to_folder, file_name)
+
+
+def _matchings_files(distance_id: str) -> list:
+    # Files of the binary matchings, the ids last (see
+    # export_matchings_to_npy), and the former single .npz file
+    return [
+        f"{distance_id}_matchings.npy",
+        f"{distance_id}_matchings_present.npy",
+        f"{distance_id}_matchings_ragged.npz",
+        f"{distance_id}_matchings_ids.json",
+        f"{distance_id}_matchings.npz",
+    ]
+
+
+def _remove_npy_distances(experiment, distance_id: str) -> None:
+    # Binary distances take precedence on import, so they must not outlive
+    # a newer .csv export
+    for file_name in [
+        f"{distance_id}_ids.json",
+        f"{distance_id}.npy",
+        f"{distance_id}_times.npy",
+        f"{distance_id}_stds.npy",
+        *_matchings_files(distance_id),
+    ]:
+        path = _path_to_distances_file(experiment, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
 def export_distances_to_file(
     experiment,
     distance_id: str,
-    distances: dict[str, dict[str, int]],
-    times: dict[str, dict[str, int]],
+    distances: DistanceMatrix | dict[str, dict[str, float]],
+    times: DistanceMatrix | dict[str, dict[str, float]],
     ids=None,
 ) -> None:
     """
@@ -180,67 +241,213 @@ def export_distances_to_file(
            Experiment object.
         distance_id : str
             Name of the distance.
-        distances :   dict[str, dict[str, int]]
-            Dictionary with distances between each pair of instances
-        times : dict[str, dict[str, int]]
-            Dictionary with time of calculation of each distance.
+        distances : DistanceMatrix | dict[str, dict[str, float]]
+            Distances between each pair of instances
+        times : DistanceMatrix | dict[str, dict[str, float]]
+            Time of calculation of each distance.
         ids:
-            List of the Ids.
+            List of the Ids. If None, all pairs of the DistanceMatrix with
+            a computed distance are exported.
 
     Returns
     -------
         None
     """
 
-    path_to_folder = os.path.join(
-        os.getcwd(), "experiments", experiment.experiment_id, "distances"
-    )
-    make_folder_if_do_not_exist(path_to_folder)
-    path = os.path.join(path_to_folder, f"{distance_id}.csv")
+    _remove_npy_distances(experiment, distance_id)
+    path = _path_to_distances_file(experiment, f"{distance_id}.csv")
 
     with open(path, "w", newline="") as csv_file:
         writer = csv.writer(csv_file, delimiter=";")
         writer.writerow(["instance_id_1", "instance_id_2", "distance", "time"])
+        writer.writerows(_distance_rows(distances, times, ids))
 
-        for pair in ids:
-            instance_1, instance_2 = pair
-            distance = str(distances[instance_1][instance_2])
-            time_ = str(times[instance_1][instance_2])
-            writer.writerow([instance_1, instance_2, distance, time_])
 
+def append_distances_to_file(
+    experiment,
+    distance_id: str,
+    distances: DistanceMatrix | dict[str, dict[str, float]],
+    times: DistanceMatrix | dict[str, dict[str, float]],
+    ids: list,
+) -> None:
+    """
+    Appends distances between the given pairs of instances to a .csv file,
+    leaving the rows already stored in the file untouched. Distances stored
+    in the binary (.npy) format are first converted to the .csv file, as
+    they would be lost otherwise.
+
+    Parameters
+    ----------
+        experiment : Experiment
+           Experiment object.
+        distance_id : str
+            Name of the distance.
+        distances : DistanceMatrix | dict[str, dict[str, float]]
+            Distances between each pair of instances
+        times : DistanceMatrix | dict[str, dict[str, float]]
+            Time of calculation of each distance.
+        ids : list
+            List of the pairs to append.
 
-def export_distances_multiple_processes(
-    experiment, instances_ids, distances, times, process_id
+    Returns
+    -------
+        None
+    """
+
+    if imports.has_npy_distances(experiment.experiment_id, distance_id):
+        stored, stored_times, _ = imports.import_distances_from_npy(
+            experiment.experiment_id, distance_id
+        )
+        export_distances_to_file(experiment, distance_id, stored, stored_times)
+    _remove_npy_distances(experiment, distance_id)
+    path = _path_to_distances_file(experiment, f"{distance_id}.csv")
+    is_new = not os.path.exists(path)
+
+    with open(path, "a", newline="") as csv_file:
+        writer = csv.writer(csv_file, delimiter=";")
+        if is_new:
+            writer.writerow(["instance_id_1", "instance_id_2", "distance", "time"])
+        writer.writerows(_distance_rows(distances, times, ids))
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    # Write to a temporary file first, so an interrupted export never leaves
+    # a truncated matrix behind
+    path_tmp = f"{path}.tmp"
+    with open(path_tmp, "wb") as file:
+        np.save(file, array)
+    os.replace(path_tmp, path)
+
+
+def export_distances_to_npy(
+    experiment,
+    distance_id: str,
+    distances: DistanceMatrix,
+    times: DistanceMatrix = None,
+    stds: DistanceMatrix = None,
 ) -> None:
     """
-    Exports distances between each pair of instances to a .csv file.
+    Exports distances between each pair of instances to binary .npy files.
+
+    The square distance matrix is stored in <distance_id>.npy, the order of the
+    instances in <distance_id>_ids.json and, if given, the times and standard
+    deviations in <distance_id>_times.npy and <distance_id>_stds.npy. Missing
+    values are stored as NaN. The files can be memory-mapped on import. The
+    ids file is written last, so matchings should be exported before.
 
     Parameters
     ----------
         experiment : Experiment
            Experiment object.
-        instances_ids:
-            List of the Ids.
-        distances :  dict
-            Dictionary with distances between each pair of instances
-        times : dict
-            Dictionary with time of calculation of each distance.
-        process_id : int
-            ID of the process.
+        distance_id : str
+            Name of the distance.
+        distances : DistanceMatrix
+            Distances between each pair of instances.
+        times : DistanceMatrix
+            Time of calculation of each distance.
+        stds : DistanceMatrix
+            Standard deviation of each distance.
 
     Returns
     -------
         None
     """
 
-    file_name = f"{experiment.distance_id}_p{process_id}.csv"
-    path = os.path.join(
-        os.getcwd(), "experiments", experiment.experiment_id, "distances", file_name
+    distances = as_distance_matrix(distances)
+    _save_array(
+        _path_to_distances_file(experiment, f"{distance_id}.npy"), distances.matrix
     )
-    with open(path, "w", newline="") as csv_file:
-        writer = csv.writer(csv_file, delimiter=";")
-        writer.writerow(["instance_id_1", "instance_id_2", "distance", "time"])
-        for election_id_1, election_id_2 in instances_ids:
-            distance = float(distances[election_id_1][election_id_2])
-            time_ = float(times[election_id_1][election_id_2])
-            writer.writerow([election_id_1, election_id_2, distance, time_])
+    for suffix, values in [("times", times), ("stds", stds)]:
+        path = _path_to_distances_file(experiment, f"{distance_id}_{suffix}.npy")
+        if values is not None and len(values) > 0:
+            _save_array(path, as_distance_matrix(values).reindex(distances.ids).matrix)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    # The ids mark the binary distances as present (see has_npy_distances),
+    # so they are written last and atomically: an interrupted export leaves
+    # either the previous complete set or no binary distances at all
+    path = _path_to_distances_file(experiment, f"{distance_id}_ids.json")
+    path_tmp = f"{path}.tmp"
+    with open(path_tmp, "w") as json_file:
+        json.dump(distances.ids, json_file)
+    os.replace(path_tmp, path)
+
+
+def export_matchings_to_npy(
+    experiment, distance_id: str, matchings: MatchingStore, merge: bool = False
+) -> None:
+    """
+    Exports matchings between pairs of instances to binary .npy files.
+
+    The condensed matchings and the mask of the stored pairs are kept in
+    <distance_id>_matchings.npy and <distance_id>_matchings_present.npy
+    (so that they can be memory-mapped on import), the matchings of other
+    lengths in <distance_id>_matchings_ragged.npz and the order of the
+    instances in <distance_id>_matchings_ids.json, which is written last.
+    If there are no matchings, previously exported files are removed
+    (unless `merge` is True).
+
+    Parameters
+    ----------
+        experiment : Experiment
+           Experiment object.
+        distance_id : str
+            Name of the distance.
+        matchings : MatchingStore
+            Matchings between pairs of instances.
+        merge : bool
+            If True, the matchings already stored in the files are kept for
+            the pairs that are missing in `matchings`.
+
+    Returns
+    -------
+        None
+    """
+
+    matchings = as_matching_store(matchings)
+    if merge:
+        stored = imports.import_matchings_from_npy(
+            experiment.experiment_id, distance_id
+        )
+        if stored.matchings is not None:
+            matchings = stored if matchings is None else matchings.merge(stored)
+    for file_name in _matchings_files(distance_id):
+        path = _path_to_distances_file(experiment, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+    if matchings is None or matchings.matchings is None:
+        return
+
+    _save_array(
+        _path_to_distances_file(experiment, f"{distance_id}_matchings.npy"),
+        np.asarray(matchings.matchings),
+    )
+    _save_array(
+        _path_to_distances_file(experiment, f"{distance_id}_matchings_present.npy"),
+        np.asarray(matchings.present),
+    )
+
+    # Matchings of other lengths as a flat buffer with per-pair offsets
+    ragged_pairs = np.array(list(matchings.ragged), dtype=np.int64).reshape(-1, 2)
+    ragged_lengths = [len(matching) for matching in matchings.ragged.values()]
+    ragged_offsets = np.concatenate(([0], np.cumsum(ragged_lengths, dtype=np.int64)))
+    ragged_values = (
+        np.concatenate(list(matchings.ragged.values()))
+        if matchings.ragged
+        else np.zeros(0, dtype=np.int32)
+    )
+    path = _path_to_distances_file(experiment, f"{distance_id}_matchings_ragged.npz")
+    with open(f"{path}.tmp", "wb") as file:
+        np.savez(
+            file,
+            pairs=ragged_pairs,
+            offsets=ragged_offsets,
+            values=ragged_values,
+        )
+    os.replace(f"{path}.tmp", path)
+
+    path = _path_to_distances_file(experiment, f"{distance_id}_matchings_ids.json")
+    with open(f"{path}.tmp", "w") as json_file:
+        json.dump(matchings.ids, json_file)
+    os.replace(f"{path}.tmp", path)
@@ -1,14 +1,53 @@
 import ast
 import csv
+import json
 import logging
 import os
 
 import numpy as np
 
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.MatchingStore import MatchingStore
+
+
+def _read_pair_rows(path: str, instance_ids: list) -> (list, list):
+    """
+    Reads rows of a pairwise .csv file, skipping pairs of unknown instances.
+
+    Returns the rows and the ids (ordered as in instance_ids) that occur in them.
+    """
+    known = set(instance_ids)
+    rows = []
+    present = set()
+    with open(path, "r", newline="") as csv_file:
+
+        reader = csv.DictReader(csv_file, delimiter=";")
+
+        for row in reader:
+            instance_id_1 = row.get("election_id_1", row.get("instance_id_1"))
+            instance_id_2 = row.get("election_id_2", row.get("instance_id_2"))
+
+            if instance_id_1 not in known or instance_id_2 not in known:
+                continue
+
+            present.add(instance_id_1)
+            present.add(instance_id_2)
+            rows.append((instance_id_1, instance_id_2, row))
+
+    ids = [instance_id for instance_id in instance_ids if instance_id in present]
+    return rows, ids
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 
 def import_distances_from_file(
     experiment_id: str, distance_id: str, instance_ids: list
-) -> dict:
+) -> DistanceMatrix:
     """
     Imports distances between each pair of instances from a file.
 
@@ -23,57 +62,204 @@ def import_distances_from_file(
 
     Returns
     -------
-        dict
+        DistanceMatrix
             Distances.
     """
 
-    distances = {}
+    if has_npy_distances(experiment_id, distance_id):
+        return import_distances_from_npy(experiment_id, distance_id, instance_ids)[0]
 
     file_name = f"{distance_id}.csv"
     path = os.path.join(
         os.getcwd(), "experiments", experiment_id, "distances", file_name
     )
 
-    with open(path, "r", newline="") as csv_file:
+    rows, ids = _read_pair_rows(path, instance_ids)
 
-        reader = csv.DictReader(csv_file, delimiter=";")
+    distances = DistanceMatrix(ids)
+    for instance_id_1, instance_id_2, row in rows:
+        value = _to_float(row.get("distance"))
+        if value is not None:
+            distances.set_value(instance_id_1, instance_id_2, value)
+    return distances
 
-        for row in reader:
-            try:
-                instance_id_1 = row["election_id_1"]
-                instance_id_2 = row["election_id_2"]
-            except:
-                try:
-                    instance_id_1 = row["instance_id_1"]
-                    instance_id_2 = row["instance_id_2"]
-                except:
-                    pass
-            if instance_id_1 not in instance_ids or instance_id_2 not in instance_ids:
-                continue
 
-            if instance_id_1 not in distances:
-                distances[instance_id_1] = {}
+def _path_to_distances_file(experiment_id: str, file_name: str) -> str:
+    return os.path.join(
+        os.getcwd(), "experiments", experiment_id, "distances", file_name
+    )
+
 
-            if instance_id_2 not in distances:
-                distances[instance_id_2] = {}
+def has_npy_distances(experiment_id: str, distance_id: str) -> bool:
+    """Checks if distances are stored in the binary (.npy) format."""
+    return os.path.exists(
+        _path_to_distances_file(experiment_id, f"{distance_id}_ids.json")
+    )
 
-            try:
-                distances[instance_id_1][instance_id_2] = float(row["distance"])
-                distances[instance_id_2][instance_id_1] = distances[instance_id_1][
-                    instance_id_2
-                ]
-            except KeyError:
-                pass
-    return distances
+
+def import_distances_from_npy(
+    experiment_id: str,
+    distance_id: str,
+    instance_ids: list = None,
+    mmap_mode: str = None,
+) -> (DistanceMatrix, DistanceMatrix, DistanceMatrix):
+    """
+    Imports distances between each pair of instances from binary .npy files
+    (see export_distances_to_npy).
+
+    Parameters
+    ----------
+        experiment_id : str
+            Name of the experiment.
+        distance_id : str
+            Name of the distance.
+        instance_ids : list
+            List of the Ids. If None, all the stored instances are kept.
+        mmap_mode : str
+            If given, the matrices are memory-mapped instead of being read
+            into memory, so only the touched rows are paged in. With "c"
+            (copy-on-write) the matrices can be modified in memory, with "r"
+            they are read-only.
+            Memory-mapping is possible only if the stored instances are
+            exactly the given ones (in any order); otherwise the selected
+            part of the matrix is read into memory.
+
+    Returns
+    -------
+        (DistanceMatrix, DistanceMatrix, DistanceMatrix)
+            distances, times, stds
+
+    Raises
+    ------
+        FileNotFoundError
+            If no binary distances are stored.
+    """
+
+    with open(
+        _path_to_distances_file(experiment_id, f"{distance_id}_ids.json")
+    ) as file:
+        stored_ids = json.load(file)
+
+    if instance_ids is None:
+        instance_ids = stored_ids
+    stored = set(stored_ids)
+    ids = [instance_id for instance_id in instance_ids if instance_id in stored]
+    if len(ids) == len(stored_ids):
+        # Same instances, so the stored order can be kept
+        ids = stored_ids
+
+    matrices = []
+    for file_name in [
+        f"{distance_id}.npy",
+        f"{distance_id}_times.npy",
+        f"{distance_id}_stds.npy",
+    ]:
+        path = _path_to_distances_file(experiment_id, file_name)
+        if not os.path.exists(path):
+            matrices.append(DistanceMatrix(ids))
+            continue
+        matrix = DistanceMatrix(stored_ids, np.load(path, mmap_mode=mmap_mode))
+        if ids != stored_ids:
+            matrix = matrix.reindex(ids)
+        matrices.append(matrix)
+
+    return tuple(matrices)
+
+
+def import_matchings_from_npy(
+    experiment_id: str,
+    distance_id: str,
+    instance_ids: list = None,
+    mmap_mode: str = None,
+) -> MatchingStore:
+    """
+    Imports matchings between pairs of instances exported with
+    export_matchings_to_npy.
+
+    Parameters
+    ----------
+        experiment_id : str
+            Name of the experiment.
+        distance_id : str
+            Name of the distance.
+        instance_ids : list
+            List of the Ids. If None, all the stored instances are kept.
+        mmap_mode : str
+            If given (e.g. "c"), the matchings are memory-mapped, provided
+            that the stored instances are exactly the given ones (see
+            import_distances_from_npy).
+
+    Returns
+    -------
+        MatchingStore
+            Matchings (empty if none were exported).
+    """
+
+    path = _path_to_distances_file(experiment_id, f"{distance_id}_matchings_ids.json")
+    legacy_path = _path_to_distances_file(experiment_id, f"{distance_id}_matchings.npz")
+    if os.path.exists(path):
+        with open(path) as file:
+            stored_ids = json.load(file)
+        present = np.load(
+            _path_to_distances_file(
+                experiment_id, f"{distance_id}_matchings_present.npy"
+            ),
+            mmap_mode=mmap_mode,
+        )
+        array = np.load(
+            _path_to_distances_file(experiment_id, f"{distance_id}_matchings.npy"),
+            mmap_mode=mmap_mode,
+        )
+        ragged_path = _path_to_distances_file(
+            experiment_id, f"{distance_id}_matchings_ragged.npz"
+        )
+        with np.load(ragged_path) as data:
+            ragged = _ragged_matchings(data["pairs"], data["offsets"], data["values"])
+    elif os.path.exists(legacy_path):
+        # Single .npz file written by former versions
+        with np.load(legacy_path) as data:
+            stored_ids = data["ids"].tolist()
+            present = data["present"]
+            array = data["matchings"]
+            ragged = (
+                _ragged_matchings(
+                    data["ragged_pairs"], data["ragged_offsets"], data["ragged_values"]
+                )
+                if "ragged_pairs" in data
+                else {}
+            )
+    else:
+        return MatchingStore(instance_ids)
+
+    matchings = MatchingStore.from_arrays(stored_ids, present, array, ragged)
+    if instance_ids is None or (
+        len(instance_ids) == len(stored_ids) and set(instance_ids) == set(stored_ids)
+    ):
+        # Same instances, so the stored order can be kept
+        return matchings
+    return matchings.reindex(instance_ids)
+
+
+def _ragged_matchings(
+    pairs: np.ndarray, offsets: np.ndarray, values: np.ndarray
+) -> dict:
+    """Matchings of other lengths stored as a flat buffer with offsets."""
+    return {
+        (i, j): values[offsets[k] : offsets[k + 1]]
+        for k, (i, j) in enumerate(pairs.tolist())
+    }
 
 
 def add_distances_to_experiment(
-    experiment_id: str, distance_id: str, instance_ids: list
-) -> (dict, dict, dict, dict):
+    experiment_id: str, distance_id: str, instance_ids: list, mmap_mode: str = None
+) -> (DistanceMatrix, DistanceMatrix, DistanceMatrix, MatchingStore):
     """
     Imports precomputed distances between each pair of instances
     from a file while preparing an experiment.
 
+    Binary (.npy) distances are used if present (together with the
+    exported matchings), otherwise the .csv file.
+
     Parameters
     ----------
         experiment_id : str
@@ -82,109 +268,63 @@ def add_distances_to_experiment(
             Name of the distance.
         instance_ids : list
             List of the Ids.
+        mmap_mode : str
+            Passed to import_distances_from_npy and import_matchings_from_npy.
 
 
     Returns
     -------
-        (dict, dict, dict, dict)
-            distances, times, stds, mappings
+        (DistanceMatrix, DistanceMatrix, DistanceMatrix, MatchingStore)
+            distances, times, stds, matchings
     """
 
+    if has_npy_distances(experiment_id, distance_id):
+        distances, times, stds = import_distances_from_npy(
+            experiment_id, distance_id, instance_ids, mmap_mode=mmap_mode
+        )
+        matchings = import_matchings_from_npy(
+            experiment_id, distance_id, instance_ids, mmap_mode=mmap_mode
+        )
+        return distances, times, stds, matchings
+
     try:
         file_name = f"{distance_id}.csv"
         path = os.path.join(
             os.getcwd(), "experiments", experiment_id, "distances", file_name
         )
 
-        distances = {}
-        times = {}
-        stds = {}
-        mappings = {}
-        with open(path, "r", newline="") as csv_file:
+        rows, ids = _read_pair_rows(path, instance_ids)
 
-            reader = csv.DictReader(csv_file, delimiter=";")
-            warn = False
+        distances = DistanceMatrix(ids)
+        times = DistanceMatrix(ids)
+        stds = DistanceMatrix(ids)
+        matchings = MatchingStore(ids)
 
-            for row in reader:
-                try:
-                    instance_id_1 = row["election_id_1"]
-                    instance_id_2 = row["election_id_2"]
-                except:
-                    try:
-                        instance_id_1 = row["instance_id_1"]
-                        instance_id_2 = row["instance_id_2"]
-                    except:
-                        pass
-
-                if (
-                    instance_id_1 not in instance_ids
-                    or instance_id_2 not in instance_ids
-                ):
-                    continue
-
-                if instance_id_1 not in distances:
-                    distances[instance_id_1] = {}
-                if instance_id_1 not in times:
-                    times[instance_id_1] = {}
-                if instance_id_1 not in stds:
-                    stds[instance_id_1] = {}
-                if instance_id_1 not in mappings:
-                    mappings[instance_id_1] = {}
-
-                if instance_id_2 not in distances:
-                    distances[instance_id_2] = {}
-                if instance_id_2 not in times:
-                    times[instance_id_2] = {}
-                if instance_id_2 not in stds:
-                    stds[instance_id_2] = {}
-                if instance_id_2 not in mappings:
-                    mappings[instance_id_2] = {}
+        for instance_id_1, instance_id_2, row in rows:
+            for matrix, column in [
+                (distances, "distance"),
+                (times, "time"),
+                (stds, "std"),
+            ]:
+                value = _to_float(row.get(column))
+                if value is not None:
+                    matrix.set_value(instance_id_1, instance_id_2, value)
 
+            if row.get("mapping") not in (None, "", "None"):
                 try:
-                    distances[instance_id_1][instance_id_2] = float(row["distance"])
-                    distances[instance_id_2][instance_id_1] = distances[instance_id_1][
-                        instance_id_2
-                    ]
-                except:
-                    pass
-
-                try:
-                    times[instance_id_1][instance_id_2] = float(row["time"])
-                    times[instance_id_2][instance_id_1] = times[instance_id_1][
-                        instance_id_2
-                    ]
-                except:
-                    pass
-
-                try:
-                    stds[instance_id_1][instance_id_2] = float(row["std"])
-                    stds[instance_id_2][instance_id_1] = stds[instance_id_1][
-                        instance_id_2
-                    ]
-                except:
-                    pass
-
-                try:
-                    mappings[instance_id_1][instance_id_2] = ast.literal_eval(
-                        str(row["mapping"])
-                    )
-                    mappings[instance_id_2][instance_id_1] = np.argsort(
-                        mappings[instance_id_1][instance_id_2]
+                    matching = ast.literal_eval(str(row["mapping"]))
+                except (ValueError, SyntaxError):
+                    logging.warning(
+                        f"Skipping the unreadable matching of {instance_id_1} "
+                        f"and {instance_id_2}: {row['mapping']!r}"
                     )
-                except:
-                    pass
-
-                if instance_id_1 not in instance_ids:
-                    warn = True
-
-            if warn:
-                text = f"Possibly outdated distances are imported!"
-                logging.warning(text)
+                else:
+                    matchings.set_matching(instance_id_1, instance_id_2, matching)
 
-        return distances, times, stds, mappings
+        return distances, times, stds, matchings
 
     except FileNotFoundError:
-        return dict(), dict(), dict(), dict()
+        return DistanceMatrix(), DistanceMatrix(), DistanceMatrix(), MatchingStore()
 
 
 def get_values_from_csv_file(
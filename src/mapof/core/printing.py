@@ -1425,28 +1425,28 @@ def print_matrix(
             mapping[ctr] = instance_id
             ctr += 1
 
-    # PREPARE EMPTY DICTS
-    matrix = {family_id_1: {} for family_id_1 in selected_families}
-    quantities = {family_id_1: {} for family_id_1 in selected_families}
-
-    for family_id_1 in selected_families:
-        for family_id_2 in selected_families:
-            matrix[family_id_1][family_id_2] = 0
-            quantities[family_id_1][family_id_2] = 0
-
     # ADD VALUES
-    for i in range(num_selected_instances):
-        limit = i + 1
-        if self_distances:
-            limit = i
-        for j in range(limit, num_selected_instances):
-            if time:
-                matrix[bucket[i]][bucket[j]] += experiment.times[mapping[i]][mapping[j]]
-            else:
-                matrix[bucket[i]][bucket[j]] += experiment.distances[mapping[i]][
-                    mapping[j]
-                ]
-            quantities[bucket[i]][bucket[j]] += 1
+    values = experiment.times if time else experiment.distances
+    values = values.to_array([mapping[i] for i in range(num_selected_instances)])
+    family_index = {family_id: f for f, family_id in enumerate(selected_families)}
+    bucket_index = np.array([family_index[family_id] for family_id in bucket])
+    rows, cols = np.triu_indices(num_selected_instances, k=0 if self_distances else 1)
+    sums = np.zeros((num_selected_families, num_selected_families))
+    counts = np.zeros((num_selected_families, num_selected_families))
+    np.add.at(sums, (bucket_index[rows], bucket_index[cols]), values[rows, cols])
+    np.add.at(counts, (bucket_index[rows], bucket_index[cols]), 1)
+    matrix = {
+        family_id_1: {
+            family_id_2: sums[f, g] for g, family_id_2 in enumerate(selected_families)
+        }
+        for f, family_id_1 in enumerate(selected_families)
+    }
+    quantities = {
+        family_id_1: {
+            family_id_2: counts[f, g] for g, family_id_2 in enumerate(selected_families)
+        }
+        for f, family_id_1 in enumerate(selected_families)
+    }
     # NORMALIZE
     # for family_id_1, family_id_2 in combinations(election.families, 2):
     # for family_id_1, family_id_2 in product(election.families, 2):
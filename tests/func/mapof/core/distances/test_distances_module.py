@@ -2,6 +2,8 @@ import numpy as np
 import pytest
 
 from mapof.core import distances as distances_module
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.MatchingStore import MatchingStore
 
 
 class DummyExperiment:
@@ -47,9 +49,9 @@ def test_run_single_process_records_matchings(monkeypatch, tmp_path):
     patch_time(monkeypatch, [10.0, 10.5])
     experiment = DummyExperiment(returns_matching=True)
     ids = [("A", "B")]
-    distances = {"A": {"B": None}, "B": {"A": None}}
-    times = {"A": {"B": None}, "B": {"A": None}}
-    matchings = {"A": {"B": None}, "B": {"A": None}}
+    distances = DistanceMatrix(["A", "B"])
+    times = DistanceMatrix(["A", "B"])
+    matchings = MatchingStore(["A", "B"])
 
     distances_module.run_single_process(experiment, ids, distances, times, matchings)
 
@@ -62,41 +64,114 @@ def test_run_single_process_records_matchings(monkeypatch, tmp_path):
     assert experiment.calls == 1
 
 
-def test_run_multiple_processes_exports_when_flagged(monkeypatch, tmp_path):
+def test_run_multiple_processes_returns_results_to_parent(tmp_path, monkeypatch):
     monkeypatch.chdir(tmp_path)
+    experiment = DummyExperiment(returns_matching=True, exported=True)
+    experiment.instances = {"A": ["foo"], "B": ["bar"], "C": ["baz"]}
+    ids = [("A", "B"), ("A", "C"), ("B", "C")]
+    distances = DistanceMatrix(["A", "B", "C"])
+    times = DistanceMatrix(["A", "B", "C"])
+    matchings = MatchingStore(["A", "B", "C"])
+
+    distances_module.run_multiple_processes(
+        experiment, ids, distances, times, matchings, num_processes=2
+    )
+
+    for instance_id_1, instance_id_2 in ids:
+        assert distances[instance_id_1][instance_id_2] == 7
+        assert distances[instance_id_2][instance_id_1] == 7
+        assert times.has_value(instance_id_1, instance_id_2)
+        assert np.array_equal(matchings[instance_id_1][instance_id_2], [1, 0])
+    assert not (tmp_path / "experiments").exists()
+
+
+def test_run_single_process_without_storing_matchings(monkeypatch):
     patch_tqdm(monkeypatch)
-    patch_time(monkeypatch, [5.0, 5.3])
-    experiment = DummyExperiment(exported=True)
-    ids = [("A", "B")]
-    distances = {"A": {"B": None}, "B": {"A": None}}
-    times = {"A": {"B": None}, "B": {"A": None}}
-    matchings = {"A": {"B": None}, "B": {"A": None}}
-
-    called = {}
-
-    def fake_export(exp, instances_ids, dist_arg, times_arg, process_id):
-        called["exp"] = exp
-        called["ids"] = instances_ids
-        called["distances"] = dist_arg
-        called["times"] = times_arg
-        called["process_id"] = process_id
-
-    monkeypatch.setattr(
-        distances_module.exports,
-        "export_distances_multiple_processes",
-        fake_export,
+    experiment = DummyExperiment(returns_matching=True)
+    distances = DistanceMatrix(["A", "B"])
+    times = DistanceMatrix(["A", "B"])
+
+    distances_module.run_single_process(
+        experiment, [("A", "B")], distances, times, None
     )
 
-    distances_module.run_multiple_processes(
-        experiment, ids, distances, times, matchings, process_id=2
+    assert distances["A"]["B"] == 7
+
+
+class MutatingExperiment(DummyExperiment):
+    def get_distance(self, instance_1, instance_2, distance_id):
+        instance_1.append("mutated")
+        return 1
+
+
+def test_run_single_process_shares_instances_without_copies(monkeypatch):
+    patch_tqdm(monkeypatch)
+    experiment = MutatingExperiment()
+    distances = DistanceMatrix(["A", "B"])
+    times = DistanceMatrix(["A", "B"])
+
+    distances_module.run_single_process(
+        experiment, [("A", "B")], distances, times, {}, copy_instances=False
+    )
+
+    assert experiment.instances["A"] == ["foo", "mutated"]
+
+
+def test_run_single_process_copies_instances_by_default(monkeypatch):
+    patch_tqdm(monkeypatch)
+    experiment = MutatingExperiment()
+    distances = DistanceMatrix(["A", "B"])
+    times = DistanceMatrix(["A", "B"])
+
+    distances_module.run_single_process(experiment, [("A", "B")], distances, times, {})
+
+    assert experiment.instances["A"] == ["foo"]
+
+
+def test_run_single_process_detects_mutations(monkeypatch):
+    patch_tqdm(monkeypatch)
+    experiment = MutatingExperiment()
+    distances = DistanceMatrix(["A", "B"])
+    times = DistanceMatrix(["A", "B"])
+
+    with pytest.raises(RuntimeError, match="modified instance A"):
+        distances_module.run_single_process(
+            experiment,
+            [("A", "B")],
+            distances,
+            times,
+            {},
+            copy_instances=False,
+            check_mutations=True,
+        )
+
+
+def test_make_chunks_balances_uniform_costs():
+    ids = [(f"a{i}", f"b{i}") for i in range(80)]
+
+    chunks = distances_module._make_chunks(ids, num_processes=5)
+
+    assert len(chunks) == 40
+    assert [pair for chunk in chunks for pair in chunk] == ids
+
+
+def test_make_chunks_schedules_expensive_pairs_first():
+    ids = [("A", "B"), ("A", "C"), ("B", "C"), ("C", "D")]
+    costs = np.array([1.0, 1.0, 100.0, 1.0])
+
+    chunks = distances_module._make_chunks(
+        ids, num_processes=2, costs=costs, chunks_per_process=2
+    )
+
+    assert chunks[0] == [("B", "C")]
+    assert sorted(pair for chunk in chunks for pair in chunk) == sorted(ids)
+
+
+def test_estimate_costs_uses_previous_times():
+    previous_times = DistanceMatrix.from_dict({"A": {"B": 4.0, "C": 2.0}})
+
+    costs = distances_module._estimate_costs(
+        [("A", "B"), ("A", "C"), ("B", "D")], previous_times
     )
 
-    assert distances["A"]["B"] == 3
-    assert distances["B"]["A"] == 3
-    assert times["A"]["B"] == pytest.approx(0.3)
-    assert times["B"]["A"] == pytest.approx(0.3)
-    assert called["exp"] is experiment
-    assert called["ids"] == ids
-    assert called["distances"] is distances
-    assert called["times"] is times
-    assert called["process_id"] == 2
+    assert np.array_equal(costs, [4.0, 2.0, 3.0])
@@ -46,6 +46,19 @@ class TestDistanceFunctions(unittest.TestCase):
         self.assertAlmostEqual(emdinf([1, 2, 3], [1, 2, 3]), 0)
         self.assertAlmostEqual(emdinf([1, 2, 3], [3, 2, 1]), 1.3333333333333333)
 
+    def test_emdinf_different_lengths(self):
+        self.assertAlmostEqual(emdinf([1], [0.5, 0.5]), 0)
+        self.assertAlmostEqual(emdinf([1, 0], [1]), 0.25)
+        self.assertAlmostEqual(emdinf([0.5, 0.5], [1, 0, 0]), 1 / 3)
+
+    def test_cost_tables(self):
+        rng = np.random.default_rng(2)
+        vectors_1 = rng.random((4, 6))
+        vectors_2 = rng.random((3, 6))
+        for table_func, func in [(emd_cost_table, emd), (emdinf_cost_table, emdinf)]:
+            expected = [[func(v_1, v_2) for v_2 in vectors_2] for v_1 in vectors_1]
+            np.testing.assert_allclose(table_func(vectors_1, vectors_2), expected)
+
     def test_hamming(self):
         self.assertEqual(hamming({1, 2, 3}, {1, 2, 3}), 0)
         self.assertEqual(hamming({1, 2, 3}, {2, 3, 4}), 2)
@@ -63,10 +76,103 @@ class TestDistanceFunctions(unittest.TestCase):
         self.assertEqual(swap_distance_between_potes([0, 1, 2], [0, 1, 2]), 0)
         self.assertEqual(swap_distance_between_potes([0, 1, 2], [2, 1, 0]), 3)
 
+    def test_vote_to_pote_partial_vote(self):
+        self.assertEqual(vote_to_pote([2, 0]), [1, 0])
+        self.assertEqual(vote_to_pote([1, 1, 0]), [2, 0])
+
+    def test_swap_distance_with_matching(self):
+        self.assertEqual(swap_distance([0, 1, 2], [2, 1, 0], matching=[2, 1, 0]), 0)
+
+    def test_swap_distance_matches_pair_counting(self):
+        rng = np.random.default_rng(3)
+        for m in [1, 2, 7, 33]:
+            pote_1 = rng.permutation(m)
+            pote_2 = rng.permutation(m)
+            expected = sum(
+                (pote_1[i] - pote_1[j]) * (pote_2[i] - pote_2[j]) < 0
+                for i in range(m)
+                for j in range(i + 1, m)
+            )
+            self.assertEqual(swap_distance_between_potes(pote_1, pote_2), expected)
+
+    def test_swap_distance_between_potes_batch(self):
+        rng = np.random.default_rng(4)
+        potes_1 = np.array([rng.permutation(9) for _ in range(5)])
+        potes_2 = np.array([rng.permutation(9) for _ in range(5)])
+        expected = [
+            swap_distance_between_potes(pote_1, pote_2)
+            for pote_1, pote_2 in zip(potes_1, potes_2)
+        ]
+        self.assertEqual(
+            list(swap_distance_between_potes_batch(potes_1, potes_2)), expected
+        )
+
+    def test_large_swap_distance_batch_with_ties(self):
+        rng = np.random.default_rng(5)
+        potes_1 = rng.integers(0, 6, size=(40, 30))
+        potes_2 = rng.integers(0, 6, size=(40, 30))
+        expected = [
+            sum(
+                (pote_1[i] - pote_1[j]) * (pote_2[i] - pote_2[j]) < 0
+                for i in range(30)
+                for j in range(i + 1, 30)
+            )
+            for pote_1, pote_2 in zip(potes_1, potes_2)
+        ]
+        self.assertEqual(
+            list(swap_distance_between_potes_batch(potes_1, potes_2)), expected
+        )
+        self.assertEqual(
+            [swap_distance_between_potes(*potes) for potes in zip(potes_1, potes_2)],
+            expected,
+        )
+
     def test_spearman_distance_between_potes(self):
         self.assertEqual(spearman_distance_between_potes([0, 1, 2], [0, 1, 2]), 0)
         self.assertEqual(spearman_distance_between_potes([0, 1, 2], [2, 1, 0]), 4)
 
+    def test_map_str_to_func_batched(self):
+        self.assertEqual(map_str_to_func("l1", batched=True), l1_batch)
+        self.assertEqual(map_str_to_func("emdinf", batched=True), emdinf_batch)
+        self.assertEqual(map_str_to_func("hamming", batched=True), None)
+
+    def test_batched_distances_match_single_ones(self):
+        rng = np.random.default_rng(0)
+        vectors_1 = rng.random((6, 5))
+        vectors_2 = rng.random((6, 5))
+        for name in ["l1", "l2", "chebyshev", "hellinger", "emd", "emdinf"]:
+            func = map_str_to_func(name)
+            batched_func = map_str_to_func(name, batched=True)
+            expected = [
+                func(vector_1, vector_2)
+                for vector_1, vector_2 in zip(vectors_1, vectors_2)
+            ]
+            np.testing.assert_allclose(
+                batched_func(vectors_1, vectors_2), expected, err_msg=name
+            )
+
+    def test_pairwise_cost_table(self):
+        rng = np.random.default_rng(1)
+        vectors_1 = rng.random((4, 3))
+        vectors_2 = rng.random((5, 3))
+        table = pairwise_cost_table(emd_batch, vectors_1, vectors_2)
+        self.assertEqual(table.shape, (4, 5))
+        self.assertAlmostEqual(table[2, 3], emd(list(vectors_1[2]), vectors_2[3]))
+
+    def test_spearman_and_swap_cost_tables(self):
+        rng = np.random.default_rng(5)
+        potes_1 = np.array([rng.permutation(6) for _ in range(7)])
+        potes_2 = np.array([rng.permutation(6) for _ in range(4)])
+        for table_func, func in [
+            (spearman_cost_table, spearman_distance_between_potes),
+            (swap_cost_table, swap_distance_between_potes),
+        ]:
+            expected = [[func(p_1, p_2) for p_2 in potes_2] for p_1 in potes_1]
+            np.testing.assert_array_equal(table_func(potes_1, potes_2), expected)
+            np.testing.assert_array_equal(
+                table_func(potes_1, potes_2, chunk_size=3), expected
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
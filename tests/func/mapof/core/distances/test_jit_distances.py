@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import mapof.core.distances.inner_distances as inner
+from mapof.core.distances import jit_distances as jit
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.random(7), rng.random(7)
+
+
+@pytest.mark.parametrize("name", ["chebyshev", "hellinger", "emd", "emdinf"])
+def test_jit_distances_match_pure_python(vectors, name):
+    vector_1, vector_2 = vectors
+    assert jit.JIT_FUNCTIONS[name](vector_1, vector_2) == pytest.approx(
+        getattr(inner, name)(vector_1, vector_2)
+    )
+
+
+def test_jit_emdinf_different_lengths():
+    assert jit.emdinf([1, 0], [1]) == pytest.approx(inner.emdinf([1, 0], [1]))
+
+
+def test_jit_discrete():
+    assert jit.discrete([1, 2, 3], [1, 2, 3]) == 0
+    assert jit.discrete([1, 2, 3], [1, 2, 4]) == 1
+    assert jit.discrete(["a", "b"], ["a", "c"]) == 1
+
+
+@pytest.mark.parametrize("num_values", [12, 4])
+def test_jit_swap_distance_between_potes(num_values):
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        pote_1 = rng.integers(0, num_values, size=12)
+        pote_2 = rng.integers(0, num_values, size=12)
+        assert jit.swap_distance_between_potes(
+            pote_1, pote_2
+        ) == inner.swap_distance_between_potes(pote_1, pote_2)
+
+
+def test_swap_distance_uses_jit(monkeypatch):
+    calls = []
+
+    def swap_distance_between_potes(pote_1, pote_2):
+        calls.append((list(pote_1), list(pote_2)))
+        return jit.swap_distance_between_potes(pote_1, pote_2)
+
+    monkeypatch.setattr(jit, "JIT_AVAILABLE", True)
+    monkeypatch.setitem(jit.JIT_FUNCTIONS, "swap", swap_distance_between_potes)
+    monkeypatch.setattr(inner, "_JIT_ENABLED", True)
+
+    assert inner.swap_distance([0, 1, 2], [2, 1, 0]) == 3
+    assert calls == [([0, 1, 2], [2, 1, 0])]
+    assert inner.map_str_to_func("swap") is swap_distance_between_potes
+
+
+def test_set_jit_enabled(monkeypatch):
+    monkeypatch.setattr(jit, "JIT_AVAILABLE", True)
+    monkeypatch.setattr(inner, "_JIT_ENABLED", inner._JIT_ENABLED)
+
+    inner.set_jit_enabled(True)
+    assert inner.map_str_to_func("emd") is jit.emd
+    assert inner.map_str_to_func("l1") is inner.l1
+    inner.set_jit_enabled(False)
+    assert inner.map_str_to_func("emd") is inner.emd
+
+
+@pytest.mark.parametrize(
+    "name, kernel",
+    [
+        ("chebyshev", "_chebyshev"),
+        ("hellinger", "_hellinger"),
+        ("emd", "_emd"),
+        ("emdinf", "_emdinf"),
+        ("discrete", "_discrete"),
+        ("swap", "_swap_distance_between_potes"),
+    ],
+)
+def test_numba_compiles_kernels(monkeypatch, name, kernel):
+    pytest.importorskip("numba")
+    monkeypatch.setattr(inner, "_JIT_ENABLED", True)
+    assert jit.JIT_AVAILABLE
+    assert hasattr(getattr(jit, kernel), "py_func")
+    assert inner.map_str_to_func(name) is jit.JIT_FUNCTIONS[name]
+
+
+@pytest.mark.parametrize("name", ["chebyshev", "hellinger", "emd", "emdinf"])
+def test_compiled_distances_match_numpy(name):
+    pytest.importorskip("numba")
+    rng = np.random.default_rng(2)
+    for _ in range(20):
+        vector_1 = rng.random(9)
+        vector_2 = rng.random(9)
+        vector_1 /= vector_1.sum()
+        vector_2 /= vector_2.sum()
+        assert jit.JIT_FUNCTIONS[name](vector_1, vector_2) == pytest.approx(
+            getattr(inner, name)(vector_1, vector_2)
+        )
+
+
+def test_compiled_discrete_matches_numpy():
+    pytest.importorskip("numba")
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        vector_1 = rng.integers(0, 3, size=10)
+        vector_2 = rng.integers(0, 3, size=10)
+        assert jit.discrete(vector_1, vector_2) == inner.discrete(vector_1, vector_2)
+
+
+@pytest.mark.parametrize("num_values", [12, 4, 2])
+def test_compiled_swap_distance_matches_numpy(num_values):
+    pytest.importorskip("numba")
+    rng = np.random.default_rng(4)
+    for _ in range(20):
+        pote_1 = rng.integers(0, num_values, size=12)
+        pote_2 = rng.integers(0, num_values, size=12)
+        assert jit.swap_distance_between_potes(
+            pote_1, pote_2
+        ) == inner.swap_distance_between_potes(pote_1, pote_2)
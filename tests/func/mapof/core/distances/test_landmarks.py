@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+from mapof.core.distances.landmarks import (
+    PairValues,
+    _sample_pairs,
+    landmark_distances,
+    landmark_mds,
+)
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+
+
+def euclidean_setup(num_instances=80, dim=3, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.normal(size=(num_instances, dim))
+    ids = [f"p{i}" for i in range(num_instances)]
+    index = {instance_id: i for i, instance_id in enumerate(ids)}
+    distances = PairValues(ids)
+    evaluated = []
+
+    def run(pairs):
+        for instance_id_1, instance_id_2 in pairs:
+            evaluated.append((instance_id_1, instance_id_2))
+            value = np.linalg.norm(
+                points[index[instance_id_1]] - points[index[instance_id_2]]
+            )
+            distances.set_value(instance_id_1, instance_id_2, value)
+
+    return points, distances, run, evaluated
+
+
+def test_landmark_mds_recovers_euclidean_distances():
+    rng = np.random.default_rng(1)
+    points = rng.normal(size=(50, 2))
+    pivots = [0, 7, 13, 21, 42]
+    pivot_distances = np.linalg.norm(
+        points[pivots][:, None, :] - points[None, :, :], axis=2
+    )
+
+    coordinates = landmark_mds(pivot_distances, pivots)
+
+    assert coordinates.shape == (50, 2)
+    expected = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    result = np.linalg.norm(coordinates[:, None] - coordinates[None, :], axis=2)
+    assert np.allclose(result, expected)
+
+
+def test_landmark_distances_uses_few_exact_evaluations():
+    points, distances, run, evaluated = euclidean_setup()
+
+    result = landmark_distances(distances, run, num_pivots=6, num_check_pairs=50)
+
+    stats = result.stats
+    assert stats["num_pivots"] == 6
+    assert stats["dim"] == 3
+    assert stats["num_evaluated"] == len(evaluated) < stats["pairs"]
+    assert stats["num_checked"] == 50
+    assert stats["max_abs_error"] < 1e-8
+    assert result.coordinates.shape == (80, 3)
+    assert result.pivot_distances.shape == (6, 80)
+    assert len(distances.values) == len(evaluated)
+    expected = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    assert np.allclose(result.to_array(), expected)
+    subset = ["p5", "p0", "p17"]
+    assert np.allclose(
+        result.to_array(subset), expected[np.ix_([5, 0, 17], [5, 0, 17])]
+    )
+    assert np.isclose(result.get_value("p1", "p2"), expected[1, 2])
+
+
+def test_landmark_distances_marks_exact_values():
+    _, distances, run, evaluated = euclidean_setup(num_instances=20)
+    distances.set_value("p3", "p4", 123.0)
+
+    result = landmark_distances(
+        distances, run, num_pivots=4, pivot_method="random", num_check_pairs=10
+    )
+
+    assert distances.get_value("p3", "p4") == 123.0
+    assert ("p3", "p4") not in evaluated and ("p4", "p3") not in evaluated
+    for instance_id_1, instance_id_2 in evaluated:
+        assert result.is_exact(instance_id_1, instance_id_2)
+        assert result.get_value(instance_id_1, instance_id_2) == distances.get_value(
+            instance_id_1, instance_id_2
+        )
+    num_exact = sum(
+        result.is_exact(f"p{i}", f"p{j}") for i in range(20) for j in range(i + 1, 20)
+    )
+    assert num_exact == len(evaluated) < 190
+    assert np.all(np.diagonal(result.to_array()) == 0.0)
+
+
+def test_landmark_distances_accept_distance_matrix():
+    points, _, _, _ = euclidean_setup(num_instances=15)
+    distances = DistanceMatrix([f"p{i}" for i in range(15)])
+
+    def run(pairs):
+        for instance_id_1, instance_id_2 in pairs:
+            i, j = int(instance_id_1[1:]), int(instance_id_2[1:])
+            distances.set_value(
+                instance_id_1, instance_id_2, np.linalg.norm(points[i] - points[j])
+            )
+
+    result = landmark_distances(distances, run, num_pivots=4, num_check_pairs=5)
+
+    assert np.isnan(distances.matrix).sum() > 0
+    assert result.stats["max_abs_error"] < 1e-8
+
+
+def test_landmark_distances_reports_error_for_non_euclidean_distance():
+    rng = np.random.default_rng(2)
+    points = rng.random(size=(60, 5))
+    ids = [f"p{i}" for i in range(60)]
+    distances = PairValues(ids)
+
+    def run(pairs):
+        for instance_id_1, instance_id_2 in pairs:
+            i, j = int(instance_id_1[1:]), int(instance_id_2[1:])
+            distances.set_value(
+                instance_id_1, instance_id_2, np.abs(points[i] - points[j]).sum()
+            )
+
+    stats = landmark_distances(distances, run, num_pivots=15, num_check_pairs=200).stats
+
+    assert 0 < stats["mean_abs_error"] <= stats["max_abs_error"]
+    assert stats["normalized_stress"] < 0.5
+    assert stats["correlation"] > 0.5
+
+
+@pytest.mark.parametrize("num_instances", [2, 5, 40])
+def test_sample_pairs_can_draw_all_pairs(num_instances):
+    excluded = np.zeros(num_instances, dtype=bool)
+    excluded[0] = num_instances > 2
+
+    rows, cols = _sample_pairs(num_instances, excluded, num_instances**2)
+
+    num_candidates = num_instances - excluded.sum()
+    assert len(set(zip(rows, cols))) == len(rows)
+    assert len(rows) == num_candidates * (num_candidates - 1) // 2
+    assert np.all(rows < cols)
+    assert not excluded[rows].any() and not excluded[cols].any()
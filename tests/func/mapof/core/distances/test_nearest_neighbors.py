@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from mapof.core.distances.nearest_neighbors import (
+    _ExactDistances,
+    nearest_neighbors,
+    select_pivots,
+)
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+
+
+class PointsExperiment:
+    def __init__(self, num_instances=60, seed=0):
+        rng = np.random.default_rng(seed)
+        # A few well separated clusters, so that pruning pays off
+        centers = rng.uniform(-50, 50, size=(4, 2))
+        self.instances = {
+            f"p{i}": centers[i % 4] + rng.normal(size=2) for i in range(num_instances)
+        }
+        self.distance_id = "l2"
+        self.distances = DistanceMatrix()
+        self.calls = 0
+
+    def get_distance(self, instance_1, instance_2, distance_id):
+        self.calls += 1
+        return float(np.linalg.norm(instance_1 - instance_2))
+
+
+def brute_force(experiment, instance_id, k):
+    values = sorted(
+        (
+            float(np.linalg.norm(experiment.instances[instance_id] - point)),
+            other_id,
+        )
+        for other_id, point in experiment.instances.items()
+        if other_id != instance_id
+    )
+    return [other_id for _, other_id in values[:k]]
+
+
+def test_nearest_neighbors_of_all_instances_are_exact():
+    experiment = PointsExperiment()
+
+    neighbors, stats = nearest_neighbors(experiment, k=3)
+
+    for instance_id in experiment.instances:
+        found = [other_id for other_id, _ in neighbors[instance_id]]
+        assert found == brute_force(experiment, instance_id, 3)
+    assert stats["evaluated"] == experiment.calls
+    assert stats["avoided"] > 0
+    assert stats["evaluated"] + stats["avoided"] == 60 * 59 // 2
+
+
+def test_nearest_neighbors_of_single_instance_with_lower_bound():
+    experiment = PointsExperiment()
+
+    def lower_bound(instance_1, instance_2):
+        return float(np.max(np.abs(instance_1 - instance_2)))
+
+    neighbors, stats = nearest_neighbors(
+        experiment, instance_id="p5", k=4, lower_bound=lower_bound
+    )
+
+    assert [other_id for other_id, _ in neighbors["p5"]] == brute_force(
+        experiment, "p5", 4
+    )
+    distances = [distance for _, distance in neighbors["p5"]]
+    assert distances == sorted(distances)
+    assert stats["evaluated"] < 59
+
+
+def test_nearest_neighbors_reuses_known_distances():
+    experiment = PointsExperiment(num_instances=10)
+    ids = list(experiment.instances)
+    experiment.distances = DistanceMatrix(ids)
+    for i, id_1 in enumerate(ids):
+        for id_2 in ids[i + 1 :]:
+            experiment.distances.set_value(
+                id_1,
+                id_2,
+                np.linalg.norm(experiment.instances[id_1] - experiment.instances[id_2]),
+            )
+
+    neighbors, stats = nearest_neighbors(experiment, k=2)
+
+    assert experiment.calls == 0
+    assert stats["evaluated"] == 0
+    assert [other_id for other_id, _ in neighbors["p0"]] == brute_force(
+        experiment, "p0", 2
+    )
+
+
+def test_exact_distances_look_up_known_subset_lazily():
+    experiment = PointsExperiment(num_instances=10)
+    known = DistanceMatrix(["p7", "p3", "p0"])
+    known.set_value("p3", "p7", 123.0)
+    known.set_value("p0", "p3", 4.0)
+    distance = _ExactDistances(experiment, "l2", known)
+
+    assert distance("p7", "p3") == 123.0
+    assert distance("p1", "p2") == distance("p2", "p1")
+    assert experiment.calls == 1
+    assert distance.num_evaluations == 1
+    row = distance.row("p3")
+    assert row[7] == 123.0 and row[0] == 4.0
+    assert np.isnan(row[[1, 2, 3, 4, 5, 6, 8, 9]]).all()
+    assert distance.row("p2")[1] == distance("p1", "p2")
+
+
+def test_select_pivots_maxmin_spreads_pivots():
+    points = {"a": 0.0, "b": 1.0, "c": 10.0, "d": 5.0}
+
+    pivots, pivot_distances = select_pivots(
+        list(points), lambda x, y: abs(points[x] - points[y]), 3
+    )
+
+    assert pivots == ["a", "c", "d"]
+    assert np.array_equal(pivot_distances[1], [10.0, 9.0, 0.0, 5.0])
+
+
+def test_select_pivots_unknown_method():
+    with pytest.raises(ValueError):
+        select_pivots(["a"], lambda x, y: 0.0, 1, method="foo")
@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from mapof.core.embedding import embed as embed_module
+from mapof.core.embedding.embed import (
+    _embedding_matrix,
+    _nearest_neighbors_mask,
+    embed,
+)
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+
+
+def random_distances(num_instances=12, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.random((num_instances, 2))
+    distances = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    np.fill_diagonal(distances, np.nan)
+    return distances
+
+
+def test_nearest_neighbors_mask_is_symmetric_and_skips_diagonal():
+    distances = random_distances()
+
+    mask = _nearest_neighbors_mask(distances, 2)
+
+    assert np.array_equal(mask, mask.T)
+    assert not np.diagonal(mask).any()
+    nearest = np.argsort(distances, axis=1)[:, :2]
+    for i in range(len(distances)):
+        assert mask[i, nearest[i]].all()
+        assert mask[i].sum() >= 2
+
+
+def test_embedding_matrix_for_distance_based_methods():
+    distances = random_distances()
+
+    x = _embedding_matrix(distances.copy(), attraction_factor=2)
+
+    expected = np.nan_to_num(distances) ** 2
+    assert np.allclose(x, expected)
+
+
+def test_embedding_matrix_for_spring_embedding():
+    distances = random_distances()
+    distances[0, 1] = distances[1, 0] = 0.0
+
+    x = _embedding_matrix(
+        distances.copy(), spring=True, radius=0.5, num_neighbors=3, zero_distance=0.1
+    )
+
+    replaced = np.where(distances == 0.0, 0.1, distances)
+    mask = _nearest_neighbors_mask(replaced, 3) & (replaced <= 0.5)
+    expected = np.where(mask, 1.0 / np.where(mask, replaced, 1.0), 0.0)
+    assert np.allclose(x, expected)
+    assert x[0, 1] == 10.0
+    assert np.array_equal(x, x.T)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"embedding_id": "mds", "num_neighbors": 3},
+        {"embedding_id": "fr", "num_neighbors": 3, "init_pos": {"p0": [0.0, 0.0]}},
+        {"embedding_id": "fr"},
+        {"embedding_id": "fr", "num_neighbors": 3, "repulsoin": "exact"},
+    ],
+)
+def test_sparse_embedding_rejects_unsupported_options(kwargs):
+    experiment = SimpleNamespace(distances=None, is_exported=False)
+
+    with pytest.raises(ValueError):
+        embed(experiment, sparse=True, **kwargs)
+
+
+def test_sparse_embedding_with_radius_only(monkeypatch):
+    distances = random_distances()
+    ids = [f"p{i}" for i in range(len(distances))]
+    matrix = DistanceMatrix(ids)
+    matrix.matrix[:] = distances
+    experiment = SimpleNamespace(distances=matrix, is_exported=False)
+    graphs = []
+
+    def layout(graph, dim, num_iterations, **kwargs):
+        assert kwargs == {"seed": 3}
+        graphs.append(graph)
+        return np.zeros((graph.shape[0], dim))
+
+    monkeypatch.setattr(embed_module, "fruchterman_reingold", layout)
+    monkeypatch.setattr(embed_module.pr, "adjust_the_map", lambda *args, **kwargs: None)
+    embed(experiment, embedding_id="fr", radius=0.3, sparse=True, seed=3)
+
+    expected = _embedding_matrix(
+        distances.copy(), spring=True, radius=0.3, attraction_factor=2
+    )
+    assert np.allclose(graphs[0].toarray(), expected)
+    assert sorted(experiment.coordinates) == sorted(ids)
+
+
+def test_kamada_kawai_embedding_ignores_unrelated_kwargs(monkeypatch):
+    distances = random_distances()
+    ids = [f"p{i}" for i in range(len(distances))]
+    matrix = DistanceMatrix(ids)
+    matrix.matrix[:] = distances
+    experiment = SimpleNamespace(distances=matrix, is_exported=False)
+    options = []
+
+    class RecordingKamadaKawai(embed_module.KamadaKawai):
+        def __init__(self, **kwargs):
+            options.append(kwargs)
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(embed_module, "KamadaKawai", RecordingKamadaKawai)
+    monkeypatch.setattr(embed_module.pr, "adjust_the_map", lambda *args, **kwargs: None)
+    embed(experiment, embedding_id="kk", seed=0, repulsion="grid", perplexity=5)
+
+    assert options == [{"seed": 0}]
+    assert sorted(experiment.coordinates) == sorted(ids)
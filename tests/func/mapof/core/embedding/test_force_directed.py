@@ -0,0 +1,73 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from mapof.core.embedding.embed import _embedding_matrix
+from mapof.core.embedding.force_directed import (
+    _exact_repulsion,
+    _grid_repulsion,
+    fruchterman_reingold,
+    sparse_affinity_graph,
+)
+
+
+def random_distances(num_instances=40, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.random((num_instances, 2))
+    distances = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    np.fill_diagonal(distances, np.nan)
+    return distances
+
+
+@pytest.mark.parametrize(
+    "num_neighbors, radius", [(3, np.inf), (None, 0.3), (4, 0.2), (None, np.inf)]
+)
+def test_sparse_graph_matches_dense_matrix(num_neighbors, radius):
+    distances = random_distances()
+
+    graph = sparse_affinity_graph(
+        distances, radius=radius, num_neighbors=num_neighbors, factor=2.0
+    )
+
+    expected = _embedding_matrix(
+        distances * 2.0,
+        spring=True,
+        radius=radius,
+        num_neighbors=num_neighbors,
+        attraction_factor=2.0,
+    )
+    assert np.allclose(graph.toarray(), expected)
+
+
+def test_exact_layout_matches_networkx():
+    distances = random_distances()
+    graph = sparse_affinity_graph(distances, num_neighbors=4)
+    initial = np.random.default_rng(1).random((len(distances), 2))
+
+    positions = fruchterman_reingold(
+        graph, num_iterations=30, repulsion="exact", initial_positions=initial
+    )
+
+    expected = nx.spring_layout(
+        nx.from_numpy_array(graph.toarray()),
+        iterations=30,
+        pos={i: initial[i] for i in range(len(initial))},
+    )
+    expected = np.array([expected[i] for i in range(len(initial))])
+    assert np.allclose(positions, expected, atol=1e-6)
+
+
+def test_grid_repulsion_approximates_exact_repulsion():
+    positions = np.random.default_rng(2).normal(size=(500, 2))
+
+    exact = _exact_repulsion(positions, 1 / 500)
+    approx = _grid_repulsion(positions, 1 / 500)
+
+    assert np.linalg.norm(approx - exact) < 0.01 * np.linalg.norm(exact)
+
+
+def test_layout_with_unknown_repulsion():
+    graph = sparse_affinity_graph(random_distances(5), num_neighbors=2)
+
+    with pytest.raises(ValueError):
+        fruchterman_reingold(graph, repulsion="foo")
@@ -0,0 +1,200 @@
+import numpy as np
+import pytest
+
+from mapof.core.embedding.kamada_kawai.energy_functions import (
+    EnergyWorkspace,
+    get_sampled_energy,
+    get_sampled_energy_dxy,
+    get_total_energy,
+    get_total_energy_dxy,
+    get_total_energy_in_blocks,
+    sample_pairs,
+)
+from mapof.core.embedding.kamada_kawai import kamada_kawai as kamada_kawai_module
+from mapof.core.embedding.kamada_kawai.kamada_kawai import (
+    KamadaKawai,
+    _calc_k_with_special_value,
+    _pairs_with_coefficients,
+)
+from mapof.core.embedding.kamada_kawai.optimization_algorithms import (
+    optimize_bb,
+    smacof,
+)
+
+
+def random_instance(num_vertices=30, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.random((num_vertices, 3))
+    distances = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    positions = rng.random((num_vertices, 2))
+    return distances, positions
+
+
+def test_energy_in_blocks_matches_total_energy():
+    distances, positions = random_instance()
+    k = _calc_k_with_special_value(distances, 1)
+
+    assert np.isclose(
+        get_total_energy_in_blocks(positions, k, distances, block_size=7),
+        get_total_energy(positions, k, distances),
+    )
+
+
+def test_workspace_matches_total_energy_and_gradient():
+    distances, positions = random_instance()
+    k = _calc_k_with_special_value(distances, 10, [3])
+    workspace = EnergyWorkspace(k, distances, [3])
+
+    for _ in range(2):
+        energy, gradient = workspace.energy_and_gradient(positions)
+
+        assert np.isclose(energy, get_total_energy(positions, k, distances))
+        assert np.allclose(gradient, get_total_energy_dxy(positions, k, distances, [3]))
+        positions = positions + 0.1
+
+
+def test_sampled_energy_with_all_pairs_is_exact():
+    distances, positions = random_instance()
+    k = _calc_k_with_special_value(distances, 10, [3])
+    pairs = _pairs_with_coefficients(sample_pairs(distances, 20, 40), k, distances)
+
+    assert np.isclose(
+        get_sampled_energy(positions, pairs), get_total_energy(positions, k, distances)
+    )
+    assert np.allclose(
+        get_sampled_energy_dxy(positions, pairs, [3]),
+        get_total_energy_dxy(positions, k, distances, [3]),
+    )
+
+
+def test_sampled_energy_is_unbiased():
+    distances, positions = random_instance(num_vertices=80)
+    k = _calc_k_with_special_value(distances, 1)
+
+    estimates = [
+        get_sampled_energy(
+            positions,
+            _pairs_with_coefficients(
+                sample_pairs(distances, 5, 10, seed=seed), k, distances
+            ),
+        )
+        for seed in range(200)
+    ]
+
+    exact = get_total_energy(positions, k, distances)
+    assert abs(np.mean(estimates) - exact) < 0.05 * exact
+
+
+def test_sampled_gradient_matches_finite_differences():
+    distances, positions = random_instance(num_vertices=60)
+    k = _calc_k_with_special_value(distances, 1)
+    pairs = _pairs_with_coefficients(
+        sample_pairs(distances, 5, 10, seed=0), k, distances
+    )
+
+    gradient = get_sampled_energy_dxy(positions, pairs)
+
+    shift = np.zeros_like(positions)
+    shift[7, 1] = 1e-6
+    numeric = (
+        get_sampled_energy(positions + shift, pairs)
+        - get_sampled_energy(positions - shift, pairs)
+    ) / 2e-6
+    assert np.isclose(gradient[7, 1], numeric, rtol=1e-4)
+
+
+def test_sampled_optimizer_reports_energy():
+    distances, _ = random_instance(num_vertices=100)
+    kamada_kawai = KamadaKawai(
+        optim_method="bb-sampled", num_near_pairs=10, num_sampled_pairs=20, seed=0
+    )
+
+    positions = kamada_kawai.embed(distances, initial_positions={0: (0.0, 0.0)})
+
+    assert positions.shape == (100, 2)
+    assert np.array_equal(positions[0], [0.0, 0.0])
+    report = kamada_kawai.energy_report
+    k = _calc_k_with_special_value(distances, 1, [0])
+    assert np.isclose(report["exact_energy"], get_total_energy(positions, k, distances))
+    assert report["relative_error"] >= 0
+
+
+def test_auto_optimizer_uses_sampled_energy_for_large_inputs(monkeypatch):
+    distances, _ = random_instance(num_vertices=40)
+    kamada_kawai = KamadaKawai(optim_method="auto", seed=0)
+
+    kamada_kawai.embed(distances)
+    assert kamada_kawai.energy_report is None
+
+    monkeypatch.setattr(kamada_kawai_module, "_SAMPLED_MIN_VERTICES", 40)
+    kamada_kawai.embed(distances)
+    assert kamada_kawai.energy_report is not None
+
+
+def test_optimize_bb_with_fused_function():
+    distances, positions = random_instance()
+    k = _calc_k_with_special_value(distances, 1, [])
+    options = dict(
+        x0=positions, max_iter=20, init_step_size=1e-3, percentage_lookup_history=1000
+    )
+
+    separate = optimize_bb(
+        get_total_energy, get_total_energy_dxy, args=(k, distances), **options
+    )
+    workspace = EnergyWorkspace(k, distances)
+    fused = optimize_bb(
+        None, None, args=(), fused_func=workspace.energy_and_gradient, **options
+    )
+
+    assert np.allclose(fused, separate)
+    with pytest.raises(ValueError):
+        optimize_bb(get_total_energy, True, args=(k, distances), **options)
+    with pytest.raises(ValueError):
+        optimize_bb(
+            get_total_energy,
+            get_total_energy_dxy,
+            args=(),
+            fused_func=workspace.energy_and_gradient,
+            **options,
+        )
+
+
+def test_smacof_decreases_energy_monotonically():
+    distances, positions = random_instance(num_vertices=40)
+    k = _calc_k_with_special_value(distances, 1)
+
+    energies = [
+        get_total_energy(
+            smacof(k, distances, positions, max_iter=num_iter, epsilon=0), k, distances
+        )
+        for num_iter in range(1, 30)
+    ]
+
+    assert np.all(np.diff(energies) <= 1e-9)
+    assert energies[-1] < 0.5 * energies[0]
+
+
+def test_smacof_keeps_fixed_positions():
+    distances, positions = random_instance(num_vertices=40)
+    k = _calc_k_with_special_value(distances, 100, [2, 5])
+
+    result = smacof(k, distances, positions, fixed_indexes=[2, 5])
+
+    assert np.array_equal(result[[2, 5]], positions[[2, 5]])
+    assert get_total_energy(result, k, distances) < get_total_energy(
+        positions, k, distances
+    )
+
+
+def test_smacof_optimizer_matches_bb():
+    distances, _ = random_instance(num_vertices=50)
+    k = _calc_k_with_special_value(distances, 1)
+
+    energies = [
+        get_total_energy(
+            KamadaKawai(optim_method=optim_method).embed(distances), k, distances
+        )
+        for optim_method in ["bb", "smacof"]
+    ]
+
+    assert energies[1] <= 1.01 * energies[0]
@@ -1,3 +1,5 @@
+import pytest
+
 from mapof.core.features.distortion import (
     calculate_distortion,
     calculate_distortion_naive,
@@ -52,3 +54,21 @@ class TestFeatures:
         distortion_naive = calculate_distortion_naive(experiment, election_ids)
 
         assert distortion == distortion_naive
+
+    def test_distortion_with_missing_distance(self, mocker):
+        experiment = mocker.patch("mapof.core.objects.Experiment.Experiment")
+
+        experiment.distances = {
+            "ID": {"UN": 1, "a": 0.5},
+            "UN": {"a": 0.5, "b": 0.5},
+            "a": {"b": 0.5},
+        }
+        experiment.coordinates = {
+            "ID": [0, 0],
+            "UN": [1, 1],
+            "a": [0.12321, 0.4215],
+            "b": [0.124214, -0.1],
+        }
+
+        with pytest.raises(ValueError, match="ID and b"):
+            calculate_distortion(experiment, list(experiment.coordinates))
@@ -1,3 +1,4 @@
+import time
 import unittest
 import numpy as np
 from gurobipy import GRB
@@ -59,13 +60,145 @@ def test_solve_matching_vectors_rectangular():
     assert matching == [1, 0]
 
 
-def test_solve_matching_matrices_handles_non_optimal(monkeypatch, capsys):
+@pytest.mark.gurobi
+def test_solve_matching_matrices_handles_non_optimal(monkeypatch, caplog):
     matrix_1 = [[0, 1], [1, 0]]
     matrix_2 = [[0, 1], [1, 0]]
 
     monkeypatch.setattr(matchings_module.GRB, "OPTIMAL", -1)
 
-    result = solve_matching_matrices(matrix_1, matrix_2, 2, single_l1)
-    captured = capsys.readouterr()
-    assert result is None
-    assert "Exception raised while solving" in captured.out
+    result = solve_matching_matrices(matrix_1, matrix_2, 2, single_l1, solver="gurobi")
+    assert result == pytest.approx(0)
+    assert "may not be optimal" in caplog.text
+
+
+@pytest.mark.gurobi
+def test_gurobi_respects_time_limit(caplog):
+    matrix_1, matrix_2 = random_matrices(12)
+
+    start = time.time()
+    value = solve_matching_matrices(
+        matrix_1, matrix_2, 12, single_l1, solver="gurobi", time_limit=0.5
+    )
+
+    assert time.time() - start < 10
+    assert value is not None
+    assert value >= solve_matching_matrices_approx(matrix_1, matrix_2, 12, single_l1)[2]
+
+
+def test_small_matrices_use_branch_and_bound_by_default(monkeypatch):
+    def gurobi(*args):
+        raise AssertionError("Gurobi should not be used")
+
+    monkeypatch.setattr(matchings_module, "_solve_with_gurobi", gurobi)
+    matrix_1, matrix_2 = random_matrices(6)
+
+    assert solve_matching_matrices(
+        matrix_1, matrix_2, 6, single_l1
+    ) == solve_matching_matrices(matrix_1, matrix_2, 6, single_l1, solver="bnb")
+
+
+def test_solve_matching_matrices_branch_and_bound():
+    matrix_1 = [[0, 2, 1], [3, 0, 4], [1, 5, 0]]
+    matrix_2 = [[0, 5, 1], [3, 0, 4], [1, 2, 0]]
+    assert solve_matching_matrices(
+        matrix_1, matrix_2, 3, l1_distance, solver="bnb"
+    ) == pytest.approx(2)
+
+
+def test_solve_matching_matrices_branch_and_bound_finds_permutation():
+    rng = np.random.default_rng(0)
+    matrix_1 = rng.integers(0, 10, (7, 7))
+    np.fill_diagonal(matrix_1, 0)
+    permutation = rng.permutation(7)
+    matrix_2 = matrix_1[np.ix_(permutation, permutation)]
+    assert solve_matching_matrices(
+        matrix_1, matrix_2, 7, single_l1, solver="bnb"
+    ) == pytest.approx(0)
+
+
+def random_matrices(length, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix_1 = rng.integers(0, 10, (length, length))
+    matrix_2 = rng.integers(0, 10, (length, length))
+    np.fill_diagonal(matrix_1, 0)
+    np.fill_diagonal(matrix_2, 0)
+    return matrix_1, matrix_2
+
+
+def test_branch_and_bound_respects_time_limit(caplog):
+    matrix_1, matrix_2 = random_matrices(12)
+
+    start = time.time()
+    value = solve_matching_matrices(
+        matrix_1, matrix_2, 12, single_l1, solver="bnb", time_limit=0.5
+    )
+
+    assert time.time() - start < 5
+    assert "may not be optimal" in caplog.text
+    assert value >= solve_matching_matrices_approx(matrix_1, matrix_2, 12, single_l1)[2]
+
+
+def test_large_matrices_are_approximated_without_gurobi(monkeypatch, caplog):
+    monkeypatch.setattr(matchings_module, "gp", None)
+    matrix_1, matrix_2 = random_matrices(12)
+
+    value = solve_matching_matrices(matrix_1, matrix_2, 12, single_l1)
+
+    assert "approximated" in caplog.text
+    assert value == solve_matching_matrices_approx(matrix_1, matrix_2, 12, single_l1)[0]
+
+
+def test_solve_matching_matrices_unknown_solver():
+    with pytest.raises(ValueError):
+        solve_matching_matrices([[0]], [[0]], 1, single_l1, solver="unknown")
+
+
+def test_solve_matching_matrices_approx():
+    rng = np.random.default_rng(1)
+    matrix_1 = rng.integers(0, 10, (6, 6))
+    matrix_2 = rng.integers(0, 10, (6, 6))
+    np.fill_diagonal(matrix_1, 0)
+    np.fill_diagonal(matrix_2, 0)
+
+    exact = solve_matching_matrices(matrix_1, matrix_2, 6, single_l1, solver="bnb")
+    value, matching, lower_bound = solve_matching_matrices_approx(
+        matrix_1, matrix_2, 6, single_l1, time_limit=0.1, seed=0
+    )
+
+    assert sorted(matching) == list(range(6))
+    permuted = np.asarray(matrix_2)[np.ix_(matching, matching)]
+    assert value == pytest.approx(np.abs(np.asarray(matrix_1) - permuted).sum())
+    assert lower_bound <= exact + 1e-9 <= value + 1e-9
+
+
+def test_solve_matching_matrices_approx_as_solver():
+    matrix_1 = [[0, 2, 1], [3, 0, 4], [1, 5, 0]]
+    matrix_2 = [[0, 5, 1], [3, 0, 4], [1, 2, 0]]
+    assert solve_matching_matrices(
+        matrix_1, matrix_2, 3, l1_distance, solver="approx"
+    ) == pytest.approx(2)
+
+
+@pytest.mark.parametrize("length", [3, 8])
+def test_solve_matching_vectors_batch(length):
+    rng = np.random.default_rng(length)
+    cost_tables = rng.random((20, length, length))
+
+    objectives, matchings = solve_matching_vectors_batch(cost_tables)
+
+    for cost_table, objective, matching in zip(cost_tables, objectives, matchings):
+        expected, expected_matching = solve_matching_vectors(cost_table)
+        assert objective == pytest.approx(expected)
+        assert list(matching) == expected_matching
+
+
+def test_solve_matching_vectors_batch_multiple_processes():
+    rng = np.random.default_rng(0)
+    cost_tables = rng.random((16, 4, 4))
+
+    objectives, matchings = solve_matching_vectors_batch(cost_tables, num_processes=2)
+
+    expected, expected_matchings = solve_matching_vectors_batch(cost_tables)
+    np.testing.assert_allclose(objectives, expected)
+    np.testing.assert_array_equal(matchings, expected_matchings)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from mapof.core.objects.DistanceMatrix import DistanceMatrix, as_distance_matrix
+
+
+@pytest.fixture
+def distances():
+    return DistanceMatrix.from_dict(
+        {
+            "ID": {"UN": 1, "a": 0.75},
+            "UN": {"ID": 1, "a": 0.25},
+            "a": {"ID": 0.75, "UN": 0.25},
+        }
+    )
+
+
+def test_from_dict_keeps_order_and_values(distances):
+    assert list(distances) == ["ID", "UN", "a"]
+    assert distances["ID"]["UN"] == 1.0
+    assert distances["a"]["UN"] == 0.25
+    assert distances.matrix.shape == (3, 3)
+
+
+def test_rows_skip_missing_pairs(distances):
+    assert "ID" not in distances["ID"]
+    assert dict(distances["ID"]) == {"UN": 1.0, "a": 0.75}
+    assert len(distances["UN"]) == 2
+    with pytest.raises(KeyError):
+        distances["ID"]["ID"]
+
+
+def test_set_value_is_symmetric(distances):
+    distances.set_value("ID", "a", 3.0)
+    assert distances["a"]["ID"] == 3.0
+    assert distances.has_value("ID", "a")
+    assert not distances.has_value("ID", "ID")
+
+
+def test_rows_are_read_only(distances):
+    with pytest.raises(TypeError):
+        distances["ID"]["UN"] = 5
+
+
+def test_to_array_selects_and_fills(distances):
+    array = distances.to_array(["a", "ID"], missing=0.0)
+    assert np.array_equal(array, np.array([[0.0, 0.75], [0.75, 0.0]]))
+    array[0, 1] = 100
+    assert distances["a"]["ID"] == 0.75
+
+
+def test_reindex_keeps_known_values(distances):
+    reindexed = distances.reindex(["a", "new", "ID"])
+    assert list(reindexed) == ["a", "new", "ID"]
+    assert reindexed["a"]["ID"] == 0.75
+    assert len(reindexed["new"]) == 0
+
+
+def test_as_distance_matrix(distances):
+    assert as_distance_matrix(distances) is distances
+    assert as_distance_matrix(None) is None
+    assert as_distance_matrix({"x": {"y": 2}}).to_dict() == {
+        "x": {"y": 2.0},
+        "y": {"x": 2.0},
+    }
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from mapof.core.objects.MatchingStore import MatchingStore, as_matching_store
+
+
+def test_set_and_get_matching():
+    store = MatchingStore(["A", "B", "C"])
+    store.set_matching("A", "B", [2, 0, 1])
+
+    assert store.matchings.dtype == np.int16
+    assert store.has_matching("B", "A")
+    assert list(store.get_matching("A", "B")) == [2, 0, 1]
+    assert list(store.get_matching("B", "A")) == [1, 2, 0]
+    assert store.get_matching("A", "C") is None
+
+
+def test_matching_stored_in_reverse_direction():
+    store = MatchingStore(["A", "B"])
+    store.set_matching("B", "A", [1, 2, 0])
+
+    assert list(store["A"]["B"]) == [2, 0, 1]
+    assert list(store["B"]["A"]) == [1, 2, 0]
+
+
+def test_rows_behave_like_dicts():
+    store = MatchingStore(["A", "B", "C"])
+    store.set_matching("A", "C", [1, 0])
+
+    assert list(store["A"]) == ["C"]
+    assert list(store["C"]) == ["A"]
+    assert len(store["B"]) == 0
+    assert "C" in store["A"]
+    with pytest.raises(KeyError):
+        store["A"]["B"]
+
+
+def test_matchings_of_mixed_lengths():
+    store = MatchingStore(["A", "B", "C", "D"])
+    store.set_matching("A", "B", [1, 0])
+    store.set_matching("C", "A", [2, 0, 1])
+    store.set_matching("B", "D", [3, 1, 0, 2])
+
+    assert list(store["A"]["B"]) == [1, 0]
+    assert list(store["C"]["A"]) == [2, 0, 1]
+    assert list(store["A"]["C"]) == [1, 2, 0]
+    assert list(store["D"]["B"]) == [2, 1, 3, 0]
+
+    reindexed = store.reindex(["D", "C", "B", "A"])
+    assert list(reindexed["A"]["C"]) == [1, 2, 0]
+    assert list(reindexed["B"]["D"]) == [3, 1, 0, 2]
+
+    other = MatchingStore(["A", "E"])
+    other.set_matching("A", "E", [0, 2, 1])
+    merged = MatchingStore(["A", "B"])
+    merged.set_matching("A", "B", [1, 0])
+    merged = merged.merge(other).merge(store)
+    assert list(merged["A"]["E"]) == [0, 2, 1]
+    assert list(merged["C"]["A"]) == [2, 0, 1]
+    assert list(merged["A"]["B"]) == [1, 0]
+
+
+def test_reindex_keeps_matchings():
+    store = MatchingStore(["A", "B", "C"])
+    store.set_matching("A", "B", [2, 0, 1])
+    store.set_matching("B", "C", [0, 2, 1])
+
+    reindexed = store.reindex(["C", "B", "D"])
+
+    assert reindexed.ids == ["C", "B", "D"]
+    assert list(reindexed.get_matching("B", "C")) == [0, 2, 1]
+    assert list(reindexed.get_matching("C", "B")) == [0, 2, 1]
+    assert not reindexed.has_matching("B", "D")
+
+
+def test_as_matching_store_from_dict():
+    store = as_matching_store({"A": {"B": np.array([1, 0])}})
+
+    assert store.ids == ["A", "B"]
+    assert list(store["B"]["A"]) == [1, 0]
+    assert as_matching_store(None) is None
+    assert as_matching_store(store) is store
+
+
+def test_merge_keeps_own_matchings_and_adds_missing_ones():
+    store = MatchingStore(["a", "b"])
+    store.set_matching("a", "b", [1, 2, 0])
+    other = MatchingStore(["c", "b", "a"])
+    other.set_matching("a", "b", [0, 1, 2])
+    other.set_matching("c", "a", [2, 1, 0])
+
+    merged = store.merge(other)
+
+    assert merged.ids == ["a", "b", "c"]
+    assert list(merged["a"]["b"]) == [1, 2, 0]
+    assert list(merged["c"]["a"]) == [2, 1, 0]
+    assert not merged.has_matching("b", "c")
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.MatchingStore import MatchingStore
+from mapof.core.persistence.checkpoints import DistancesCheckpoint
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return DistancesCheckpoint("exp", "l1", interval=3600)
+
+
+def test_pairs_are_buffered_until_flush(checkpoint):
+    checkpoint.add("A", "B", 1.5, 0.1)
+
+    assert not os.path.exists(checkpoint.path)
+
+    checkpoint.flush()
+    distances = DistanceMatrix(["A", "B", "C"])
+    times = DistanceMatrix(["A", "B", "C"])
+
+    assert checkpoint.load(distances, times) == 1
+    assert distances["B"]["A"] == 1.5
+    assert times["A"]["B"] == 0.1
+    assert not distances.has_value("A", "C")
+
+
+def test_flush_appends(checkpoint):
+    checkpoint.add("A", "B", 1.0, 0.1)
+    checkpoint.flush()
+    checkpoint.add("A", "C", 2.0, 0.2)
+    checkpoint.flush()
+
+    distances = DistanceMatrix(["A", "B", "C"])
+    times = DistanceMatrix(["A", "B", "C"])
+
+    assert checkpoint.load(distances, times) == 2
+    assert distances["A"]["C"] == 2.0
+
+
+def test_load_skips_unknown_and_truncated_rows(checkpoint):
+    checkpoint.add("A", "B", 1.0, 0.1)
+    checkpoint.add("A", "X", 2.0, 0.2)
+    checkpoint.flush()
+    with open(checkpoint.path, "a") as file:
+        file.write("A;C;3.5")
+
+    distances = DistanceMatrix(["A", "B", "C"])
+    times = DistanceMatrix(["A", "B", "C"])
+
+    assert checkpoint.load(distances, times) == 1
+    assert distances["A"]["B"] == 1.0
+    assert not distances.has_value("A", "C")
+
+
+def test_remove(checkpoint):
+    checkpoint.add("A", "B", 1.0, 0.1)
+    checkpoint.flush()
+    checkpoint.remove()
+
+    distances = DistanceMatrix(["A", "B"])
+    assert checkpoint.load(distances, DistanceMatrix(["A", "B"])) == 0
+
+
+def test_matchings_are_restored(checkpoint):
+    checkpoint.add("A", "B", 1.0, 0.1, [2, 0, 1])
+    checkpoint.add("A", "C", 2.0, 0.2)
+    checkpoint.add("B", "C", 3.0, 0.3, [1, 2, 0])
+    checkpoint.flush()
+    with open(checkpoint.path, "a") as file:
+        file.write("C;A;4.0;0 2")
+
+    distances = DistanceMatrix(["A", "B", "C"])
+    times = DistanceMatrix(["A", "B", "C"])
+    matchings = MatchingStore(["A", "B", "C"])
+
+    assert checkpoint.load(distances, times, matchings) == 3
+    assert list(matchings["A"]["B"]) == [2, 0, 1]
+    assert list(matchings["C"]["B"]) == [2, 0, 1]
+    assert not matchings.has_matching("A", "C")
+
+
+def test_matchings_of_mixed_lengths_are_restored(checkpoint):
+    checkpoint.add("A", "B", 1.0, 0.1, [1, 0])
+    checkpoint.add("A", "C", 2.0, 0.2, [2, 0, 1])
+    checkpoint.flush()
+
+    distances = DistanceMatrix(["A", "B", "C"])
+    matchings = MatchingStore(["A", "B", "C"])
+
+    assert checkpoint.load(distances, DistanceMatrix(["A", "B", "C"]), matchings) == 2
+    assert distances["A"]["C"] == 2.0
+    assert list(matchings["A"]["B"]) == [1, 0]
+    assert list(matchings["A"]["C"]) == [2, 0, 1]
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pytest
+
+from mapof.core import distances as distances_module
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.MatchingStore import MatchingStore
+from mapof.core.persistence.distance_cache import DistanceCache, content_hash
+
+
+class Point:
+    def __init__(self, instance_id, values):
+        self.instance_id = instance_id
+        self.values = np.array(values)
+
+    def content_hash(self):
+        return content_hash(self, exclude=("instance_id",))
+
+
+class PointsExperiment:
+    def __init__(self, points):
+        self.instances = {
+            instance_id: Point(instance_id, values)
+            for instance_id, values in points.items()
+        }
+        self.distance_id = "l1"
+        self.calls = 0
+
+    def get_distance(self, instance_1, instance_2, distance_id):
+        self.calls += 1
+        # Matches the positions of equal rank
+        matching = np.empty(len(instance_1.values), dtype=int)
+        matching[np.argsort(instance_1.values)] = np.argsort(instance_2.values)
+        return float(np.abs(instance_1.values - instance_2.values).sum()), matching
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(distances_module, "tqdm", lambda iterable, **kwargs: iterable)
+    return DistanceCache()
+
+
+def run(experiment, pairs, cache):
+    ids = list(experiment.instances)
+    distances = DistanceMatrix(ids)
+    times = DistanceMatrix(ids)
+    matchings = MatchingStore(ids)
+    distances_module.run_single_process(
+        experiment, pairs, distances, times, matchings, cache=cache
+    )
+    return distances, matchings
+
+
+def test_content_hash_depends_only_on_data():
+    assert content_hash(Point("a", [1, 2])) == content_hash(Point("a", [1, 2]))
+    assert content_hash(Point("a", [1, 2])) != content_hash(Point("a", [2, 1]))
+    assert content_hash(Point("a", [1, 2]), exclude=("instance_id",)) == content_hash(
+        Point("b", [1, 2]), exclude=("instance_id",)
+    )
+
+
+def test_cached_pairs_are_not_recomputed(cache):
+    first = PointsExperiment({"A": [0, 1, 2], "B": [2, 0, 1], "C": [1, 1, 1]})
+    run(first, [("A", "B"), ("A", "C")], cache)
+
+    assert os.path.exists(cache.path)
+    assert len(cache) == 2
+
+    # Same data under other ids, and the pair in the other direction
+    second = PointsExperiment({"X": [2, 0, 1], "Y": [0, 1, 2], "Z": [1, 1, 1]})
+    distances, matchings = run(second, [("X", "Y"), ("X", "Z"), ("Y", "Z")], cache)
+
+    assert second.calls == 1
+    assert cache.num_hits == 2
+    assert distances["X"]["Y"] == 4.0
+    _, expected = second.get_distance(
+        second.instances["X"], second.instances["Y"], "l1"
+    )
+    assert np.array_equal(matchings["X"]["Y"], expected)
+
+
+def test_cache_persists_between_sessions(cache):
+    experiment = PointsExperiment({"A": [0, 1], "B": [1, 0]})
+    run(experiment, [("A", "B")], cache)
+    cache.close()
+
+    experiment = PointsExperiment({"A": [0, 1], "B": [1, 0]})
+    run(experiment, [("A", "B")], DistanceCache(cache.path))
+
+    assert experiment.calls == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.max_entries = 2
+    experiment = PointsExperiment({"A": [0], "B": [1], "C": [3], "D": [6]})
+    run(experiment, [("A", "B"), ("A", "C")], cache)
+    run(experiment, [("A", "B")], cache)
+    run(experiment, [("A", "D")], cache)
+
+    assert len(cache) == 2
+    hits, misses = cache.lookup(experiment, [("A", "B"), ("A", "C"), ("A", "D")])
+    assert [(hit[0], hit[1]) for hit in hits] == [("A", "B"), ("A", "D")]
+    assert misses == [("A", "C")]
+
+
+def test_other_distance_is_not_reused(cache):
+    experiment = PointsExperiment({"A": [0, 1], "B": [1, 0]})
+    run(experiment, [("A", "B")], cache)
+    experiment.distance_id = "l2"
+    run(experiment, [("A", "B")], cache)
+
+    assert experiment.calls == 2
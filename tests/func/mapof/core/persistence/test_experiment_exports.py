@@ -3,7 +3,9 @@ from pathlib import Path
 
 import pytest
 
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
 from mapof.core.persistence import experiment_exports as exports
+from mapof.core.persistence import experiment_imports as imports
 
 
 class DummyExperiment:
@@ -158,30 +160,60 @@ def test_export_distances_to_file(tmp_path, monkeypatch):
     ]
 
 
-def test_export_distances_multiple_processes(tmp_path, monkeypatch):
+def test_export_distances_to_file_from_distance_matrix(tmp_path, monkeypatch):
     monkeypatch.chdir(tmp_path)
     experiment = DummyExperiment()
-    dist_dir = tmp_path / "experiments" / experiment.experiment_id / "distances"
-    dist_dir.mkdir(parents=True, exist_ok=True)
-    distances = {"inst_a": {"inst_b": 1.5}}
-    times = {"inst_a": {"inst_b": 0.5}}
-    exports.export_distances_multiple_processes(
-        experiment,
-        [("inst_a", "inst_b")],
-        distances,
-        times,
-        process_id=3,
+    distances = DistanceMatrix.from_dict({"inst_a": {"inst_b": 5.0, "inst_c": 1.5}})
+    times = DistanceMatrix.from_dict({"inst_a": {"inst_b": 0.25}})
+
+    exports.export_distances_to_file(experiment, "l1", distances, times)
+
+    path = tmp_path / "experiments" / experiment.experiment_id / "distances" / "l1.csv"
+    assert read_csv(path) == [
+        ["instance_id_1", "instance_id_2", "distance", "time"],
+        ["inst_a", "inst_b", "5.0", "0.25"],
+        ["inst_a", "inst_c", "1.5", ""],
+    ]
+
+
+def test_append_distances_to_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    experiment = DummyExperiment()
+    distances = {"inst_a": {"inst_b": 5, "inst_c": 2}}
+    times = {"inst_a": {"inst_b": 0.25, "inst_c": 0.5}}
+
+    exports.append_distances_to_file(
+        experiment, "l1", distances, times, ids=[("inst_a", "inst_b")]
+    )
+    exports.append_distances_to_file(
+        experiment, "l1", distances, times, ids=[("inst_a", "inst_c")]
     )
 
-    path = (
-        tmp_path
-        / "experiments"
-        / experiment.experiment_id
-        / "distances"
-        / f"{experiment.distance_id}_p3.csv"
+    path = tmp_path / "experiments" / experiment.experiment_id / "distances" / "l1.csv"
+    assert read_csv(path) == [
+        ["instance_id_1", "instance_id_2", "distance", "time"],
+        ["inst_a", "inst_b", "5", "0.25"],
+        ["inst_a", "inst_c", "2", "0.5"],
+    ]
+
+
+def test_append_distances_to_file_converts_npy_distances(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    experiment = DummyExperiment()
+    stored = DistanceMatrix.from_dict({"inst_a": {"inst_b": 5.0}})
+    stored_times = DistanceMatrix.from_dict({"inst_a": {"inst_b": 0.25}})
+    exports.export_distances_to_npy(experiment, "l1", stored, stored_times)
+
+    distances = {"inst_a": {"inst_c": 2}}
+    times = {"inst_a": {"inst_c": 0.5}}
+    exports.append_distances_to_file(
+        experiment, "l1", distances, times, ids=[("inst_a", "inst_c")]
     )
-    rows = read_csv(path)
-    assert rows == [
+
+    assert not imports.has_npy_distances(experiment.experiment_id, "l1")
+    path = tmp_path / "experiments" / experiment.experiment_id / "distances" / "l1.csv"
+    assert read_csv(path) == [
         ["instance_id_1", "instance_id_2", "distance", "time"],
-        ["inst_a", "inst_b", "1.5", "0.5"],
+        ["inst_a", "inst_b", "5.0", "0.25"],
+        ["inst_a", "inst_c", "2", "0.5"],
     ]
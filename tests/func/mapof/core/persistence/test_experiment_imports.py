@@ -0,0 +1,367 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from mapof.core.embedding.embed import embed
+from mapof.core.objects import Experiment as experiment_module
+from mapof.core.objects.DistanceMatrix import DistanceMatrix
+from mapof.core.objects.Experiment import Experiment
+from mapof.core.objects.MatchingStore import MatchingStore
+from mapof.core.persistence import experiment_exports as exports
+from mapof.core.persistence import experiment_imports as imports
+from mapof.core.persistence.distance_cache import DistanceCache
+
+
+class DummyExperiment:
+    def __init__(self):
+        self.experiment_id = "exp_alpha"
+
+
+class PointsExperiment(Experiment):
+    """Experiment over fixed points, with the L1 distance and rank matchings."""
+
+    def __init__(self, points, **kwargs):
+        self.points = {
+            instance_id: np.array(values) for instance_id, values in points.items()
+        }
+        super().__init__(experiment_id="exp_alpha", distance_id="l1", **kwargs)
+
+    def get_distance(self, values_1, values_2, distance_id=None, **kwargs):
+        matching = np.empty(len(values_1), dtype=int)
+        matching[np.argsort(values_1)] = np.argsort(values_2)
+        return float(np.abs(values_1 - values_2).sum()), matching
+
+    def add_instances_to_experiment(self):
+        return dict(self.points)
+
+    def add_folders_to_experiment(self):
+        pass
+
+    def import_controllers(self):
+        return {}
+
+    def prepare_instances(self):
+        pass
+
+    def add_instance(self):
+        pass
+
+    def add_family(self):
+        pass
+
+    def add_culture(self, name, function):
+        pass
+
+    def add_distance(self, name, function):
+        pass
+
+    def add_feature(self, name, function):
+        pass
+
+
+def make_distances():
+    distances = DistanceMatrix.from_dict(
+        {"inst_a": {"inst_b": 5.0, "inst_c": 1.5}, "inst_b": {"inst_c": 2.0}}
+    )
+    times = DistanceMatrix.from_dict({"inst_a": {"inst_b": 0.25}})
+    return distances, times
+
+
+def test_import_distances_from_npy_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    distances, times = make_distances()
+    exports.export_distances_to_npy(DummyExperiment(), "l1", distances, times)
+
+    assert imports.has_npy_distances("exp_alpha", "l1")
+    imported, imported_times, imported_stds = imports.import_distances_from_npy(
+        "exp_alpha", "l1", ["inst_a", "inst_b", "inst_c"]
+    )
+
+    np.testing.assert_array_equal(imported.matrix, distances.matrix)
+    assert imported_times["inst_a"]["inst_b"] == 0.25
+    assert "inst_c" not in imported_times["inst_a"]
+    assert len(imported_stds) == 3
+    assert len(imported_stds["inst_a"]) == 0
+
+
+def test_import_distances_from_npy_memory_mapped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    distances, times = make_distances()
+    exports.export_distances_to_npy(DummyExperiment(), "l1", distances, times)
+
+    imported, _, _ = imports.import_distances_from_npy(
+        "exp_alpha", "l1", ["inst_a", "inst_b", "inst_c"], mmap_mode="r"
+    )
+
+    assert isinstance(imported.matrix, np.memmap)
+    assert imported["inst_b"]["inst_c"] == 2.0
+
+
+def test_import_distances_from_npy_subset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    distances, times = make_distances()
+    exports.export_distances_to_npy(DummyExperiment(), "l1", distances, times)
+
+    imported, _, _ = imports.import_distances_from_npy(
+        "exp_alpha", "l1", ["inst_c", "inst_a", "inst_z"], mmap_mode="r"
+    )
+
+    assert imported.ids == ["inst_c", "inst_a"]
+    assert imported["inst_c"]["inst_a"] == 1.5
+
+
+def test_add_distances_to_experiment_prefers_npy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    experiment = DummyExperiment()
+    distances, times = make_distances()
+    exports.export_distances_to_file(experiment, "l1", distances, times)
+    distances.set_value("inst_a", "inst_b", 7.0)
+    exports.export_distances_to_npy(experiment, "l1", distances, times)
+
+    imported, _, _, _ = imports.add_distances_to_experiment(
+        "exp_alpha", "l1", ["inst_a", "inst_b", "inst_c"]
+    )
+
+    assert imported["inst_a"]["inst_b"] == 7.0
+
+
+def test_add_distances_to_experiment_reads_legacy_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    experiment = DummyExperiment()
+    distances, times = make_distances()
+    exports.export_distances_to_npy(experiment, "l1", distances, times)
+    exports.export_distances_to_file(experiment, "l1", distances, times)
+
+    assert not imports.has_npy_distances("exp_alpha", "l1")
+    imported, imported_times, _, _ = imports.add_distances_to_experiment(
+        "exp_alpha", "l1", ["inst_a", "inst_b", "inst_c"]
+    )
+
+    assert imported["inst_a"]["inst_c"] == 1.5
+    assert imported_times["inst_a"]["inst_b"] == 0.25
+
+
+def test_import_distances_from_npy_memory_mapped_in_other_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    distances, times = make_distances()
+    exports.export_distances_to_npy(DummyExperiment(), "l1", distances, times)
+
+    imported, _, _ = imports.import_distances_from_npy(
+        "exp_alpha", "l1", ["inst_c", "inst_b", "inst_a"], mmap_mode="r"
+    )
+
+    assert isinstance(imported.matrix, np.memmap)
+    assert imported["inst_c"]["inst_a"] == 1.5
+
+
+def test_import_matchings_from_npy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    matchings = MatchingStore(["inst_a", "inst_b", "inst_c"])
+    matchings.set_matching("inst_a", "inst_c", [1, 2, 0])
+    exports.export_matchings_to_npy(DummyExperiment(), "l1", matchings)
+
+    imported = imports.import_matchings_from_npy(
+        "exp_alpha", "l1", ["inst_c", "inst_a"]
+    )
+
+    assert list(imported["inst_a"]["inst_c"]) == [1, 2, 0]
+    assert list(imported["inst_c"]["inst_a"]) == [2, 0, 1]
+
+
+def test_import_matchings_of_mixed_lengths_from_npy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    matchings = MatchingStore(["inst_a", "inst_b", "inst_c"])
+    matchings.set_matching("inst_a", "inst_c", [1, 2, 0])
+    matchings.set_matching("inst_b", "inst_a", [1, 0])
+    matchings.set_matching("inst_c", "inst_b", [3, 0, 2, 1])
+    exports.export_matchings_to_npy(DummyExperiment(), "l1", matchings)
+
+    imported = imports.import_matchings_from_npy("exp_alpha", "l1")
+
+    assert list(imported["inst_a"]["inst_c"]) == [1, 2, 0]
+    assert list(imported["inst_b"]["inst_a"]) == [1, 0]
+    assert list(imported["inst_c"]["inst_b"]) == [3, 0, 2, 1]
+
+
+def test_legacy_csv_conversion_keeps_matchings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "experiments" / "exp_alpha" / "distances"
+    os.makedirs(path)
+    with open(path / "l1.csv", "w", newline="") as csv_file:
+        writer = csv.writer(csv_file, delimiter=";")
+        writer.writerow(["instance_id_1", "instance_id_2", "distance", "mapping"])
+        writer.writerow(["A", "B", 2.0, "[1, 2, 0]"])
+        writer.writerow(["A", "C", 3.0, "[0, 1, 2]"])
+    points = {"A": [0, 1, 2], "B": [1, 2, 0], "C": [0, 1, 3]}
+
+    PointsExperiment(points)
+
+    assert imports.has_npy_distances("exp_alpha", "l1")
+    assert not os.path.exists(path / "l1_ids.json.tmp")
+    matchings = imports.import_matchings_from_npy("exp_alpha", "l1", list(points))
+    assert list(matchings["A"]["B"]) == [1, 2, 0]
+    assert list(matchings["B"]["A"]) == [2, 0, 1]
+    assert not matchings.has_matching("B", "C")
+
+
+def test_incremental_compute_keeps_imported_matchings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    points = {f"p{i}": rng.permutation(4) for i in range(6)}
+    first = {instance_id: points[instance_id] for instance_id in ["p0", "p1", "p2"]}
+    PointsExperiment(first).compute_distances(distance_id="l1")
+
+    experiment = PointsExperiment(points)
+    assert experiment.matchings.has_matching("p0", "p1")
+    experiment.compute_distances(distance_id="l1", recompute=False)
+
+    experiment = PointsExperiment(points)
+    ids = list(points)
+    for i, instance_id_1 in enumerate(ids):
+        for instance_id_2 in ids[i + 1 :]:
+            _, expected = experiment.get_distance(
+                points[instance_id_1], points[instance_id_2]
+            )
+            assert list(experiment.matchings[instance_id_1][instance_id_2]) == list(
+                expected
+            )
+
+
+def test_incremental_export_merges_stored_matchings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stored = MatchingStore(["inst_a", "inst_b", "inst_c"])
+    stored.set_matching("inst_a", "inst_b", [1, 0])
+    stored.set_matching("inst_b", "inst_c", [0, 1])
+    exports.export_matchings_to_npy(DummyExperiment(), "l1", stored)
+
+    matchings = MatchingStore(["inst_a", "inst_c"])
+    matchings.set_matching("inst_c", "inst_a", [1, 0])
+    exports.export_matchings_to_npy(DummyExperiment(), "l1", matchings, merge=True)
+
+    imported = imports.import_matchings_from_npy("exp_alpha", "l1")
+    assert sorted(imported.ids) == ["inst_a", "inst_b", "inst_c"]
+    assert list(imported["inst_b"]["inst_a"]) == [1, 0]
+    assert list(imported["inst_b"]["inst_c"]) == [0, 1]
+    assert list(imported["inst_a"]["inst_c"]) == [1, 0]
+
+
+def test_landmark_mode_does_not_store_approximations(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(1)
+    points = {f"p{i}": rng.permutation(5) for i in range(12)}
+    first = {instance_id: points[instance_id] for instance_id in ["p0", "p1", "p2"]}
+    PointsExperiment(first).compute_distances(distance_id="l1")
+
+    experiment = PointsExperiment(points)
+    stored = experiment.distances.matrix.copy()
+    stats = experiment.compute_distances(
+        distance_id="l1", recompute=False, num_pivots=3, num_check_pairs=5
+    )
+
+    assert stats["num_evaluated"] < stats["pairs"]
+    np.testing.assert_array_equal(experiment.distances.matrix, stored)
+    imported, _, _ = imports.import_distances_from_npy("exp_alpha", "l1", list(points))
+    assert np.isnan(imported.matrix).sum() == np.isnan(stored).sum()
+
+    landmarks = experiment.landmark_distances
+    pivot = landmarks.ids[landmarks.pivots[0]]
+    for instance_id in points:
+        assert landmarks.is_exact(pivot, instance_id)
+        expected, _ = experiment.get_distance(points[pivot], points[instance_id])
+        assert landmarks.get_value(pivot, instance_id) == expected
+    assert not all(
+        landmarks.is_exact(instance_id_1, instance_id_2)
+        for instance_id_1 in points
+        for instance_id_2 in points
+    )
+    assert landmarks.to_array().shape == (12, 12)
+
+
+def test_compute_distances_closes_default_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    opened = []
+
+    class RecordingCache(DistanceCache):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.closed = False
+            opened.append(self)
+
+        def close(self):
+            super().close()
+            self.closed = True
+
+    monkeypatch.setattr(experiment_module, "DistanceCache", RecordingCache)
+    points = {"p0": [0, 1, 2], "p1": [2, 1, 0], "p2": [1, 0, 2]}
+    experiment = PointsExperiment(points)
+    experiment.compute_distances(distance_id="l1", cache=True)
+
+    assert len(opened) == 1 and opened[0].closed
+
+    with DistanceCache() as cache:
+        PointsExperiment(points).compute_distances(distance_id="l1", cache=cache)
+        assert cache.num_hits == 3
+        assert len(cache) == 3
+
+
+def test_landmark_mode_for_another_distance_can_be_embedded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(2)
+    points = {f"p{i}": rng.permutation(5) for i in range(10)}
+    experiment = PointsExperiment(points)
+    experiment.compute_distances(distance_id="l1")
+
+    experiment.compute_distances(distance_id="other", num_pivots=4, num_check_pairs=5)
+
+    assert isinstance(experiment.distances, DistanceMatrix)
+    assert experiment.distances.ids == list(points)
+    assert np.isnan(experiment.distances.matrix).all()
+    with pytest.raises(ValueError, match="landmark"):
+        embed(experiment, embedding_id="mds")
+
+    embed(experiment, embedding_id="landmark", dim=2)
+
+    assert sorted(experiment.coordinates) == sorted(points)
+
+
+def test_lazy_import_can_be_updated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(3)
+    points = {f"p{i}": rng.permutation(4) for i in range(5)}
+    PointsExperiment(points).compute_distances(distance_id="l1")
+    path = tmp_path / "experiments" / "exp_alpha" / "distances" / "l1.npy"
+    stored = np.load(path)
+
+    experiment = PointsExperiment(points, lazy_distances=True)
+
+    assert isinstance(experiment.distances.matrix, np.memmap)
+    assert isinstance(experiment.matchings.matchings, np.memmap)
+    assert isinstance(experiment.matchings.present, np.memmap)
+    experiment.distances.set_value("p0", "p1", 123.0)
+    experiment.matchings.set_matching("p0", "p1", [3, 2, 1, 0])
+    assert experiment.distances["p0"]["p1"] == 123.0
+    assert list(experiment.matchings["p0"]["p1"]) == [3, 2, 1, 0]
+    # Copy-on-write: the files are not modified
+    np.testing.assert_array_equal(np.load(path), stored)
+    imported = imports.import_matchings_from_npy("exp_alpha", "l1")
+    assert list(imported["p0"]["p1"]) != [3, 2, 1, 0]
+
+
+def test_import_matchings_from_legacy_npz(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "experiments" / "exp_alpha" / "distances"
+    path.mkdir(parents=True)
+    matchings = MatchingStore(["inst_a", "inst_b"])
+    matchings.set_matching("inst_b", "inst_a", [1, 2, 0])
+    np.savez(
+        path / "l1_matchings.npz",
+        ids=np.array(matchings.ids, dtype=str),
+        present=matchings.present,
+        matchings=matchings.matchings,
+    )
+
+    imported = imports.import_matchings_from_npy("exp_alpha", "l1")
+
+    assert list(imported["inst_b"]["inst_a"]) == [1, 2, 0]